@@ -0,0 +1,153 @@
+"""Benchmark de motores de churn sobre movimientos sintéticos.
+
+Compara el loop original por contacto (cargando objetos ORM), el rollup
+reconstruido + clasificación y el motor vectorizado, verificando que las filas
+coincidan. También mide `simulate_distributions` con 50 juegos de variables
+contra una lectura del rollup, y que su distribución coincida con la de
+clasificar fila por fila.
+
+Uso (desde backend/):
+    python benchmarks/bench_churn.py              # 10k, 100k y 1M movimientos
+    python benchmarks/bench_churn.py 10000 50000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.mkdtemp(prefix="pietro-bench-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import delete, insert  # noqa: E402
+
+from churn_vectorized import CLASES, compute_churn_rows, load_rollup_columns, simulate_distributions  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import ContactRollup, ControlFrequency, ControlVariables, Movement, normalize_contact  # noqa: E402
+from schemas import ControlVariablesBase  # noqa: E402
+from contacts import backfill_contact_keys  # noqa: E402
+from rollups import display_contact, rebuild_contact_rollups  # noqa: E402
+from routers.churn import classify_contact, seed_frequencies_if_needed  # noqa: E402
+
+SIZES = [10_000, 100_000, 1_000_000]
+SIMULATION_CANDIDATES = [
+    ControlVariablesBase(coeficiente_regular=coef, dias_nuevos=dias, pedidos_vip=vip)
+    for coef in (1.0, 1.5, 2.0, 3.0, 5.0)
+    for dias in (7, 30)
+    for vip in (3, 5, 8, 12, 20)
+]
+
+
+def seed(db, n: int, seed_value: int = 42):
+    rnd = random.Random(seed_value)
+    db.execute(delete(Movement))
+    contactos = [f"cliente {i}" for i in range(max(n // 20, 1))]
+    today = datetime.utcnow()
+    batch = []
+    for _ in range(n):
+        batch.append({
+            "date": today - timedelta(days=rnd.randint(0, 720), minutes=rnd.randint(0, 1440)),
+            "type": "Venta",
+            "contact": rnd.choice(contactos),
+            "value": round(rnd.uniform(500, 60000), 2),
+        })
+        if len(batch) == 50_000:
+            db.execute(insert(Movement), batch)
+            batch = []
+    if batch:
+        db.execute(insert(Movement), batch)
+    db.commit()
+    backfill_contact_keys(db)
+
+
+def legacy_loop(db, ctrl, freqs, today):
+    # Agrupa objetos ORM en Python, como hacía calculate_churn originalmente
+    per_contact = defaultdict(list)
+    for m in db.query(Movement).order_by(Movement.id).all():
+        per_contact[normalize_contact(m.contact)].append(m)
+    names = {key: min(display_contact(m.contact) for m in items) for key, items in per_contact.items()}
+    rows = []
+    for key in sorted(per_contact, key=lambda k: (names[k], k)):
+        items = sorted(per_contact[key], key=lambda x: x.date)
+        dates = [i.date.date() for i in items]
+        total = float(sum(i.value or 0 for i in items))
+        rows.append(classify_contact(names[key], dates[0], dates[-1], len(dates), total, ctrl, freqs, today))
+    return rows
+
+
+def rollup_read(db, ctrl, freqs, today):
+    return [
+        classify_contact(r.contact, r.first_order.date(), r.last_order.date(), r.order_count, float(r.total_value), ctrl, freqs, today)
+        for r in db.query(ContactRollup).order_by(ContactRollup.contact, ContactRollup.contact_key)
+    ]
+
+
+def rollup_path(db, ctrl, freqs, today):
+    rebuild_contact_rollups(db)
+    return rollup_read(db, ctrl, freqs, today)
+
+
+def simulate(db, candidates, today):
+    return simulate_distributions(*load_rollup_columns(db), candidates, today)
+
+
+def same_distribution(db, freqs, today, candidate, result) -> bool:
+    counts = Counter(r.clasificacion for r in rollup_read(db, candidate, freqs, today))
+    return result["distribucion"] == {c: counts.get(c, 0) for c in CLASES}
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def same_rows(a, b) -> bool:
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        dx, dy = x.model_dump(), y.model_dump()
+        for k in dx:
+            if isinstance(dx[k], float):
+                if abs(dx[k] - dy[k]) > 1e-6 * max(1.0, abs(dx[k])):
+                    return False
+            elif dx[k] != dy[k]:
+                return False
+    return True
+
+
+def main(sizes):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(ControlVariables())
+    db.commit()
+    seed_frequencies_if_needed(db)
+    ctrl = db.query(ControlVariables).first()
+    freqs = db.query(ControlFrequency).order_by(ControlFrequency.frecuencia).all()
+    today = datetime.utcnow().date()
+
+    print(f"{'movimientos':>12} {'contactos':>10} {'loop ORM':>10} {'rollup':>10} {'rollup lect.':>12} {'vector':>10} {'simular x50':>12} {'iguales':>8}")
+    for n in sizes:
+        seed(db, n)
+        legacy, t_legacy = timed(legacy_loop, db, ctrl, freqs, today)
+        rolled, t_rollup = timed(rollup_path, db, ctrl, freqs, today)
+        _, t_read = timed(rollup_read, db, ctrl, freqs, today)
+        vector, t_vector = timed(compute_churn_rows, db, ctrl, freqs, today)
+        simulated, t_simulate = timed(simulate, db, SIMULATION_CANDIDATES, today)
+        # El vectorizado suma en el mismo orden que el loop: debe ser exacto
+        exact = [r.model_dump() for r in legacy] == [r.model_dump() for r in vector]
+        ok = exact and same_rows(legacy, rolled) and all(
+            same_distribution(db, freqs, today, SIMULATION_CANDIDATES[i], simulated[i]) for i in (0, 17, 49)
+        )
+        print(
+            f"{n:>12,} {len(vector):>10,} {t_legacy:>9.3f}s {t_rollup:>9.3f}s {t_read:>11.3f}s {t_vector:>9.3f}s "
+            f"{t_simulate:>11.3f}s {str(ok):>8}"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
@@ -0,0 +1,156 @@
+"""Benchmark de lecturas concurrentes durante una importación masiva.
+
+Para cada perfil de base (`DB_PROFILE=basic`: journal por defecto de SQLite;
+`tuned`: WAL + pragmas, ver database.py) arma una base con movimientos, mide
+las lecturas por segundo de varios hilos (resumen del dashboard, página de
+movimientos y serie mensual) sin carga y mientras otro proceso importa un CSV,
+y reporta latencias y errores ("database is locked").
+
+Uso (desde backend/):
+    python benchmarks/bench_concurrency.py                 # 100k base, 50k importadas, 4 hilos
+    python benchmarks/bench_concurrency.py 20000 20000 8
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROFILES = ["basic", "tuned"]
+DEFAULTS = [100_000, 50_000, 4]
+IDLE_SECONDS = 3.0
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _read_loop(stop: threading.Event, latencies: list, errors: list):
+    from sqlalchemy import select
+
+    from dashboard import dashboard_summary
+    from database import ReadSessionLocal
+    from models import ControlVariables, Movement
+    from rollups import revenue_series
+
+    hasta = datetime.utcnow()
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with ReadSessionLocal() as db:
+                kind = i % 3
+                if kind == 0:
+                    dashboard_summary(db, db.query(ControlVariables).first(), 30)
+                elif kind == 1:
+                    db.execute(select(Movement).order_by(Movement.date.desc(), Movement.id.desc()).limit(100)).all()
+                else:
+                    revenue_series(db, "month", hasta - timedelta(days=365), hasta, None, {})
+            latencies.append(time.perf_counter() - start)
+        except Exception as exc:  # noqa: BLE001 - se cuentan, no cortan el benchmark
+            errors.append(type(exc).__name__)
+        i += 1
+
+
+def _measure(threads: int, until) -> dict:
+    stop = threading.Event()
+    latencies, errors = [], []
+    workers = [threading.Thread(target=_read_loop, args=(stop, latencies, errors)) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    until()
+    stop.set()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "reads_per_second": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 0.5) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "errors": len(errors),
+        "seconds": elapsed,
+    }
+
+
+def _import(path: str, result):
+    from database import SessionLocal
+    from import_movements import import_csv
+
+    db = SessionLocal()
+    try:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            report = import_csv(f, db)
+        result.value = report.rows_per_second
+    finally:
+        db.close()
+
+
+def run_profile(base_rows: int, import_rows: int, threads: int):
+    """Corre en un proceso propio: DB_PROFILE y DB_URL ya vienen en el entorno."""
+    from database import DB_URL, Base, SessionLocal, engine
+    from import_movements import import_csv
+    from migrations import run_migrations
+    from routers.churn import get_or_create_control_variables
+
+    # bench_import pisa DB_URL al importarse; se restaura para el proceso importador
+    from bench_import import write_csv
+    os.environ["DB_URL"] = DB_URL
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    tmpdir = Path(DB_URL.removeprefix("sqlite:///")).parent
+    base_csv, new_csv = tmpdir / "base.csv", tmpdir / "nuevos.csv"
+    write_csv(base_csv, base_rows, seed_value=1)
+    write_csv(new_csv, import_rows, seed_value=2)
+    with SessionLocal() as db, base_csv.open("r", encoding="utf-8-sig", newline="") as f:
+        import_csv(f, db)
+        get_or_create_control_variables(db)
+    with engine.connect() as conn:
+        journal = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+
+    idle = _measure(threads, lambda: time.sleep(IDLE_SECONDS))
+
+    # spawn: un fork con los hilos de lectura corriendo puede heredar locks tomados
+    ctx = multiprocessing.get_context("spawn")
+    rows_per_second = ctx.Value("d", 0.0)
+    importer = ctx.Process(target=_import, args=(str(new_csv), rows_per_second))
+    busy = _measure(threads, lambda: (importer.start(), importer.join()))
+
+    print(
+        f"{os.environ['DB_PROFILE']:>7} {journal:>8} "
+        f"{idle['reads_per_second']:>10,.0f} {idle['p95_ms']:>9.1f} "
+        f"{busy['reads_per_second']:>10,.0f} {busy['p50_ms']:>9.1f} {busy['p95_ms']:>9.1f} "
+        f"{busy['errors']:>7} {rows_per_second.value:>10,.0f}",
+        flush=True,
+    )
+
+
+def main(base_rows: int, import_rows: int, threads: int):
+    print(f"base {base_rows:,} movimientos, importa {import_rows:,}, {threads} hilos de lectura")
+    print(
+        f"{'perfil':>7} {'journal':>8} {'lect/s':>10} {'p95 ms':>9} "
+        f"{'lect/s imp':>10} {'p50 ms':>9} {'p95 ms':>9} {'errores':>7} {'filas/s':>10}"
+    )
+    for profile in PROFILES:
+        tmpdir = tempfile.mkdtemp(prefix="pietro-bench-")
+        env = dict(
+            os.environ,
+            DB_PROFILE=profile,
+            DB_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+            PYTHONPATH=os.pathsep.join([str(Path(__file__).resolve().parent.parent), str(Path(__file__).resolve().parent)]),
+        )
+        code = f"import bench_concurrency as b; b.run_profile({base_rows}, {import_rows}, {threads})"
+        subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + DEFAULTS[len(args):]))
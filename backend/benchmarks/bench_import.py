@@ -0,0 +1,73 @@
+"""Benchmark del importador de movimientos (filas por segundo).
+
+Genera un CSV sintético con el formato del registro de clientes, lo importa
+sobre una base vacía y lo vuelve a importar (todo duplicado) para medir el
+costo de la deduplicación.
+
+Uso (desde backend/):
+    python benchmarks/bench_import.py              # 10k y 100k filas
+    python benchmarks/bench_import.py 50000
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+_tmpdir = tempfile.mkdtemp(prefix="pietro-bench-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import delete  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from import_movements import import_csv  # noqa: E402
+from models import ContactRollup, Movement  # noqa: E402
+
+SIZES = [10_000, 100_000]
+HEADER = ["Fecha", "Tipo", "Vendedor", "Descripción", "Categoria de Gasto", "Contacto", "Estado", "M. de Pago", "Valor"]
+
+
+def write_csv(path: Path, n: int, seed_value: int = 7):
+    rnd = random.Random(seed_value)
+    start = datetime(2024, 1, 1)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        for i in range(n):
+            fecha = (start + timedelta(days=rnd.randint(0, 700))).strftime("%d/%m/%Y")
+            valor = f" ${rnd.randint(500, 90000):,}".replace(",", ".") + f",{rnd.randint(0, 99):02d}"
+            w.writerow([
+                fecha, "Venta", f"vendedor {i % 5}", f"pedido {i}", "No Aplica",
+                f"cliente {rnd.randint(0, n // 10)}", "Pagada", "Efectivo", valor,
+            ])
+
+
+def run(path: Path):
+    db = SessionLocal()
+    try:
+        with path.open("r", encoding="utf-8-sig", newline="") as f:
+            return import_csv(f, db)
+    finally:
+        db.close()
+
+
+def main(sizes):
+    Base.metadata.create_all(bind=engine)
+    print(f"{'filas':>10} {'insertadas':>11} {'filas/s':>10} {'re-import dup.':>15} {'filas/s':>10}")
+    for n in sizes:
+        with SessionLocal() as db:
+            db.execute(delete(Movement))
+            db.execute(delete(ContactRollup))
+            db.commit()
+        path = Path(_tmpdir) / f"movimientos_{n}.csv"
+        write_csv(path, n)
+        first = run(path)
+        again = run(path)
+        print(f"{n:>10,} {first.inserted:>11,} {first.rows_per_second:>10,.0f} {again.duplicates:>15,} {again.rows_per_second:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
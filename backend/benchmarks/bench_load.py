@@ -0,0 +1,216 @@
+"""Prueba de carga de la API a través de la app ASGI (sin red ni uvicorn).
+
+Genera una base sintética con `datagen.py` (o usa `--db`), y para cada
+escenario manda requests concurrentes y mide latencia p50/p95/p99, throughput
+y errores. Al final corre la mezcla de todos los escenarios a la vez. El
+resultado (con commit, perfil de base y RSS pico del proceso) se guarda en
+JSON para comparar corridas.
+
+Uso (desde backend/):
+    python benchmarks/bench_load.py --movements 100000
+    python benchmarks/bench_load.py --movements 1000000 --concurrency 32 --requests 500 --cold
+    python benchmarks/bench_load.py --db sqlite:////tmp/carga.db --out /tmp/resultado.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Nombre -> (método, ruta, usa token, peso en la mezcla)
+SCENARIOS = {
+    "login": ("POST", "/login", False, 1),
+    "stats": ("GET", "/stats", True, 2),
+    "churn": ("GET", "/churn/", True, 1),
+    "movimientos": ("GET", "/movimientos/", True, 4),
+    "clientes_filtrar": ("GET", "/clientes/filtrar", True, 4),
+}
+SEARCH_TERMS = ["ana", "pérez", "gomez", "lucía", "carla 00", "+54911000", "zona norte", "fer"]
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss: KB en Linux, bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _request_args(name: str, rnd: random.Random, state: dict):
+    method, path, _, _ = SCENARIOS[name]
+    if name == "login":
+        return method, path, {"json": {"username": state["username"], "password": state["password"]}}
+    if name == "movimientos":
+        # Primera página del listado o la siguiente a la última vista, como la UI
+        params = {"limit": 100}
+        if state.get("cursor") and rnd.random() < 0.5:
+            params["cursor"] = state["cursor"]
+        return method, path, {"params": params}
+    if name == "clientes_filtrar":
+        return method, path, {"params": {"q": rnd.choice(SEARCH_TERMS), "limit": 50}}
+    return method, path, {}
+
+
+async def run_scenario(client, names, requests: int, concurrency: int, state: dict, seed: int) -> dict:
+    rnd = random.Random(seed)
+    weights = [SCENARIOS[n][3] for n in names]
+    plan = rnd.choices(names, weights=weights, k=requests)
+    latencies = {n: [] for n in names}
+    errors = {n: 0 for n in names}
+    queue = iter(plan)
+
+    async def worker():
+        for name in queue:
+            method, path, kwargs = _request_args(name, rnd, state)
+            headers = {"Authorization": f"Bearer {state['token']}"} if SCENARIOS[name][2] else {}
+            start = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **kwargs)
+            latencies[name].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[name] += 1
+            elif name == "movimientos" and "x-next-cursor" in response.headers:
+                state["cursor"] = response.headers["x-next-cursor"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    def summary(values, errs):
+        values = sorted(values)
+        return {
+            "requests": len(values),
+            "errors": errs,
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        }
+
+    everything = [v for n in names for v in latencies[n]]
+    result = summary(everything, sum(errors.values()))
+    result["seconds"] = round(elapsed, 3)
+    result["throughput_rps"] = round(len(everything) / elapsed, 1) if elapsed else 0.0
+    if len(names) > 1:
+        result["by_endpoint"] = {n: summary(latencies[n], errors[n]) for n in names}
+    return result
+
+
+async def run(args, dataset: dict) -> dict:
+    import httpx
+
+    from main import app
+    from users import ADMIN_PASSWORD, ADMIN_USER
+
+    state = {"username": ADMIN_USER, "password": ADMIN_PASSWORD}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        login = await client.post("/login", json={"username": ADMIN_USER, "password": ADMIN_PASSWORD})
+        login.raise_for_status()
+        state["token"] = login.json()["access_token"]
+
+        scenarios = {}
+        names = args.scenarios or list(SCENARIOS)
+        for i, name in enumerate(names):
+            # Un request de calentamiento (caches de SQLite, imports perezosos)
+            await run_scenario(client, [name], 1, 1, state, args.seed)
+            scenarios[name] = await run_scenario(client, [name], args.requests, args.concurrency, state, args.seed + i)
+            s = scenarios[name]
+            print(
+                f"{name:>18} {s['throughput_rps']:>9.1f} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['errors']:>7}",
+                flush=True,
+            )
+        mixed = await run_scenario(client, names, args.requests * len(names), args.concurrency, state, args.seed + 100)
+        print(
+            f"{'mezcla':>18} {mixed['throughput_rps']:>9.1f} {mixed['p50_ms']:>9.1f} {mixed['p95_ms']:>9.1f} {mixed['p99_ms']:>9.1f} {mixed['errors']:>7}",
+            flush=True,
+        )
+
+    from database import DB_ASYNC, DB_PROFILE
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "db_profile": DB_PROFILE,
+            "db_async": DB_ASYNC,
+            "result_cache": not args.cold,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "seed": args.seed,
+        },
+        "dataset": dataset,
+        "scenarios": scenarios,
+        "mixed": mixed,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movements", type=int, default=100_000, help="tamaño de la base a generar")
+    parser.add_argument("--db", help="usar una base existente (DB_URL) en vez de generar una")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests por escenario")
+    parser.add_argument("--scenarios", nargs="*", choices=list(SCENARIOS))
+    parser.add_argument("--cold", action="store_true", help="sin caché de resultados (/stats y /churn/ recalculan)")
+    parser.add_argument("--out", help="archivo JSON de salida (por defecto benchmarks/results/<fecha>.json)")
+    args = parser.parse_args()
+
+    # Todo lo que lee el entorno al importarse va antes de importar la app
+    os.environ["DB_URL"] = args.db or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pietro-bench-'), 'bench.db')}"
+    os.environ.setdefault("BROADCAST_SCHEDULER_ENABLED", "0")
+    if args.cold:
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+    sys.path.insert(0, str(BACKEND_DIR))
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+    import datagen
+
+    datagen.prepare_database()
+    if args.db:
+        dataset = {"db_url": args.db}
+    else:
+        from database import SessionLocal
+
+        with SessionLocal() as db:
+            dataset = datagen.generate(db, args.movements, args.seed)
+        print(f"datos: {dataset}")
+
+    print(f"{'escenario':>18} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>7}")
+    result = asyncio.run(run(args, dataset))
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"RSS pico {result['peak_rss_mb']} MB -> {out}")
+
+
+if __name__ == "__main__":
+    main()
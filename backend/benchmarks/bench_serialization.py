@@ -0,0 +1,156 @@
+"""Benchmark de serialización de listados grandes: normal vs `?fast=1`.
+
+Para `/clientes/`, `/movimientos/` y `/churn/` mide, con N filas, el tiempo de
+consulta, el de codificación y la memoria pico (tracemalloc) de los dos
+caminos: objetos ORM / modelos validados por `response_model` de FastAPI (el
+mismo `serialize_response` + `JSONResponse` que usa la app) contra columnas
+como tuplas codificadas directo (fast_json.py). Verifica que los bytes sean
+idénticos.
+
+Uso (desde backend/):
+    python benchmarks/bench_serialization.py            # 100k filas
+    python benchmarks/bench_serialization.py 20000 100000
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pietro-bench-'), 'bench.db')}"
+os.environ.setdefault("BROADCAST_SCHEDULER_ENABLED", "0")
+os.environ.setdefault("METRICS_ENABLED", "0")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from sqlalchemy import delete, select  # noqa: E402
+
+import datagen  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from fast_json import ORJSON, dumps, rows_json  # noqa: E402
+from main import app  # noqa: E402
+from models import Client, ContactRollup, ControlFrequency, Movement  # noqa: E402
+from routers import clients, movements  # noqa: E402
+from routers.churn import _churn_rows, classify_contact, classify_contact_row, get_or_create_control_variables  # noqa: E402
+
+SIZES = [100_000]
+
+
+def _response_field(path: str):
+    for route in app.routes:
+        if getattr(route, "path", None) == path and "GET" in route.methods:
+            return route.secure_cloned_response_field
+    raise LookupError(path)
+
+
+def fastapi_encode(field, items) -> bytes:
+    # Lo que hace FastAPI con response_model: validar/serializar y después json.dumps
+    content = asyncio.run(serialize_response(field=field, response_content=items, is_coroutine=True))
+    return JSONResponse(content).body
+
+
+def measure(db, query, encode):
+    """(segundos de consulta, segundos de codificación, MB pico, bytes).
+
+    Los tiempos se toman en una pasada sin tracemalloc (que los infla) y la
+    memoria pico en otra.
+    """
+    db.expunge_all()
+    start = time.perf_counter()
+    rows = query()
+    queried = time.perf_counter()
+    body = encode(rows)
+    encoded = time.perf_counter()
+    del rows
+    db.expunge_all()
+    tracemalloc.start()
+    encode(query())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return queried - start, encoded - queried, peak / (1024 * 1024), body
+
+
+def top_up_clients(db, n: int):
+    """Lleva `clients` a n filas (datagen carga un cliente cada ~10 movimientos)."""
+    db.execute(delete(Client))
+    # Cada contacto es cliente con probabilidad 0.8: con margen y después se recorta
+    datagen.generate_clients(db, np.random.default_rng(7), int(n / 0.8 * 1.05), datetime.utcnow())
+    last_id = db.execute(select(Client.id).order_by(Client.id).offset(n - 1).limit(1)).scalar_one()
+    db.execute(delete(Client).where(Client.id > last_id))
+    db.commit()
+
+
+def run(n: int):
+    with SessionLocal() as db:
+        db.execute(delete(Movement))
+        db.execute(delete(ContactRollup))
+        db.execute(delete(Client))
+        db.commit()
+        datagen.generate(db, n)
+        top_up_clients(db, n)
+
+        cases = {
+            "clientes": (
+                lambda: db.query(Client).order_by(Client.id.desc()).all(),
+                lambda items: fastapi_encode(_response_field("/clientes/"), items),
+                lambda: db.execute(select(*clients.FAST_SELECT).order_by(Client.id.desc())).all(),
+                lambda rows: rows_json(clients.FAST_COLUMNS, rows),
+            ),
+            "movimientos": (
+                lambda: db.query(Movement).order_by(Movement.date.desc(), Movement.id.desc()).all(),
+                lambda items: fastapi_encode(_response_field("/movimientos/"), items),
+                lambda: db.execute(select(*movements.FAST_SELECT).order_by(Movement.date.desc(), Movement.id.desc())).all(),
+                lambda rows: rows_json(movements.FAST_COLUMNS, rows, float_columns=["value"]),
+            ),
+        }
+        ctrl = get_or_create_control_variables(db)
+        freqs = db.query(ControlFrequency).order_by(ControlFrequency.frecuencia).all()
+        today = datetime.utcnow().date()
+        rollup = select(
+            ContactRollup.contact, ContactRollup.first_order, ContactRollup.last_order,
+            ContactRollup.order_count, ContactRollup.total_value,
+        ).order_by(ContactRollup.contact, ContactRollup.contact_key)
+
+        def classify(fn):
+            return [
+                fn(contact, first.date(), last.date(), count, float(total), ctrl, freqs, today)
+                for contact, first, last, count, total in db.execute(rollup)
+            ]
+
+        # En churn la "consulta" incluye clasificar: ahí se arman los modelos o los dicts
+        cases["churn"] = (
+            lambda: classify(classify_contact), _churn_rows.dump_json,
+            lambda: classify(classify_contact_row), dumps,
+        )
+
+        for name, (slow_query, slow_encode, fast_query, fast_encode) in cases.items():
+            q1, e1, m1, body1 = measure(db, slow_query, slow_encode)
+            q2, e2, m2, body2 = measure(db, fast_query, fast_encode)
+            rows = len(json.loads(body1))
+            print(
+                f"{name:>12} {rows:>9,} {len(body1) / 1e6:>6.1f} {q1:>8.3f}s {e1:>8.3f}s {m1:>8.1f} "
+                f"{q2:>8.3f}s {e2:>8.3f}s {m2:>8.1f} {(q1 + e1) / (q2 + e2):>7.1f}x {str(body1 == body2):>8}",
+                flush=True,
+            )
+
+
+def main(sizes):
+    datagen.prepare_database()
+    print(f"encoder rápido: {'orjson' if ORJSON else 'json (sin orjson)'}")
+    print(
+        f"{'listado':>12} {'filas':>9} {'MB':>6} {'consulta':>9} {'codif.':>9} {'MB pico':>8} "
+        f"{'consulta':>9} {'codif.':>9} {'MB pico':>8} {'mejora':>8} {'iguales':>8}"
+    )
+    print(f"{'':>29} {'--------- normal ---------':>28} {'---------- fast ----------':>28}")
+    for n in sizes:
+        run(n)
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
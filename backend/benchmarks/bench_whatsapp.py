@@ -0,0 +1,102 @@
+"""Benchmark de envíos de WhatsApp contra un servidor Graph falso local.
+
+Levanta un servidor HTTP en localhost que imita `/{phone_id}/messages` (con
+latencia y algunos 429) y mide mensajes por segundo del envío secuencial con un
+cliente por request (comportamiento anterior) contra `WhatsAppSender`.
+
+Uso (desde backend/):
+    python benchmarks/bench_whatsapp.py                 # 500 destinatarios
+    python benchmarks/bench_whatsapp.py 2000 --rate 200
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from whatsapp_client import WhatsAppSender, message_body  # noqa: E402
+
+LATENCY_SECONDS = 0.05
+THROTTLE_RATIO = 0.02
+
+fake_graph = FastAPI()
+
+
+@fake_graph.post("/{phone_id}/messages")
+async def fake_messages(phone_id: str, request: Request):
+    payload = await request.json()
+    await asyncio.sleep(LATENCY_SECONDS)
+    if random.random() < THROTTLE_RATIO:
+        return JSONResponse({"error": {"code": 130429}}, status_code=429, headers={"Retry-After": "0.1"})
+    return {"messages": [{"id": f"wamid.{payload['to']}"}]}
+
+
+def _serve(port: int):
+    uvicorn.run(fake_graph, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server() -> str:
+    # En otro proceso, para que el servidor no compita por el GIL con el cliente
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    multiprocessing.Process(target=_serve, args=(port,), daemon=True).start()
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/docs")
+            return base
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("No arrancó el servidor Graph falso")
+
+
+async def sequential(base: str, recipients):
+    # Un cliente por request y un POST por vez, como antes
+    results = []
+    async with httpx.AsyncClient(timeout=20) as client:
+        for to in recipients:
+            r = await client.post(f"{base}/PHONE/messages", json=message_body(to, "hola", None))
+            results.append(r.status_code < 400)
+    return results
+
+
+async def pooled(base: str, recipients, rate: float, concurrency: int):
+    sender = WhatsAppSender("token", "PHONE", graph_base=base, rate_per_sec=rate, concurrency=concurrency)
+    try:
+        return [r["ok"] for r in await sender.send_many(recipients, "hola")]
+    finally:
+        await sender.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recipients", nargs="?", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=80)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    base = start_server()
+    recipients = [f"54911{i:07d}" for i in range(args.recipients)]
+    for name, coro in (
+        ("secuencial", lambda: sequential(base, recipients)),
+        (f"pool (rate={args.rate:g}/s, conc={args.concurrency})", lambda: pooled(base, recipients, args.rate, args.concurrency)),
+    ):
+        t0 = time.perf_counter()
+        oks = asyncio.run(coro())
+        elapsed = time.perf_counter() - t0
+        print(f"{name:<36} {len(oks):>6} msgs {sum(oks):>6} ok {elapsed:>7.2f}s {len(oks) / elapsed:>8.1f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Generador reproducible de datos sintéticos para benchmarks.
+
+Llena `clients` (con tags), `movements`, `broadcasts` (con destinatarios) y las
+tablas de control, y reconstruye los rollups, así la base queda como la de un
+negocio real de esa escala. La misma semilla produce exactamente los mismos
+datos.
+
+La repetición de compras por contacto tiene cola pesada (lognormal): la mayoría
+compra una o dos veces y unos pocos concentran muchos pedidos. Cada contacto
+tiene una fecha de alta y una cadencia propia; si sus pedidos no alcanzan a
+cubrir el tiempo desde el alta, dejó de comprar (eso es lo que ve el churn).
+
+Uso (desde backend/):
+    python benchmarks/datagen.py 100000                  # base temporal nueva
+    DB_URL=sqlite:////tmp/carga.db python benchmarks/datagen.py 1000000 --seed 7
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+if "DB_URL" not in os.environ:
+    os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pietro-bench-'), 'bench.db')}"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from models import Broadcast, BroadcastRecipient, Client, Movement, movement_natural_key  # noqa: E402
+
+BATCH = 50_000
+HISTORY_DAYS = 730
+# Dispersión (lognormal) de la propensión a comprar de cada contacto: más alta = más concentrado
+REPEAT_SIGMA = 1.6
+MOVEMENTS_PER_CONTACT = 8
+
+SELLERS = ["Lucía", "Martín", "Sofía", "Diego", "Valentina"]
+PAYMENT_METHODS = ["Efectivo", "Transferencia", "Tarjeta", "MercadoPago"]
+EXPENSE_CATEGORIES = ["Insumos", "Logística", "Publicidad", "Servicios"]
+STATUSES = ["nuevo", "activo", "inactivo", "perdido"]
+TAGS = ["vip", "mayorista", "moroso", "zona norte", "zona sur", "nuevo", "recomendado"]
+ZONES = ["Centro", "Norte", "Sur", "Oeste"]
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Damián", "Elena", "Federico", "Gabriela", "Hernán", "Inés", "Julián"]
+LAST_NAMES = ["Pérez", "Gómez", "Rodríguez", "Fernández", "López", "Díaz", "Martínez", "Sánchez", "Romero", "Álvarez"]
+
+
+def contact_name(i: int) -> str:
+    return f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]} {i:06d}"
+
+
+def contact_phone(i: int) -> str:
+    return f"+54911{i:08d}"
+
+
+def _contact_profiles(rng: np.random.Generator, contacts: int, movements: int):
+    """Pedidos, alta (días atrás) y lapso de compras de cada contacto."""
+    weights = rng.lognormal(0.0, REPEAT_SIGMA, contacts)
+    # Todo contacto tiene al menos un pedido; el resto se reparte según la ley de potencia
+    counts = 1 + rng.multinomial(movements - contacts, weights / weights.sum())
+    started = rng.uniform(0, HISTORY_DAYS, contacts)
+    cadence = rng.lognormal(np.log(25), 0.6, contacts)
+    span = np.minimum(started, (counts - 1) * cadence)
+    return counts, started, span
+
+
+def generate_movements(db: Session, rng: np.random.Generator, movements: int, contacts: int, now: datetime) -> None:
+    counts, started, span = _contact_profiles(rng, contacts, movements)
+    contact_of = np.repeat(np.arange(contacts), counts)
+    rng.shuffle(contact_of)
+    for lo in range(0, movements, BATCH):
+        ids = contact_of[lo:lo + BATCH]
+        n = len(ids)
+        days_ago = started[ids] - rng.uniform(0, 1, n) * span[ids]
+        minutes = rng.integers(0, 24 * 60, n)
+        is_sale = rng.random(n) < 0.9
+        values = np.round(rng.lognormal(np.log(15000), 0.8, n), 2)
+        sellers = rng.integers(0, len(SELLERS), n)
+        methods = rng.integers(0, len(PAYMENT_METHODS), n)
+        categories = rng.integers(0, len(EXPENSE_CATEGORIES), n)
+        rows = []
+        for j in range(n):
+            date = (now - timedelta(days=float(days_ago[j]))).replace(hour=0, minute=0, second=0, microsecond=0)
+            date += timedelta(minutes=int(minutes[j]))
+            contact = contact_name(int(ids[j]))
+            value = float(values[j])
+            description = f"pedido {lo + j}"
+            rows.append({
+                "date": date,
+                "type": "Venta" if is_sale[j] else "Gasto",
+                "seller": SELLERS[sellers[j]],
+                "description": description,
+                "expense_category": "No Aplica" if is_sale[j] else EXPENSE_CATEGORIES[categories[j]],
+                "contact": contact,
+                "status": "Pagada",
+                "payment_method": PAYMENT_METHODS[methods[j]],
+                "value": value,
+                "natural_key": movement_natural_key(date, contact, value, description),
+            })
+        db.execute(insert(Movement), rows)
+        db.commit()
+
+
+def generate_clients(db: Session, rng: np.random.Generator, contacts: int, now: datetime) -> int:
+    # No todos los contactos que compran están cargados como clientes
+    chosen = np.flatnonzero(rng.random(contacts) < 0.8)
+    for lo in range(0, len(chosen), BATCH):
+        rows = []
+        for i in chosen[lo:lo + BATCH]:
+            i = int(i)
+            tags = rng.choice(TAGS, size=int(rng.integers(0, 3)), replace=False)
+            rows.append({
+                "name": contact_name(i),
+                "phone": contact_phone(i),
+                "status": STATUSES[int(rng.integers(0, len(STATUSES)))],
+                "tags": ",".join(tags),
+                "last_contact": now - timedelta(days=float(rng.uniform(0, 120))),
+                "owner": SELLERS[i % len(SELLERS)],
+                "notes": f"Cliente de zona {ZONES[i % len(ZONES)].lower()}",
+                "zone": ZONES[i % len(ZONES)],
+            })
+        db.execute(insert(Client), rows)
+        db.commit()
+    return len(chosen)
+
+
+def generate_broadcasts(db: Session, rng: np.random.Generator, count: int, contacts: int, now: datetime) -> None:
+    statuses = ["draft", "scheduled", "sent", "sent", "sent"]
+    for b in range(count):
+        status = statuses[b % len(statuses)]
+        when = now + timedelta(days=int(rng.integers(1, 30))) if status == "scheduled" else None
+        broadcast_id = db.execute(
+            insert(Broadcast).values(message=f"Promo {b}", status=status, scheduled_time=when).returning(Broadcast.id)
+        ).scalar_one()
+        recipients = rng.choice(contacts, size=min(contacts, int(rng.integers(10, 200))), replace=False)
+        db.execute(
+            insert(BroadcastRecipient),
+            [{"broadcast_id": broadcast_id, "position": p, "phone": contact_phone(int(i))} for p, i in enumerate(recipients)],
+        )
+    db.commit()
+
+
+def generate(db: Session, movements: int, seed: int = 42, now: datetime | None = None) -> dict:
+    """Genera el dataset completo sobre una base vacía y devuelve lo que se cargó."""
+    from contacts import backfill_contact_keys
+    from rollups import rebuild_contact_rollups, rebuild_revenue_buckets
+    from routers.churn import get_or_create_control_variables, seed_frequencies_if_needed
+    from tags import backfill_client_tags
+
+    if db.query(Movement.id).first() is not None or db.query(Client.id).first() is not None:
+        raise RuntimeError("La base ya tiene datos: el generador necesita una base vacía")
+    # Relativo al día de hoy (no a la hora): misma semilla, mismo día, mismos datos
+    now = now or datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    rng = np.random.default_rng(seed)
+    contacts = max(movements // MOVEMENTS_PER_CONTACT, 1)
+    started = time.perf_counter()
+
+    get_or_create_control_variables(db)
+    seed_frequencies_if_needed(db)
+    generate_movements(db, rng, movements, contacts, now)
+    clients = generate_clients(db, rng, contacts, now)
+    backfill_client_tags(db)
+    backfill_contact_keys(db)
+    broadcasts = max(contacts // 100, 1)
+    generate_broadcasts(db, rng, broadcasts, contacts, now)
+    rebuild_contact_rollups(db)
+    rebuild_revenue_buckets(db)
+    db.commit()
+    return {
+        "seed": seed,
+        "movements": movements,
+        "contacts": contacts,
+        "clients": clients,
+        "broadcasts": broadcasts,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def prepare_database():
+    """Crea el esquema y corre las migraciones (índices, FTS, versiones) sobre DB_URL."""
+    from database import Base, engine
+    from migrations import run_migrations
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("movements", type=int, help="cantidad de movimientos (1k a 5M)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from database import DB_URL, SessionLocal
+
+    prepare_database()
+    with SessionLocal() as db:
+        summary = generate(db, args.movements, args.seed)
+    print(f"{DB_URL}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
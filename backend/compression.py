@@ -0,0 +1,46 @@
+"""Compresión gzip de las respuestas grandes (JSON de listados, CSV, HTML).
+
+Es el `GZipMiddleware` de Starlette con tres ajustes: no vuelve a comprimir lo
+que ya viene comprimido (imágenes, zips, los `.gz`/`.br` de /build), deja
+pasar sin tocar las exportaciones en streaming (CSV/NDJSON sin Content-Length:
+gzip retiene los bloques y el cliente dejaría de recibirlos a medida que salen)
+y el nivel por defecto es 6, que en JSON comprime casi lo mismo que 9 con
+bastante menos CPU por request.
+"""
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+from static_files import accepted_encodings
+
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+# Tipos que no ganan nada con gzip
+INCOMPRESSIBLE_PREFIXES = ("image/", "video/", "audio/", "font/woff", "application/zip", "application/gzip")
+# Exportaciones que se mandan por partes (ver exports.py)
+STREAMING_PREFIXES = ("text/csv", "application/x-ndjson")
+
+
+class _Responder(GZipResponder):
+    async def send_with_gzip(self, message):
+        await super().send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            streaming = "content-length" not in headers and content_type.startswith(STREAMING_PREFIXES)
+            if streaming or content_type.startswith(INCOMPRESSIBLE_PREFIXES):
+                # Mismo camino que una respuesta con Content-Encoding: pasa tal cual
+                self.content_encoding_set = True
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(self, app, minimum_size: int = GZIP_MIN_BYTES, compresslevel: int = GZIP_LEVEL):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in accepted_encodings(scope):
+            await _Responder(self.app, self.minimum_size, compresslevel=self.compresslevel)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
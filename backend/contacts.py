@@ -0,0 +1,134 @@
+"""Vínculo entre movimientos y clientes por una clave de contacto normalizada.
+
+`Movement.contact` es texto libre; `Movement.contact_key` y `Client.contact_key`
+guardan `normalize_contact()` de ese texto y del nombre del cliente (sin tildes,
+minúsculas, espacios simples), indexados. `Movement.client_id` apunta al cliente
+con la misma clave (el de menor id si hay varios) y se completa al cargar el
+movimiento o al importar. Crear, renombrar o borrar un cliente revincula los
+movimientos de las claves afectadas. Así los agregados por contacto o por
+cliente son un GROUP BY o un join por índice, sin normalizar strings en cada
+request.
+
+Las filas anteriores a estas columnas se completan al arrancar
+(`backfill_contact_keys`); `python contacts.py` rehace todos los vínculos.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Client, Movement, normalize_contact
+
+BACKFILL_BATCH = 1000
+# Claves por consulta IN al resolver clientes
+IN_BATCH = 500
+
+
+def client_ids(db: Session, keys: Iterable[str]) -> Dict[str, int]:
+    """{contact_key: id del cliente} para las claves que tienen cliente."""
+    keys = sorted({k for k in keys if k})
+    found: Dict[str, int] = {}
+    for i in range(0, len(keys), IN_BATCH):
+        batch = keys[i:i + IN_BATCH]
+        found.update(db.execute(
+            select(Client.contact_key, func.min(Client.id))
+            .where(Client.contact_key.in_(batch))
+            .group_by(Client.contact_key)
+        ).all())
+    return found
+
+
+def fill_contact_columns(db: Session, rows: List[dict]):
+    """Completa contact_key y client_id de filas de movimientos antes de un insert core."""
+    for r in rows:
+        r["contact_key"] = normalize_contact(r.get("contact"))
+    owners = client_ids(db, (r["contact_key"] for r in rows))
+    for r in rows:
+        r["client_id"] = owners.get(r["contact_key"])
+
+
+def _owner():
+    # Cliente de menor id con la clave del movimiento (correlacionado con movements)
+    return select(func.min(Client.id)).where(Client.contact_key == Movement.contact_key).scalar_subquery()
+
+
+def relink_movements(db: Session, keys: Optional[Iterable[str]] = None):
+    """Recalcula client_id de los movimientos con esas claves (todas si es None). No hace commit."""
+    stmt = update(Movement).values(client_id=_owner())
+    if keys is not None:
+        keys = sorted({k for k in keys if k})
+        if not keys:
+            return
+        stmt = stmt.where(Movement.contact_key.in_(keys))
+    db.execute(stmt.execution_options(synchronize_session=False))
+
+
+def link_client(db: Session, client: Client, old_key: Optional[str] = None):
+    """Después de crear, renombrar o borrar un cliente (con flush hecho). No hace commit."""
+    relink_movements(db, {normalize_contact(client.name), old_key or ""})
+
+
+def _backfill(db: Session, model, source, column):
+    while True:
+        rows = db.execute(select(model.id, source).where(column.is_(None)).limit(BACKFILL_BATCH)).all()
+        if not rows:
+            return
+        db.execute(update(model), [{"id": r[0], column.key: normalize_contact(r[1])} for r in rows])
+        db.commit()
+
+
+def backfill_contact_keys(db: Session):
+    """Completa las claves que falten y vincula los movimientos sin cliente que ya tienen uno."""
+    _backfill(db, Client, Client.name, Client.contact_key)
+    _backfill(db, Movement, Movement.contact, Movement.contact_key)
+    has_client = exists().where(Client.contact_key == Movement.contact_key)
+    db.execute(
+        update(Movement)
+        .where(Movement.client_id.is_(None), Movement.contact_key != "", has_client)
+        .values(client_id=_owner())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def client_totals(db: Session, limit: Optional[int] = None) -> List[dict]:
+    """Pedidos, facturación y primer/último movimiento por cliente (GROUP BY client_id)."""
+    totals = (
+        select(
+            Movement.client_id,
+            func.count(Movement.id).label("pedidos"),
+            func.coalesce(func.sum(Movement.value), 0.0).label("facturacion_total"),
+            func.min(Movement.date).label("primer_pedido"),
+            func.max(Movement.date).label("ultimo_pedido"),
+        )
+        .where(Movement.client_id.is_not(None))
+        .group_by(Movement.client_id)
+        .subquery()
+    )
+    stmt = (
+        select(Client.id, Client.name, totals.c.pedidos, totals.c.facturacion_total, totals.c.primer_pedido, totals.c.ultimo_pedido)
+        .join(totals, totals.c.client_id == Client.id)
+        .order_by(totals.c.facturacion_total.desc(), Client.id)
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+    return [
+        {
+            "client_id": r[0], "nombre": r[1], "pedidos": r[2], "facturacion_total": float(r[3]),
+            "primer_pedido": r[4], "ultimo_pedido": r[5],
+        }
+        for r in db.execute(stmt)
+    ]
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        backfill_contact_keys(db)
+        relink_movements(db)
+        db.commit()
+        linked = db.query(Movement.id).filter(Movement.client_id.is_not(None)).count()
+        print(f"Claves de contacto completas; {linked} movimientos vinculados a un cliente")
+    finally:
+        db.close()
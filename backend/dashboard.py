@@ -0,0 +1,138 @@
+"""Resumen del dashboard (index.html) calculado con agregados SQL.
+
+Devuelve exactamente lo que pinta `script.js`: KPIs del período, ventas por
+día, top de clientes, clientes por estado y contactos por clasificación de
+churn. Salvo el conteo por estado (GROUP BY sobre clients) y el top histórico
+de ventas (GROUP BY contact_key sobre las ventas), todo sale de
+`contact_rollups` (una fila por contacto) y de la ventana de días de
+`movements`, así que la respuesta pesa unos KB sin importar el tamaño de la base.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import Float, case, cast, func, literal, select
+from sqlalchemy.orm import Session
+
+from models import Client, ContactRollup, ControlVariables, Movement
+from rollups import display_column
+
+TOP_CLIENTES = 30
+# Gráfico "Top 10 Clientes": sólo ventas, de toda la historia
+TOP_VENTAS = 10
+
+
+def _day_number(expr, dialect: str):
+    """Número de día (entero) de una fecha, para restar fechas del lado SQL."""
+    if dialect == "sqlite":
+        return func.julianday(func.date(expr))
+    return func.extract("epoch", func.date_trunc("day", expr)) / 86400
+
+
+def churn_class_expr(ctrl: ControlVariables, today: date, dialect: str):
+    """CASE equivalente a `routers.churn.classify_contact` sobre ContactRollup."""
+    first = _day_number(ContactRollup.first_order, dialect)
+    last = _day_number(ContactRollup.last_order, dialect)
+    today_n = _day_number(literal(datetime.combine(today, time.min)), dialect)
+    dias_ultimo = today_n - last
+    cantidad = ContactRollup.order_count
+    span = case((last - first == 0, 1), else_=last - first)
+    frecuencia = case(
+        (cantidad > 1, cast(span, Float) / (cantidad - 1)),
+        else_=float(ctrl.dias_nuevos),
+    )
+    regular = float(ctrl.coeficiente_regular) * frecuencia
+    return case(
+        ((cantidad >= ctrl.pedidos_vip) & (dias_ultimo < regular), "1.1"),
+        ((cantidad >= ctrl.pedidos_activo_frecuente) & (dias_ultimo < regular), "1.2"),
+        ((dias_ultimo > regular) & (cantidad >= ctrl.pedidos_activo_frecuente), "2.1"),
+        (dias_ultimo > ctrl.dias_nuevos, "2.2"),
+        else_="4.1",
+    )
+
+
+def period_start(now: datetime, days: int) -> datetime:
+    # El front compara `ultimo_pedido` (medianoche del día) contra now - días:
+    # un contacto entra si su último pedido cae en un día >= al corte
+    cutoff = now - timedelta(days=days)
+    start = cutoff.date() if cutoff.time() == time.min else cutoff.date() + timedelta(days=1)
+    return datetime.combine(start, time.min)
+
+
+def dashboard_summary(db: Session, ctrl: ControlVariables, days: int = 30, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.utcnow()
+    dialect = db.get_bind().dialect.name
+    # Todo el resumen usa días UTC completos: sólo cambia con los datos o a la
+    # medianoche, y así lo versiona su ETag
+    start = period_start(now, days)
+    in_period = ContactRollup.last_order >= start
+
+    clientes, ventas, pedidos = db.execute(
+        select(
+            func.count(ContactRollup.contact),
+            func.coalesce(func.sum(ContactRollup.total_value), 0.0),
+            func.coalesce(func.sum(ContactRollup.order_count), 0),
+        ).where(in_period)
+    ).one()
+    ventas = float(ventas)
+
+    top = db.execute(
+        select(ContactRollup.contact, ContactRollup.total_value)
+        .where(in_period)
+        .order_by(ContactRollup.total_value.desc(), ContactRollup.contact)
+        .limit(TOP_CLIENTES)
+    ).all()
+
+    # El rollup suma también los gastos: el gráfico de ventas agrupa los movimientos "Venta"
+    total_ventas = func.sum(Movement.value).label("total")
+    nombre = display_column().label("nombre")
+    top_ventas = db.execute(
+        select(nombre, total_ventas)
+        .where(Movement.type == "Venta", Movement.contact_key != "")
+        .group_by(Movement.contact_key)
+        .order_by(total_ventas.desc(), nombre)
+        .limit(TOP_VENTAS)
+    ).all()
+
+    dia = func.date(Movement.date)
+    diarias = db.execute(
+        select(dia, func.sum(Movement.value))
+        .where(Movement.type == "Venta", Movement.date >= start)
+        .group_by(dia)
+        .order_by(dia)
+    ).all()
+
+    clase = churn_class_expr(ctrl, now.date(), dialect).label("clasificacion")
+    clases = db.execute(
+        select(
+            clase,
+            func.count(ContactRollup.contact),
+            func.coalesce(func.sum(ContactRollup.total_value), 0.0),
+            func.coalesce(func.sum(case((in_period, 1), else_=0)), 0),
+        )
+        .group_by(clase)
+        .order_by(clase)
+    ).all()
+    en_periodo = {c: n for c, _, _, n in clases}
+
+    por_estado = db.execute(select(Client.status, func.count(Client.id)).group_by(Client.status)).all()
+
+    return {
+        "dias": days,
+        "desde": start,
+        "kpis": {
+            "clientes": clientes,
+            "ventas": ventas,
+            "pedidos": int(pedidos),
+            "ticket_promedio": ventas / pedidos if pedidos else 0.0,
+            "clientes_activos": sum(n for c, n in en_periodo.items() if c.startswith("1.")),
+            "clientes_perdidos": sum(n for c, n in en_periodo.items() if c.startswith("2.")),
+        },
+        "ventas_diarias": [{"fecha": str(d), "total": float(v or 0)} for d, v in diarias],
+        "top_clientes": [{"contacto": c, "facturacion": float(v or 0)} for c, v in top],
+        "top_ventas": [{"contacto": c, "facturacion": float(v or 0)} for c, v in top_ventas],
+        "clientes_por_estado": {estado or "Sin estado": n for estado, n in por_estado},
+        "churn_clases": [
+            {"clasificacion": c, "clientes": n, "facturacion_total": float(f), "clientes_periodo": p}
+            for c, n, f, p in clases
+        ],
+    }
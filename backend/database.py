@@ -1,16 +1,159 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import Union
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 DB_URL = os.getenv("DB_URL", "sqlite:///./pietro.db")
-connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-engine = create_engine(DB_URL, echo=False, connect_args=connect_args)
+# Réplica o conexión aparte para los GET; si no se define se usa DB_URL
+DB_READ_URL = os.getenv("DB_READ_URL")
+# "tuned": pragmas de SQLite / pool ajustado; "basic": defaults de SQLAlchemy
+DB_PROFILE = os.getenv("DB_PROFILE", "tuned")
+# En SQLite, abre un engine de lectura con `query_only` aunque no haya DB_READ_URL
+DB_READ_ONLY = os.getenv("DB_READ_ONLY", "0") == "1"
+# "1": los routers usan AsyncSession (aiosqlite / asyncpg) en vez del threadpool
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+IS_SQLITE = DB_URL.startswith("sqlite")
+
+# WAL deja leer mientras se escribe; NORMAL en WAL sólo arriesga la última
+# transacción ante un corte de luz, no la integridad de la base
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    # negativo = KiB (64 MB de caché de páginas por conexión)
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    # Descarta conexiones cortadas por el servidor/proxy antes de usarlas
+    "pool_pre_ping": True,
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+}
+
+
+def _apply_sqlite_pragmas(engine, read_only: bool = False):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}}
+    return POOL_OPTIONS if DB_PROFILE == "tuned" else {}
+
+
+def make_engine(url: str, read_only: bool = False):
+    engine = create_engine(url, echo=False, **_engine_options(url))
+    if url.startswith("sqlite") and DB_PROFILE == "tuned":
+        _apply_sqlite_pragmas(engine, read_only)
+    return engine
+
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise RuntimeError(f"DB_ASYNC no soporta {dialect} (sqlite|postgresql)")
+    return f"{ASYNC_DRIVERS[dialect]}://{rest}"
+
+
+def make_async_engine(url: str, read_only: bool = False):
+    engine = create_async_engine(async_url(url), echo=False, **_engine_options(url))
+    if url.startswith("sqlite") and DB_PROFILE == "tuned":
+        # Los eventos de conexión van en el engine sync que envuelve al async
+        _apply_sqlite_pragmas(engine.sync_engine, read_only)
+    return engine
+
+
+def _read_engine(make, primary):
+    if DB_READ_URL:
+        return make(DB_READ_URL, read_only=True)
+    if DB_READ_ONLY and IS_SQLITE:
+        return make(DB_URL, read_only=True)
+    return primary
+
+
+engine = make_engine(DB_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+read_engine = _read_engine(make_engine, engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Migraciones, scheduler, importador y exportaciones siguen con el engine sync
+# (son CPU o streaming); el modo async es para los requests de los routers.
+if DB_ASYNC:
+    async_engine = make_async_engine(DB_URL)
+    async_read_engine = _read_engine(make_async_engine, async_engine)
+    # Sin expirar al commit: la respuesta se serializa fuera de run_sync y no puede hacer I/O
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+
+class ThreadedSession:
+    """`run_sync` de AsyncSession sobre una Session sync: cada llamada va al threadpool."""
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+# Lo que reciben los endpoints async: `await db.run_sync(fn, ...)` llama a fn(session, ...)
+AsyncDB = Union[AsyncSession, ThreadedSession]
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """Sesión para endpoints GET que no escriben (puede ir a una réplica)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """Sesión para endpoints async: AsyncSession con DB_ASYNC=1, si no una Session en el threadpool."""
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    db = SessionLocal()
+    try:
+        yield ThreadedSession(db)
+    finally:
+        await run_in_threadpool(db.close)
+
+async def get_async_read_db():
+    if DB_ASYNC:
+        async with AsyncReadSessionLocal() as db:
+            yield db
+        return
+    db = ReadSessionLocal()
+    try:
+        yield ThreadedSession(db)
+    finally:
+        await run_in_threadpool(db.close)
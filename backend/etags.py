@@ -0,0 +1,82 @@
+"""GET condicionales (ETag / If-None-Match) a partir de `data_versions`.
+
+`conditional_get(*tablas)` es una dependencia para routers o endpoints: arma
+un ETag débil con la ruta, los query params y la versión de cada tabla de la
+que depende la respuesta, y si coincide con el `If-None-Match` del cliente
+corta con 304 antes de correr la consulta o serializar nada. El ETag se calcula
+antes de leer los datos: si alguien escribe en el medio, el próximo request
+simplemente no coincide y se vuelve a descargar.
+
+Un endpoint que lee otras tablas que el resto de su router las declara con
+`@etag_tables(...)`, que reemplaza a las de la dependencia del router.
+"""
+import hashlib
+import time
+from typing import Callable, Optional
+
+from fastapi import Depends, Request, Response
+
+from database import AsyncDB, get_async_read_db
+from routers.auth import get_current_user
+from versions import get_versions
+
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Comparación débil: W/"x" y "x" son el mismo validador
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def etag_tables(*tables: str):
+    """Tablas del ETag de un endpoint, en lugar de las del `conditional_get` del router."""
+    def decorate(endpoint: Callable) -> Callable:
+        endpoint.etag_tables = tables
+        return endpoint
+
+    return decorate
+
+
+def conditional_get(*tables: str, period: Optional[int] = None):
+    """Dependencia de ETag para GET.
+
+    `period` (segundos) agrega la ventana de tiempo actual al ETag, para
+    respuestas que dependen de la fecha (churn usa `today`, /stats y /dashboard
+    ventanas de días UTC completos): con 86400 el ETag cambia al pasar la
+    medianoche UTC.
+    """
+    async def dependency(
+        request: Request,
+        response: Response,
+        db: AsyncDB = Depends(get_async_read_db),
+        user: str = Depends(get_current_user),
+    ):
+        if request.method != "GET":
+            return
+        depends_on = getattr(request.scope.get("endpoint"), "etag_tables", None) or tables
+        versions = await db.run_sync(get_versions, depends_on)
+        parts = [request.url.path, request.url.query, *(f"{t}:{versions[t]}" for t in depends_on)]
+        if period:
+            parts.append(str(int(time.time() // period)))
+        etag = 'W/"{}"'.format(hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:24])
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise NotModified(etag)
+        response.headers["ETag"] = etag
+        # El navegador guarda la respuesta pero revalida siempre
+        response.headers["Cache-Control"] = "private, no-cache"
+
+    return dependency
+
+
+def not_modified_handler(request: Request, exc: NotModified) -> Response:
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": "private, no-cache"})
@@ -0,0 +1,76 @@
+"""Serialización directa de listados grandes (modo `?fast=1`).
+
+Con `response_model`, FastAPI valida cada objeto ORM contra el schema y recién
+después codifica el JSON; con decenas de miles de filas eso cuesta más que la
+consulta. En modo rápido el router selecciona sólo las columnas del schema
+(tuplas, sin objetos ORM) y este módulo las codifica tal cual con orjson si
+está instalado (`pip install orjson`), o con `json` si no.
+
+La salida es idéntica byte a byte a la de siempre: mismas claves en el orden
+de los campos del schema, JSON compacto, UTF-8 sin escapar, fechas ISO. La
+única diferencia entre encoders está en los float muy grandes o muy chicos
+(`1e+16` en `json`, `1e16` en orjson/pydantic): si aparece alguno en un
+listado que FastAPI codifica con `json`, ese listado se codifica con `json`.
+
+`model_json` es el camino normal (con validación) pero fuera del event loop:
+FastAPI valida el response_model de un endpoint `def` en el threadpool, pero
+lo serializa y codifica en el loop; los listados grandes lo arman completo
+en el endpoint y devuelven la respuesta ya codificada.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, List, Optional, Sequence
+
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa json, igual sin validar con pydantic
+    orjson = None
+
+ORJSON = orjson is not None
+
+# Entre estos límites repr() y orjson escriben los float igual (sin exponente)
+_FLOAT_MIN = 1e-4
+_FLOAT_MAX = 1e16
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} no es serializable a JSON")
+
+
+def _stdlib_dumps(content) -> bytes:
+    # Los mismos parámetros que JSONResponse de Starlette
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+def _exponent_float(value) -> bool:
+    return isinstance(value, float) and value != 0 and not (_FLOAT_MIN <= abs(value) < _FLOAT_MAX)
+
+
+def dumps(content, float_keys: Sequence[str] = ()) -> bytes:
+    """JSON compacto como el de FastAPI. `float_keys`: claves float de cada fila (ver docstring)."""
+    if orjson is None:
+        return _stdlib_dumps(content)
+    if float_keys and any(_exponent_float(row[k]) for row in content for k in float_keys):
+        return _stdlib_dumps(content)
+    return orjson.dumps(content)
+
+
+def rows_to_dicts(columns: List[str], rows: Iterable[Sequence]) -> List[dict]:
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def rows_json(columns: List[str], rows: Iterable[Sequence], float_columns: Optional[Sequence[str]] = None) -> bytes:
+    """Filas (tuplas en el orden de `columns`) -> JSON de una lista de objetos."""
+    return dumps(rows_to_dicts(columns, rows), float_columns or ())
+
+
+def model_json(adapter: TypeAdapter, content: Any) -> bytes:
+    """Lo mismo que response_model + JSONResponse de FastAPI (valida, serializa y codifica)."""
+    value = adapter.validate_python(content, from_attributes=True)
+    return _stdlib_dumps(adapter.dump_python(value, mode="json", by_alias=True))
@@ -0,0 +1,169 @@
+"""Imágenes subidas: guardado por contenido y variantes livianas para WhatsApp.
+
+La subida se copia a disco de a bloques (nunca entera en memoria) mientras se
+calcula su SHA-256, con un tope de `UPLOAD_MAX_BYTES`; sólo se aceptan JPEG,
+PNG, WebP y GIF, reconocidos por los primeros bytes. El archivo final se
+llama `<sha256><ext>`: subir la misma imagen dos veces no ocupa más lugar, y
+como la URL cambia si cambia el contenido, `/uploads` la sirve con caché
+`immutable` (ver static_files.py).
+
+Si está Pillow (`pip install Pillow`) se generan en un hilo variantes JPEG
+redimensionadas (`<sha256>.w1600.jpg` para enviar, `<sha256>.w320.jpg` como
+miniatura); sin Pillow se usa la original tal cual.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él no hay variantes
+    Image = None
+
+UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "uploads"))
+UPLOAD_URL = "/uploads"
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+FILE_MODE = 0o644
+
+# nombre -> (lado mayor en px, calidad JPEG)
+VARIANTS = {
+    "whatsapp": (1600, 80),
+    "thumb": (320, 75),
+}
+# Sólo formatos raster, reconocidos por su firma: nunca SVG ni HTML (se servirían como tales)
+SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+FORMATS = "JPEG, PNG, WebP o GIF"
+
+# <sha256>.<ext> o <sha256>.w<px>.jpg: lo que se puede cachear para siempre
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(\.w\d+)?\.[a-z0-9]+$")
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """Extensión según los primeros bytes del archivo; None si no es un formato aceptado."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def _publish(tmp: str, dest: str):
+    # Los temporales nacen con 0600; el servidor web tiene que poder leerlos
+    os.chmod(tmp, FILE_MODE)
+    os.replace(tmp, dest)
+
+
+def _url(name: str) -> str:
+    return f"{UPLOAD_URL}/{name}"
+
+
+async def store_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Copia la subida a `UPLOAD_DIR/<sha256><ext>` y devuelve el nombre."""
+    digest = hashlib.sha256()
+    size = 0
+    ext = None
+    tmp = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=".subida-", delete=False)
+    try:
+        with tmp:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413, detail=f"La imagen supera el máximo de {max_bytes // (1024 * 1024)} MB"
+                    )
+                if ext is None:
+                    # El tipo sale del contenido, no del Content-Type ni del nombre que manda el cliente
+                    ext = sniff_extension(chunk)
+                    if ext is None:
+                        raise HTTPException(status_code=400, detail=f"Solo imágenes {FORMATS}")
+                digest.update(chunk)
+                await run_in_threadpool(tmp.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Archivo vacío")
+        name = digest.hexdigest() + ext
+        dest = os.path.join(UPLOAD_DIR, name)
+        if os.path.exists(dest):
+            # Ya estaba: misma imagen, misma URL
+            os.remove(tmp.name)
+        else:
+            _publish(tmp.name, dest)
+        return name
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+
+
+def _variant(source: str, name: str, max_side: int, quality: int) -> Optional[str]:
+    stem = name.split(".", 1)[0]
+    variant = f"{stem}.w{max_side}.jpg"
+    dest = os.path.join(UPLOAD_DIR, variant)
+    if os.path.exists(dest):
+        return variant
+    with Image.open(source) as img:
+        if img.format == "JPEG" and max(img.size) <= max_side:
+            # Ya es un JPEG de ese tamaño: no hay nada que ganar
+            return None
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side))
+        if img.mode != "RGB":
+            # JPEG no tiene transparencia: fondo blanco en vez de negro
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        fd, tmp = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".variante-", suffix=".jpg")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    if os.path.getsize(tmp) >= os.path.getsize(source):
+        # Recomprimir no achicó (ya era chica): se usa la original
+        os.remove(tmp)
+        return None
+    _publish(tmp, dest)
+    return variant
+
+
+def make_variants(name: str) -> Dict[str, str]:
+    """Genera (o reutiliza) las variantes de la imagen; bloqueante, correr en un hilo."""
+    if Image is None or name.endswith(".gif"):
+        # Los GIF pueden ser animados: se mandan como están
+        return {}
+    source = os.path.join(UPLOAD_DIR, name)
+    variants = {}
+    try:
+        for key, (max_side, quality) in VARIANTS.items():
+            variant = _variant(source, name, max_side, quality)
+            if variant:
+                variants[key] = variant
+    except (OSError, Image.DecompressionBombError):
+        # No es una imagen que Pillow entienda: queda sólo la original
+        return {}
+    return variants
+
+
+async def save_image(file: UploadFile) -> dict:
+    name = await store_upload(file)
+    variants = await run_in_threadpool(make_variants, name)
+    return {
+        "file_url": _url(name),
+        # La que conviene mandar por WhatsApp (la variante si existe)
+        "whatsapp_url": _url(variants.get("whatsapp", name)),
+        "variants": {key: _url(v) for key, v in variants.items()},
+    }
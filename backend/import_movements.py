@@ -1,14 +1,30 @@
 import csv
+import sys
+import time
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
+from typing import List, TextIO, Tuple
 
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from contacts import fill_contact_columns
 from database import SessionLocal
-from models import Movement
+from models import Movement, movement_natural_key
+from rollups import apply_movements, movement_row
+from schemas import ImportRejectedRow, ImportReportOut, ImportWarningRow
 
 
 CSV_PATH = Path(__file__).parent.parent / "data" / "CRM - Zentra - Registro de clientes.csv"
+# Filas por INSERT/commit (y por consulta de claves existentes)
+CHUNK_SIZE = 500
+MAX_REJECTED_DETAIL = 1000
+# Reintentos de un bloque si otra importación insertó las mismas claves a la vez
+INSERT_ATTEMPTS = 3
+# Filas distintas recordadas para numerar repeticiones (memoria acotada en archivos grandes)
+REPEAT_WINDOW = 50000
 
 
 def parse_row(row: dict):
@@ -61,27 +77,112 @@ def parse_row(row: dict):
     }
 
 
-def import_movements():
-    if not CSV_PATH.exists():
-        raise FileNotFoundError(f"CSV no encontrado en {CSV_PATH}")
+def _insert_chunk(db: Session, chunk: List[dict], report: ImportReportOut):
+    """Inserta un bloque ya parseado, salteando las claves naturales que ya están en la base."""
+    for attempt in range(INSERT_ATTEMPTS):
+        keys = {r["natural_key"] for r in chunk}
+        existing = set(db.execute(select(Movement.natural_key).where(Movement.natural_key.in_(keys))).scalars())
+        fresh = []
+        for r in chunk:
+            # Una repetición que ya salió de la ventana trae la clave de la primera: va como duplicado
+            if r["natural_key"] not in existing:
+                existing.add(r["natural_key"])
+                fresh.append(r)
+        try:
+            if fresh:
+                fill_contact_columns(db, fresh)
+                db.execute(insert(Movement), fresh)
+                apply_movements(db, [movement_row(r) for r in fresh])
+            # commit por bloque: si algo falla, re-correr retoma sin duplicar
+            db.commit()
+        except IntegrityError:
+            # El índice único frenó claves que otra importación insertó después del SELECT
+            db.rollback()
+            if attempt + 1 == INSERT_ATTEMPTS:
+                raise
+            continue
+        report.duplicates += len(chunk) - len(fresh)
+        report.inserted += len(fresh)
+        return
+
+
+def import_csv(f: TextIO, db: Session, chunk_size: int = CHUNK_SIZE) -> ImportReportOut:
+    """Importa movimientos desde un CSV en bloques, de forma idempotente.
+
+    Las filas que no se pueden parsear quedan en `rejected` (con su número de
+    línea) en lugar de abortar la importación. Dos filas idénticas en el mismo
+    archivo son dos movimientos (p. ej. la misma venta dos veces en el día): la
+    repetición entra en la clave natural, así que se importan las dos, quedan
+    avisadas en `warnings` y re-importar el archivo no duplica ninguna. Las
+    repeticiones se cuentan sobre las últimas `REPEAT_WINDOW` filas distintas:
+    una fila idéntica a otra que quedó más atrás se toma como duplicado.
+    """
+    report = ImportReportOut()
+    started = time.perf_counter()
+    reader = csv.DictReader(f)
+    chunk: List[dict] = []
+    # clave natural sin repetición -> (veces vista, primera línea), de las más recientes
+    seen: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+    for row in reader:
+        if not any(row.values()):
+            continue
+        report.read += 1
+        try:
+            data = parse_row(row)
+        except ValueError as e:
+            report.rejected_count += 1
+            if len(report.rejected) < MAX_REJECTED_DETAIL:
+                fields = {k: v for k, v in row.items() if k is not None}
+                report.rejected.append(ImportRejectedRow(line=reader.line_num, error=str(e), row=fields))
+            continue
+        fields = (data["date"], data["contact"], data["value"], data["description"])
+        key = movement_natural_key(*fields)
+        occurrence, first_line = seen.pop(key, (0, reader.line_num))
+        seen[key] = (occurrence + 1, first_line)
+        if len(seen) > REPEAT_WINDOW:
+            seen.popitem(last=False)
+        if occurrence:
+            report.repeated_count += 1
+            if len(report.warnings) < MAX_REJECTED_DETAIL:
+                report.warnings.append(ImportWarningRow(
+                    line=reader.line_num,
+                    warning=f"Fila idéntica a la línea {first_line}: se importa como otro movimiento",
+                ))
+            key = movement_natural_key(*fields, occurrence)
+        data["natural_key"] = key
+        chunk.append(data)
+        if len(chunk) >= chunk_size:
+            _insert_chunk(db, chunk, report)
+            chunk = []
+    if chunk:
+        _insert_chunk(db, chunk, report)
+
+    report.seconds = time.perf_counter() - started
+    report.rows_per_second = report.read / report.seconds if report.seconds else 0.0
+    return report
+
+
+def import_movements(path: Path = CSV_PATH, chunk_size: int = CHUNK_SIZE) -> ImportReportOut:
+    if not path.exists():
+        raise FileNotFoundError(f"CSV no encontrado en {path}")
 
     db: Session = SessionLocal()
     try:
-        with CSV_PATH.open("r", encoding="utf-8-sig", newline="") as f:
-            reader = csv.DictReader(f)
-            count = 0
-            for row in reader:
-                if not any(row.values()):
-                    continue
-                data = parse_row(row)
-                obj = Movement(**data)
-                db.add(obj)
-                count += 1
-            db.commit()
-        print(f"Importados {count} movimientos desde {CSV_PATH}")
+        with path.open("r", encoding="utf-8-sig", newline="") as f:
+            report = import_csv(f, db, chunk_size)
+        print(
+            f"Importados {report.inserted} movimientos desde {path} "
+            f"({report.duplicates} duplicados, {report.repeated_count} repetidos en el archivo, "
+            f"{report.rejected_count} rechazados, {report.rows_per_second:.0f} filas/s)"
+        )
+        for rej in report.rejected:
+            print(f"  línea {rej.line}: {rej.error}")
+        for warn in report.warnings:
+            print(f"  línea {warn.line}: {warn.warning}")
+        return report
     finally:
         db.close()
 
 
 if __name__ == "__main__":
-    import_movements()
+    import_movements(Path(sys.argv[1]) if len(sys.argv) > 1 else CSV_PATH)
@@ -1,9 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse, FileResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
+from contextlib import asynccontextmanager
 import os
 
 from routers.auth import router as auth_router, get_current_user
@@ -12,13 +13,36 @@ from routers.broadcasts import router as broadcasts_router
 from routers.uploads import router as uploads_router
 from routers.whatsapp import router as whatsapp_router
 from routers.movements import router as movements_router
-from routers.churn import router as churn_router
-from database import Base, engine, get_db
+from routers.churn import router as churn_router, get_or_create_control_variables
+from database import AsyncDB, Base, engine, get_async_db, get_async_read_db
+from migrations import run_migrations
+from stats import movement_kpis
+from dashboard import dashboard_summary
+from etags import NotModified, conditional_get, not_modified_handler
+from result_cache import result_cache
+from metrics import METRICS_ENABLED, MetricsMiddleware, registry as metrics_registry
+from images import CONTENT_ADDRESSED, UPLOAD_DIR
+from static_files import ImmutableStaticFiles, PrecompressedStaticFiles
+from static_assets import BUILD_DIR, BUILD_URL, FINGERPRINTED, asset_url, page_response, render_template
+from compression import CompressionMiddleware
 from sqlalchemy.orm import Session
-from fastapi import Depends
+from fastapi import Depends, Query
+from scheduler import ENABLED as SCHEDULER_ENABLED, scheduler
+from whatsapp_client import close_sender
 import uvicorn
 
-app = FastAPI(title="Pietro CRM API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+    yield
+    await scheduler.stop()
+    # Cierra el pool de conexiones compartido con la Graph API
+    await close_sender()
+
+
+app = FastAPI(title="Pietro CRM API", version="0.1.0", lifespan=lifespan)
 
 # CORS: permitir el frontend local y archivos estáticos
 app.add_middleware(
@@ -27,19 +51,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# gzip para JSON/HTML/CSV grandes (ver compression.py); queda adentro de las métricas,
+# que así miden los bytes que salen de verdad
+app.add_middleware(CompressionMiddleware)
+
+# Latencia, tamaño y SQL por ruta (ver metrics.py); último en agregarse = mide todo lo de adentro
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# 304 de los GET condicionales (ver etags.py)
+app.add_exception_handler(NotModified, not_modified_handler)
+
 # Crear tablas si no existen
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
-# Static uploads
-UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "uploads"))
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Static uploads (nombre = hash del contenido: caché immutable, ver images.py)
+app.mount("/uploads", ImmutableStaticFiles(directory=UPLOAD_DIR, pattern=CONTENT_ADDRESSED), name="uploads")
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 templates_dir = os.path.join(os.path.dirname(__file__), "templates")
 templates = Jinja2Templates(directory=templates_dir)
+templates.env.globals["asset"] = asset_url
 
 # Static assets (project root /static)
 STATIC_DIR = os.path.join(project_root, "static")
@@ -51,6 +87,9 @@ assets_dir = os.path.join(project_root, "assets")
 if os.path.isdir(assets_dir):
     app.mount("/assets", StaticFiles(directory=assets_dir), name="assets")
 
+# Assets con huella y precomprimidos (ver static_assets.py): las páginas apuntan acá
+app.mount(BUILD_URL, PrecompressedStaticFiles(directory=BUILD_DIR, pattern=FINGERPRINTED), name="build")
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -59,84 +98,104 @@ def health():
 def root():
     return RedirectResponse(url="/login")
 
-@app.get("/stats")
-def stats(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    from models import Client, Broadcast, Movement
-    from datetime import datetime, timedelta
-
-    # Métricas clásicas de clientes/difusiones
-    total_clientes = db.query(Client).count()
-    threshold = datetime.utcnow() - timedelta(days=30)
-    sin_contacto = db.query(Client).filter((Client.last_contact == None) | (Client.last_contact < threshold)).count()
-    enviados = db.query(Broadcast).filter(Broadcast.status == "sent").count()
-    programadas = db.query(Broadcast).filter(Broadcast.status == "scheduled").count()
-
-    # KPIs desde movimientos
-    movimientos = db.query(Movement).all()
-    ingresos_totales = float(sum(m.value or 0 for m in movimientos))
-
-    cutoff_30d = datetime.utcnow() - timedelta(days=30)
-    mov_30d = [m for m in movimientos if m.date and m.date >= cutoff_30d]
-    pedidos_30d = len(mov_30d)
-    ingresos_30d = float(sum(m.value or 0 for m in mov_30d))
-    ticket_promedio_30d = ingresos_30d / pedidos_30d if pedidos_30d else 0.0
-
-    # Clientes activos últimos 30 días (por contacto)
-    contactos_activos = { (m.contact or '').strip() for m in mov_30d if (m.contact or '').strip() }
-    clientes_activos_30d = len(contactos_activos)
-
-    return {
-        "clientes_totales": total_clientes,
-        "clientes_sin_contacto_30d": sin_contacto,
-        "difusiones_enviadas": enviados,
-        "difusiones_programadas": programadas,
-        "ingresos_totales": ingresos_totales,
-        "ingresos_30d": ingresos_30d,
-        "pedidos_30d": pedidos_30d,
-        "ticket_promedio_30d": ticket_promedio_30d,
-        "clientes_activos_30d": clientes_activos_30d,
-    }
+STATS_TABLES = ("clients", "broadcasts", "movements")
+
+def _stats(db: Session):
+    from models import Client, Broadcast
+    from datetime import datetime
+    from dashboard import period_start
+
+    now = datetime.utcnow()
+
+    def compute():
+        # Métricas clásicas de clientes/difusiones
+        total_clientes = db.query(Client).count()
+        threshold = period_start(now, 30)
+        sin_contacto = db.query(Client).filter((Client.last_contact == None) | (Client.last_contact < threshold)).count()
+        enviados = db.query(Broadcast).filter(Broadcast.status == "sent").count()
+        programadas = db.query(Broadcast).filter(Broadcast.status == "scheduled").count()
+
+        # KPIs desde movimientos (agregados en SQL)
+        kpis = movement_kpis(db, now)
+
+        return {
+            "clientes_totales": total_clientes,
+            "clientes_sin_contacto_30d": sin_contacto,
+            "difusiones_enviadas": enviados,
+            "difusiones_programadas": programadas,
+            **kpis,
+        }
+
+    # Las ventanas son de días UTC completos: el resultado depende de la fecha, no de la hora
+    return result_cache.get_or_compute(db, "stats", (now.date(),), STATS_TABLES, compute)
+
+# /stats y /dashboard son agregados en SQL con un resultado chico: van enteros
+# por la sesión del request (AsyncSession con DB_ASYNC=1, si no el threadpool)
+@app.get("/stats", dependencies=[Depends(conditional_get(*STATS_TABLES, period=86400))])
+async def stats(db: AsyncDB = Depends(get_async_read_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_stats)
+
+@app.get("/cache/stats")
+def cache_stats(user: str = Depends(get_current_user)):
+    # Aciertos/fallos del caché de resultados, para monitoreo
+    return result_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Formato de texto de Prometheus (por proceso)
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _dashboard(db: Session, days: int) -> dict:
+    return dashboard_summary(db, get_or_create_control_variables(db), days)
+
+@app.get("/dashboard", dependencies=[Depends(conditional_get(
+    "clients", "contact_rollups", "movements", "control_variables", period=86400
+))])
+async def dashboard(days: int = Query(30, ge=1, le=3650), db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    # Todo lo que pinta index.html en una sola respuesta chica (ver dashboard.py)
+    return await db.run_sync(_dashboard, days)
 
 @app.get("/home")
 def home():
     return RedirectResponse(url="/index.html")
 
 @app.get("/index.html")
-def serve_index():
-    return FileResponse(os.path.join(project_root, "index.html"), media_type="text/html")
+def serve_index(request: Request):
+    return page_response(request, "index.html")
 
 
 @app.get("/script.js")
-def serve_main_script():
-    return FileResponse(os.path.join(project_root, "script.js"), media_type="application/javascript")
+def serve_main_script(request: Request):
+    # URL vieja (HTML en caché de antes del build): revalida por ETag en vez de immutable
+    return page_response(request, "script.js", media_type="application/javascript; charset=utf-8")
 
 @app.get("/clients.html")
-def serve_clients():
-    return FileResponse(os.path.join(project_root, "clients.html"), media_type="text/html")
+def serve_clients(request: Request):
+    return page_response(request, "clients.html")
 
 @app.get("/broadcasts.html")
-def serve_broadcasts():
-    return FileResponse(os.path.join(project_root, "broadcasts.html"), media_type="text/html")
+def serve_broadcasts(request: Request):
+    return page_response(request, "broadcasts.html")
 
 @app.get("/nuevo-cliente.html")
-def serve_new_client():
-    return FileResponse(os.path.join(project_root, "nuevo-cliente.html"), media_type="text/html")
+def serve_new_client(request: Request):
+    return page_response(request, "nuevo-cliente.html")
 
 @app.get("/tablero")
-def serve_tablero():
-    return FileResponse(os.path.join(project_root, "tablero.html"), media_type="text/html")
+def serve_tablero(request: Request):
+    return page_response(request, "tablero.html")
 
 @app.get("/NuevoCliente")
-def serve_new_client_pretty():
-    return FileResponse(os.path.join(project_root, "nuevo-cliente.html"), media_type="text/html")
+def serve_new_client_pretty(request: Request):
+    return page_response(request, "nuevo-cliente.html")
 
 @app.get("/Clientes")
-def serve_clients_pretty():
-    return FileResponse(os.path.join(project_root, "clients.html"), media_type="text/html")
+def serve_clients_pretty(request: Request):
+    return page_response(request, "clients.html")
 
 @app.get("/Tablero")
-def serve_tablero_pretty():
-    return FileResponse(os.path.join(project_root, "tablero.html"), media_type="text/html")
+def serve_tablero_pretty(request: Request):
+    return page_response(request, "tablero.html")
 
 @app.get("/Difusiones")
 def serve_broadcasts_pretty():
@@ -144,8 +203,8 @@ def serve_broadcasts_pretty():
 
 
 @app.get("/churn-view")
-def serve_churn_view():
-    return FileResponse(os.path.join(project_root, "churn.html"), media_type="text/html")
+def serve_churn_view(request: Request):
+    return page_response(request, "churn.html")
 
 @app.get("/me")
 def me(user: str = Depends(get_current_user)):
@@ -154,24 +213,39 @@ def me(user: str = Depends(get_current_user)):
 # Broadcasts views (HTML)
 @app.get("/difusiones", response_class=HTMLResponse)
 def difusiones_view(request: Request):
-    return templates.TemplateResponse("difusiones.html", {"request": request})
+    return render_template(templates, request, "difusiones.html")
 
 @app.get("/difusiones/nueva", response_class=HTMLResponse)
 def difusiones_new_view(request: Request):
-    return templates.TemplateResponse("difusiones_form.html", {"request": request, "mode": "create"})
+    return render_template(templates, request, "difusiones_form.html", {"mode": "create"})
 
 @app.get("/difusiones/editar/{broadcast_id}", response_class=HTMLResponse)
 def difusiones_edit_view(broadcast_id: int, request: Request):
-    return templates.TemplateResponse("difusiones_form.html", {"request": request, "mode": "edit", "broadcast_id": broadcast_id})
+    return render_template(templates, request, "difusiones_form.html", {"mode": "edit", "broadcast_id": broadcast_id})
 
 # Routers
 app.include_router(auth_router, prefix="", tags=["auth"])  # /login
-app.include_router(clients_router, prefix="/clientes", tags=["clientes"])  # CRUD + filtrar
-app.include_router(movements_router, prefix="/movimientos", tags=["movimientos"])  # movimientos de ventas/gastos
-app.include_router(broadcasts_router, prefix="/difusiones", tags=["difusiones"])  # crear/listar/programar
+app.include_router(
+    clients_router, prefix="/clientes", tags=["clientes"],
+    dependencies=[Depends(conditional_get("clients", "tags", "client_tags"))],
+)  # CRUD + filtrar
+app.include_router(
+    movements_router, prefix="/movimientos", tags=["movimientos"],
+    dependencies=[Depends(conditional_get("movements", "revenue_buckets"))],
+)  # movimientos de ventas/gastos
+app.include_router(
+    broadcasts_router, prefix="/difusiones", tags=["difusiones"],
+    dependencies=[Depends(conditional_get("broadcasts", "broadcast_recipients"))],
+)  # crear/listar/programar
 app.include_router(uploads_router, prefix="", tags=["uploads"])  # /upload-image
 app.include_router(whatsapp_router, prefix="", tags=["whatsapp"])  # /whatsapp/send
-app.include_router(churn_router, prefix="/churn", tags=["churn"])  # métricas de churn
+app.include_router(
+    churn_router, prefix="/churn", tags=["churn"],
+    # `today` entra en la clasificación: el ETag cambia a medianoche UTC
+    dependencies=[Depends(conditional_get(
+        "movements", "contact_rollups", "control_variables", "control_frequencies", period=86400
+    ))],
+)  # métricas de churn
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
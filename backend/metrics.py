@@ -0,0 +1,246 @@
+"""Métricas en proceso: latencia y tamaño de respuesta por ruta, y SQL por request.
+
+`MetricsMiddleware` (ASGI puro, no rompe el streaming) mide cada request y la
+etiqueta con la plantilla de la ruta (`/clientes/{client_id}`, no el id), así
+la cantidad de series no crece con los datos. Los eventos de `Engine` suman
+consultas, filas leídas/escritas y tiempo de SQL al request en curso (vía
+contextvar, que también llega al threadpool y a `run_sync`). Todo se expone en
+formato de texto Prometheus en `/metrics` y, opcionalmente, en el header
+`Server-Timing` para verlo desde las devtools del navegador.
+
+Los contadores son por proceso: con varios workers, Prometheus suma las series
+de cada uno.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+UNMATCHED = "<sin ruta>"
+
+
+class RequestStats:
+    __slots__ = ("queries", "rows", "sql_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.sql_seconds = 0.0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (method, route, status) -> histogramas / contadores
+        self.latency: Dict[Tuple[str, str, str], Histogram] = {}
+        self.size: Dict[Tuple[str, str, str], Histogram] = {}
+        # (method, route) -> [consultas, filas, segundos]
+        self.sql: Dict[Tuple[str, str], list] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, size: int, stats: RequestStats):
+        key = (method, route, str(status))
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.size.setdefault(key, Histogram(SIZE_BUCKETS)).observe(size)
+            totals = self.sql.setdefault((method, route), [0, 0, 0.0])
+            totals[0] += stats.queries
+            totals[1] += stats.rows
+            totals[2] += stats.sql_seconds
+
+    def clear(self):
+        with self._lock:
+            self.latency.clear()
+            self.size.clear()
+            self.sql.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            _histogram_lines(lines, "http_request_duration_seconds", "Latencia de los requests por ruta", self.latency)
+            _histogram_lines(lines, "http_response_size_bytes", "Tamaño del cuerpo de la respuesta por ruta", self.size)
+            for index, (name, help_) in enumerate((
+                ("db_queries_total", "Consultas SQL ejecutadas por ruta"),
+                ("db_rows_total", "Filas leídas o escritas por ruta"),
+                ("db_query_seconds_total", "Tiempo en SQL por ruta"),
+            )):
+                lines.append(f"# HELP {name} {help_}")
+                lines.append(f"# TYPE {name} counter")
+                for (method, route), totals in sorted(self.sql.items()):
+                    lines.append(f"{name}{_labels(method=method, route=route)} {_number(totals[index])}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(lines: list, name: str, help_: str, series: Dict[Tuple[str, str, str], Histogram]):
+    lines.append(f"# HELP {name} {help_}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route, status), h in sorted(series.items()):
+        cumulative = 0
+        for bound, n in zip((*h.buckets, "+Inf"), h.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, status=status, le=str(bound))} {cumulative}")
+        labels = _labels(method=method, route=route, status=status)
+        lines.append(f"{name}_sum{labels} {_number(h.sum)}")
+        lines.append(f"{name}_count{labels} {h.count}")
+
+
+registry = Registry()
+
+
+# --- SQL: eventos sobre la clase Engine (cubre el engine sync, el de lectura y el async)
+
+class _CountingCursor:
+    """Envuelve el cursor DBAPI para contar las filas que efectivamente se leen."""
+
+    __slots__ = ("_cursor", "_stats")
+
+    def __init__(self, cursor, stats: RequestStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.rows += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    starts = conn.info.get("metrics_start")
+    if stats is None or not starts:
+        return
+    stats.sql_seconds += time.perf_counter() - starts.pop()
+    stats.queries += 1
+    if cursor.description is None:
+        # Escritura: el driver informa las filas afectadas
+        stats.rows += max(cursor.rowcount, 0)
+    elif context is not None:
+        # Lectura: el resultado se arma con context.cursor después de este evento
+        context.cursor = _CountingCursor(cursor, stats)
+
+
+# --- Middleware
+
+# endpoint -> plantilla de ruta (se resuelve una vez por endpoint)
+_route_labels: Dict[Any, str] = {}
+
+
+def _route_label(scope) -> str:
+    """Plantilla de la ruta que atendió el request (Starlette deja el endpoint en el scope)."""
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return UNMATCHED
+    label = _route_labels.get(endpoint)
+    if label is None:
+        label = UNMATCHED
+        for route in app.router.routes:
+            if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+                label = route.path
+                break
+        _route_labels[endpoint] = label
+    return label
+
+
+def server_timing(total: float, stats: RequestStats) -> str:
+    return (
+        f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.queries} consultas, {stats.rows} filas", '
+        f"app;dur={total * 1000:.1f}"
+    )
+
+
+class MetricsMiddleware:
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    # Al empezar la respuesta: en streaming cubre sólo hasta el primer byte
+                    header = server_timing(time.perf_counter() - start, stats).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            registry.observe(scope["method"], _route_label(scope), status, time.perf_counter() - start, size, stats)
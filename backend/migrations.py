@@ -0,0 +1,145 @@
+"""Migraciones livianas e idempotentes.
+
+`Base.metadata.create_all` sólo crea tablas nuevas: los índices o columnas que
+se agregan a tablas existentes hay que crearlos a mano. Todo lo de acá se puede
+correr en cada arranque sin efectos si la base ya está al día.
+"""
+import json
+
+from sqlalchemy import Column, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database import Base
+from contacts import backfill_contact_keys
+from models import Broadcast, BroadcastRecipient, Client, ContactRollup, Movement, RevenueBucket, free_natural_keys
+from rollups import ensure_contact_rollups
+from search import ensure_client_search
+from tags import backfill_client_tags
+from users import ensure_admin_user
+from versions import ensure_data_versions
+
+BACKFILL_BATCH = 1000
+
+
+def add_column_if_missing(engine: Engine, column: Column):
+    table = column.table.name
+    existing = {c["name"] for c in inspect(engine).get_columns(table)}
+    if column.name in existing:
+        return
+    ddl_type = column.type.compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {ddl_type}"))
+
+
+def ensure_columns(engine: Engine):
+    add_column_if_missing(engine, Movement.__table__.c.natural_key)
+    add_column_if_missing(engine, Broadcast.__table__.c.claimed_at)
+    add_column_if_missing(engine, Movement.__table__.c.contact_key)
+    add_column_if_missing(engine, Movement.__table__.c.client_id)
+    add_column_if_missing(engine, Client.__table__.c.contact_key)
+
+
+def ensure_contact_rollup_key(engine: Engine):
+    """El rollup por contacto pasó a tener PK `contact_key`: la tabla vieja se
+    descarta y `ensure_contact_rollups` la reconstruye desde movements."""
+    table = ContactRollup.__table__
+    existing = {c["name"] for c in inspect(engine).get_columns(table.name)}
+    if "contact_key" not in existing:
+        table.drop(engine)
+        table.create(engine)
+
+
+def ensure_revenue_bucket_keys(engine: Engine):
+    """El sketch de `revenue_buckets` pasó a contar `contact_key` y no el texto
+    del contacto: la tabla vieja (columna `contacts_hll`) se descarta y
+    `ensure_contact_rollups` la reconstruye desde movements."""
+    table = RevenueBucket.__table__
+    existing = {c["name"] for c in inspect(engine).get_columns(table.name)}
+    if "contact_keys_hll" not in existing:
+        table.drop(engine)
+        table.create(engine)
+
+
+def ensure_indexes(engine: Engine):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def backfill_natural_keys(db: Session):
+    while True:
+        rows = db.execute(
+            select(Movement.id, Movement.date, Movement.contact, Movement.value, Movement.description)
+            .where(Movement.natural_key.is_(None))
+            .order_by(Movement.id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            return
+        keys = free_natural_keys(db, rows)
+        db.execute(update(Movement), [{"id": r.id, "natural_key": k} for r, k in zip(rows, keys)])
+        db.commit()
+
+
+def ensure_unique_natural_key(engine: Engine):
+    """La clave natural pasó a ser única (con un número de repetición para los
+    movimientos idénticos). Si el índice viejo no es único, las repeticiones
+    existentes se renumeran conservando la clave de la fila de menor id."""
+    index = next(i for i in Movement.__table__.indexes if i.name == "ix_movements_natural_key")
+    found = {i["name"]: i for i in inspect(engine).get_indexes(Movement.__tablename__)}
+    if index.name not in found or found[index.name]["unique"]:
+        return
+    with Session(engine) as db:
+        keep = (
+            select(func.min(Movement.id))
+            .where(Movement.natural_key.is_not(None))
+            .group_by(Movement.natural_key)
+        )
+        db.execute(
+            update(Movement)
+            .where(Movement.natural_key.is_not(None), Movement.id.not_in(keep))
+            .values(natural_key=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        backfill_natural_keys(db)
+    index.drop(engine)
+    index.create(engine)
+
+
+def migrate_broadcast_recipients(db: Session):
+    """Pasa `Broadcast.recipients_json` a la tabla broadcast_recipients."""
+    pending = db.execute(
+        select(Broadcast.id, Broadcast.recipients_json)
+        .where(Broadcast.recipients_json.is_not(None), Broadcast.recipients_json.not_in(["", "[]"]))
+    ).all()
+    for broadcast_id, raw in pending:
+        already = db.execute(
+            select(BroadcastRecipient.id).where(BroadcastRecipient.broadcast_id == broadcast_id).limit(1)
+        ).first()
+        phones = json.loads(raw or "[]")
+        if not already and phones:
+            db.execute(
+                insert(BroadcastRecipient),
+                [{"broadcast_id": broadcast_id, "position": i, "phone": p} for i, p in enumerate(phones)],
+            )
+        db.execute(update(Broadcast).where(Broadcast.id == broadcast_id).values(recipients_json="[]"))
+    db.commit()
+
+
+def run_migrations(engine: Engine):
+    ensure_columns(engine)
+    ensure_contact_rollup_key(engine)
+    ensure_revenue_bucket_keys(engine)
+    ensure_unique_natural_key(engine)
+    ensure_indexes(engine)
+    ensure_client_search(engine)
+    with Session(engine) as db:
+        ensure_data_versions(db)
+        backfill_natural_keys(db)
+        migrate_broadcast_recipients(db)
+        backfill_client_tags(db)
+        backfill_contact_keys(db)
+        ensure_contact_rollups(db)
+        ensure_admin_user(db)
@@ -1,4 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float
+import hashlib
+import unicodedata
+from typing import List, Optional
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, Float, Index, ForeignKey, LargeBinary, UniqueConstraint, event, select
+from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 from database import Base
 
@@ -14,9 +18,30 @@ class Client(Base):
     next_action = Column(DateTime, nullable=True)
     notes = Column(Text, default="")
     zone = Column(String(255), default="")
+    # normalize_contact(name): con esto se vinculan los movimientos (Movement.client_id)
+    contact_key = Column(String(255), nullable=True, index=True)
     created_at = Column(DateTime, server_default=func.now())
 
 
+class Tag(Base):
+    __tablename__ = "tags"
+    id = Column(Integer, primary_key=True, index=True)
+    # Normalizado (minúsculas, sin espacios de más); ver tags.normalize_tag
+    name = Column(String(100), nullable=False, unique=True)
+
+
+class ClientTag(Base):
+    """Relación cliente-etiqueta; `Client.tags` queda como copia para mostrar."""
+    __tablename__ = "client_tags"
+    client_id = Column(Integer, ForeignKey("clients.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        # La PK cubre "etiquetas de un cliente"; este cubre "clientes de una etiqueta" y los conteos
+        Index("ix_client_tags_tag_client", "tag_id", "client_id"),
+    )
+
+
 class ControlVariables(Base):
     __tablename__ = "control_variables"
     id = Column(Integer, primary_key=True, index=True)
@@ -51,21 +76,234 @@ class Movement(Base):
     expense_category = Column(String(255), default="")
     # Contacto (cliente)
     contact = Column(String(255), nullable=False)
+    # normalize_contact(contact): agrupa "José Pérez" y " jose  perez" como el mismo contacto
+    contact_key = Column(String(255), nullable=True)
+    # Cliente con el mismo contact_key (el de menor id), si está cargado; ver contacts.py
+    client_id = Column(Integer, ForeignKey("clients.id", ondelete="SET NULL"), nullable=True)
     # Estado (Pagada, Pendiente, etc.)
     status = Column(String(50), default="")
     # Medio de pago
     payment_method = Column(String(50), default="")
     # Valor del movimiento
     value = Column(Float, nullable=False)
+    # Hash de (fecha, contacto, valor, descripción, repetición): deduplica re-importaciones
+    natural_key = Column(String(40), nullable=True, index=True, unique=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, onupdate=func.now())
 
+    __table_args__ = (
+        # Cubre los KPIs por ventana de fechas (/stats) sin tocar la tabla
+        Index("ix_movements_date_contact_value", "date", "contact", "value"),
+        # Listado paginado por (date, id), con o sin filtro por columna
+        Index("ix_movements_date_id", "date", "id"),
+        Index("ix_movements_contact_date_id", "contact", "date", "id"),
+        Index("ix_movements_type_date_id", "type", "date", "id"),
+        Index("ix_movements_seller_date_id", "seller", "date", "id"),
+        Index("ix_movements_status_date_id", "status", "date", "id"),
+        # Agregados por contacto (rollup, churn) y movimientos de un cliente
+        Index("ix_movements_contact_key_date", "contact_key", "date"),
+        Index("ix_movements_client_date_id", "client_id", "date", "id"),
+    )
+
+
+def normalize_contact(contact: Optional[str]) -> str:
+    """Clave de contacto: sin tildes, en minúsculas y con espacios simples.
+
+    "  José  PÉREZ " -> "jose perez". Vacío si no hay contacto.
+    """
+    decomposed = unicodedata.normalize("NFKD", contact or "")
+    plain = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(plain.casefold().split())
+
+
+def movement_natural_key(date, contact, value, description, occurrence: int = 0) -> str:
+    """Clave natural de un movimiento; `occurrence` distingue movimientos idénticos
+    (la segunda venta igual del mismo día es la repetición 1). La repetición 0
+    da la misma clave que antes de existir el parámetro."""
+    parts = [
+        date.isoformat() if date else "",
+        (contact or "").strip(),
+        repr(float(value or 0)),
+        (description or "").strip(),
+    ]
+    if occurrence:
+        parts.append(f"#{occurrence}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def free_natural_keys(db: Session, rows) -> List[str]:
+    """Clave natural de cada fila con la primera repetición libre, en la base y en el lote.
+
+    Cargar a mano dos movimientos iguales es válido: el segundo queda como la repetición 1.
+    """
+    occurrence = [0] * len(rows)
+    keys: List[Optional[str]] = [None] * len(rows)
+    taken = set()
+    pending = list(range(len(rows)))
+    while pending:
+        candidates = {
+            i: movement_natural_key(rows[i].date, rows[i].contact, rows[i].value, rows[i].description, occurrence[i])
+            for i in pending
+        }
+        existing = set(db.execute(
+            select(Movement.natural_key).where(Movement.natural_key.in_(set(candidates.values())))
+        ).scalars())
+        retry = []
+        for i in pending:
+            key = candidates[i]
+            if key in existing or key in taken:
+                occurrence[i] += 1
+                retry.append(i)
+            else:
+                keys[i] = key
+                taken.add(key)
+        pending = retry
+    return keys
+
+
+@event.listens_for(Session, "before_flush")
+def _fill_natural_keys(session, flush_context, instances):
+    new = [obj for obj in session.new if isinstance(obj, Movement) and not obj.natural_key]
+    if new:
+        with session.no_autoflush:
+            for obj, key in zip(new, free_natural_keys(session, new)):
+                obj.natural_key = key
+
+
+@event.listens_for(Movement, "before_insert")
+def _fill_movement_contact_key(mapper, connection, target):
+    if target.contact_key is None:
+        target.contact_key = normalize_contact(target.contact)
+
+
+@event.listens_for(Client, "before_insert")
+@event.listens_for(Client, "before_update")
+def _fill_client_contact_key(mapper, connection, target):
+    target.contact_key = normalize_contact(target.name)
+
+
+class ContactRollup(Base):
+    """Agregado por contacto que alimenta /churn/ (se mantiene al escribir movimientos)."""
+    __tablename__ = "contact_rollups"
+    # Movement.contact_key del grupo ("" = sin contacto)
+    contact_key = Column(String(255), primary_key=True)
+    # Nombre para mostrar: el menor contact.strip() del grupo, o "(sin contacto)"
+    contact = Column(String(255), nullable=False)
+    first_order = Column(DateTime, nullable=False)
+    last_order = Column(DateTime, nullable=False)
+    order_count = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        # Contactos con pedidos en el período del dashboard
+        Index("ix_contact_rollups_last_order", "last_order"),
+        # Orden de /churn/ y su exportación
+        Index("ix_contact_rollups_contact", "contact", "contact_key"),
+    )
+
+    @property
+    def span_days(self) -> int:
+        # Días entre el primer y el último pedido, base de la frecuencia
+        return (self.last_order.date() - self.first_order.date()).days
+
+
+class RevenueBucket(Base):
+    """Movimientos agregados por día o mes y por tipo/vendedor/medio de pago/categoría.
+
+    Se mantiene junto con `contact_rollups` en cada escritura de movimientos;
+    `contact_keys_hll` es un sketch HyperLogLog (ver hll.py) de los
+    `contact_key` de sus movimientos.
+    """
+    __tablename__ = "revenue_buckets"
+    id = Column(Integer, primary_key=True, index=True)
+    grain = Column(String(10), nullable=False)  # day|month
+    bucket_start = Column(DateTime, nullable=False)
+    # Dimensiones normalizadas con strip(); "" si venían vacías
+    type = Column(String(50), nullable=False, default="")
+    seller = Column(String(255), nullable=False, default="")
+    payment_method = Column(String(50), nullable=False, default="")
+    expense_category = Column(String(255), nullable=False, default="")
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+    contact_keys_hll = Column(LargeBinary, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "grain", "bucket_start", "type", "seller", "payment_method", "expense_category",
+            name="uq_revenue_buckets_key",
+        ),
+    )
+
+
+class User(Base):
+    """Usuario del panel: un administrador o un vendedor (ver users.py)."""
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(100), nullable=False, unique=True)
+    # "pbkdf2_sha256$<iteraciones>$<sal>$<hash>", nunca la contraseña
+    password_hash = Column(String(255), nullable=False)
+    role = Column(String(20), nullable=False, default="seller")  # admin|seller
+    # Nombre con el que figura en Movement.seller / Client.owner
+    seller = Column(String(255), nullable=True)
+    active = Column(Boolean, nullable=False, default=True)
+    # Va en cada token: incrementarla invalida todos los tokens ya emitidos
+    token_version = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class DataVersion(Base):
+    """Contador por tabla que se incrementa en cada commit que la modifica (ver versions.py)."""
+    __tablename__ = "data_versions"
+    table_name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
 class Broadcast(Base):
     __tablename__ = "broadcasts"
     id = Column(Integer, primary_key=True, index=True)
     message = Column(Text, default="")
     image_url = Column(String(500), nullable=True)
-    recipients_json = Column(Text, default="[]")  # JSON list of phones
+    # Obsoleto: los destinatarios viven en broadcast_recipients (se migra al arrancar)
+    recipients_json = Column(Text, default="[]")
     scheduled_time = Column(DateTime, nullable=True)
-    status = Column(String(50), default="draft")  # draft|scheduled|sent|failed
+    status = Column(String(50), default="draft")  # draft|scheduled|sending|sent|failed|expired
+    # Lease del scheduler mientras la difusión está "sending"
+    claimed_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # El scheduler busca las vencidas por (status, scheduled_time) sin recorrer la tabla
+        Index("ix_broadcasts_status_scheduled_time", "status", "scheduled_time"),
+    )
+
+
+class BroadcastRecipient(Base):
+    __tablename__ = "broadcast_recipients"
+    id = Column(Integer, primary_key=True, index=True)
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.id", ondelete="CASCADE"), nullable=False)
+    # Orden en que se cargó el destinatario
+    position = Column(Integer, nullable=False, default=0)
+    phone = Column(String(50), nullable=False)
+
+    __table_args__ = (
+        Index("ix_broadcast_recipients_broadcast_position", "broadcast_id", "position"),
+        # "¿A qué difusiones fue este teléfono?"
+        Index("ix_broadcast_recipients_phone", "phone"),
+    )
+
+
+class BroadcastDelivery(Base):
+    """Estado de envío por destinatario de una difusión programada."""
+    __tablename__ = "broadcast_deliveries"
+    id = Column(Integer, primary_key=True, index=True)
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.id", ondelete="CASCADE"), nullable=False)
+    phone = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending|sent|failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("broadcast_id", "phone", name="uq_broadcast_deliveries_broadcast_phone"),
+        Index("ix_broadcast_deliveries_broadcast_status", "broadcast_id", "status"),
+    )
@@ -0,0 +1,127 @@
+"""Caché en proceso de resultados caros (/churn/, /stats).
+
+LRU acotado por cantidad de entradas y con TTL. La clave incluye la versión
+(`data_versions`) de cada tabla de la que depende el resultado, así que un
+worker nunca sirve datos viejos aunque la escritura la haya hecho otro. Además
+cada entrada recuerda sus tablas: cuando un commit de este proceso toca alguna,
+la entrada se descarta en el momento (p. ej. cambiar las variables de control
+borra el churn pero no /stats). Las entradas vencen como tarde a la medianoche
+UTC, porque los cálculos usan la fecha de hoy.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional, Set, Tuple
+
+from fastapi import Response
+from sqlalchemy.orm import Session
+
+from versions import get_versions, on_tables_committed
+
+CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "64"))
+CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL", "600"))
+
+
+def seconds_until_midnight_utc(now: Optional[datetime] = None) -> float:
+    now = now or datetime.utcnow()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds()
+
+
+class ResultCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # clave -> (vence (monotonic), tablas, valor)
+        self._entries: "OrderedDict[Hashable, Tuple[float, frozenset, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _key(self, name: str, params: Hashable, tables: Tuple[str, ...], versions: dict) -> Hashable:
+        return (name, params, tuple(versions[t] for t in tables))
+
+    def _lookup(self, key: Hashable, now: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+        return False, None
+
+    def _store(self, key: Hashable, tables: Tuple[str, ...], value: Any, now: float):
+        expires = now + min(self.ttl, seconds_until_midnight_utc())
+        with self._lock:
+            self._entries[key] = (expires, frozenset(tables), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, db: Session, name: str, params: Hashable, tables: Iterable[str], compute: Callable[[], Any]):
+        tables = tuple(tables)
+        key = self._key(name, params, tables, get_versions(db, tables))
+        now = time.monotonic()
+        hit, value = self._lookup(key, now)
+        if hit:
+            return value
+        # Se calcula fuera del lock: dos misses simultáneos calculan dos veces, sin bloquear al resto
+        value = compute()
+        self._store(key, tables, value, now)
+        return value
+
+    async def get_or_compute_async(
+        self, db, name: str, params: Hashable, tables: Iterable[str], compute: Callable[[], Awaitable[Any]],
+    ):
+        """Igual que `get_or_compute` para endpoints async: `db` es un AsyncDB y `compute` una corrutina."""
+        tables = tuple(tables)
+        key = self._key(name, params, tables, await db.run_sync(get_versions, tables))
+        now = time.monotonic()
+        hit, value = self._lookup(key, now)
+        if hit:
+            return value
+        value = await compute()
+        self._store(key, tables, value, now)
+        return value
+
+    def invalidate_tables(self, tables: Set[str]):
+        with self._lock:
+            stale = [k for k, (_, deps, _) in self._entries.items() if deps & tables]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def json_response(body: bytes, response: Response) -> Response:
+    """Respuesta con JSON ya serializado (cacheado), con los headers que pusieron las dependencias (ETag)."""
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
+
+
+result_cache = ResultCache()
+on_tables_committed(result_cache.invalidate_tables)
@@ -0,0 +1,410 @@
+"""Rollups mantenidos en cada escritura de movimientos.
+
+`contact_rollups` guarda, por `contact_key` (ver contacts.py), lo que /churn/
+necesita (primer y último pedido, cantidad y facturación) para no recorrer
+todos los movimientos en cada request. `revenue_buckets` guarda suma, cantidad y un sketch de
+claves de contacto por día y por mes para cada combinación de tipo, vendedor, medio de
+pago y categoría (series y comparaciones de períodos). Si los rollups se
+desalinean de los datos fuente se reconstruyen con `python rollups.py`.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import hll
+from database import SessionLocal
+from models import ContactRollup, Movement, RevenueBucket, normalize_contact
+
+SIN_CONTACTO = "(sin contacto)"
+# Claves por consulta IN al leer rollups existentes
+IN_BATCH = 500
+# Filas de movements por bloque al reconstruir los buckets
+REBUILD_BATCH = 20000
+
+GRAINS = ("day", "month")
+DIMENSIONS = ("type", "seller", "payment_method", "expense_category")
+
+
+class MovementRow(NamedTuple):
+    contact: Optional[str]
+    date: Optional[datetime]
+    value: Optional[float]
+    type: Optional[str] = ""
+    seller: Optional[str] = ""
+    payment_method: Optional[str] = ""
+    expense_category: Optional[str] = ""
+    contact_key: Optional[str] = None
+
+
+# (grain, inicio del bucket, tipo, vendedor, medio de pago, categoría)
+BucketKey = Tuple[str, datetime, str, str, str, str]
+
+
+def display_contact(contact: str | None) -> str:
+    return (contact or "").strip() or SIN_CONTACTO
+
+
+def row_contact_key(row: MovementRow) -> str:
+    # Las filas de un insert core recién armado pueden no traer la clave todavía
+    return row.contact_key if row.contact_key is not None else normalize_contact(row.contact)
+
+
+def movement_row(m) -> MovementRow:
+    """Fila para los rollups desde un Movement o un dict con sus columnas."""
+    get = m.get if isinstance(m, dict) else lambda f: getattr(m, f)
+    return MovementRow(*(get(f) for f in MovementRow._fields))
+
+
+def bucket_start(grain: str, when: datetime) -> datetime:
+    if grain == "month":
+        return datetime(when.year, when.month, 1)
+    return datetime(when.year, when.month, when.day)
+
+
+def bucket_end(grain: str, start: datetime) -> datetime:
+    if grain == "month":
+        return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return datetime.fromordinal(start.toordinal() + 1)
+
+
+def _dimension(value: Optional[str]) -> str:
+    return (value or "").strip()
+
+
+def display_column():
+    # Mismo criterio que display_contact() sobre el grupo, del lado SQL
+    name = func.coalesce(func.min(func.trim(Movement.contact)), "")
+    return case((name == "", SIN_CONTACTO), else_=name)
+
+
+def _recompute_group(db: Session, key: str):
+    first, last, name = db.execute(
+        select(func.min(Movement.date), func.max(Movement.date), display_column())
+        .where(Movement.contact_key == key)
+    ).one()
+    db.execute(
+        update(ContactRollup).where(ContactRollup.contact_key == key)
+        .values(first_order=first, last_order=last, contact=name)
+    )
+
+
+def _least(current, new):
+    return case((new < current, new), else_=current)
+
+
+def _greatest(current, new):
+    return case((new > current, new), else_=current)
+
+
+def upsert(db: Session, table):
+    """INSERT … ON CONFLICT del dialecto en uso (SQLite o PostgreSQL)."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(table)
+
+
+def apply_movements(db: Session, rows: Iterable[MovementRow], sign: int = 1):
+    """Suma (sign=1) o resta (sign=-1) movimientos a los rollups.
+
+    Las cantidades y sumas se incrementan en SQL (upsert), así dos escrituras
+    concurrentes no se pisan. Al restar, los movimientos ya tienen que estar
+    borrados (flush) para que el recálculo de primer/último pedido y de los
+    sketches no los vea. No hace commit.
+    """
+    rows = [r for r in rows if r.date is not None]
+    _apply_contact_rollups(db, rows, sign)
+    _apply_revenue_buckets(db, rows, sign)
+    db.flush()
+
+
+def _apply_contact_rollups(db: Session, rows: List[MovementRow], sign: int):
+    deltas: dict[str, list] = {}
+    for r in rows:
+        key = row_contact_key(r)
+        name = display_contact(r.contact)
+        d = deltas.get(key)
+        if d is None:
+            deltas[key] = [1, float(r.value or 0), r.date, r.date, name]
+        else:
+            d[0] += 1
+            d[1] += float(r.value or 0)
+            d[2] = min(d[2], r.date)
+            d[3] = max(d[3], r.date)
+            d[4] = min(d[4], name)
+    if not deltas:
+        return
+    table = ContactRollup.__table__
+
+    if sign > 0:
+        stmt = upsert(db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.contact_key],
+            set_={
+                "order_count": table.c.order_count + stmt.excluded.order_count,
+                "total_value": table.c.total_value + stmt.excluded.total_value,
+                "first_order": _least(table.c.first_order, stmt.excluded.first_order),
+                "last_order": _greatest(table.c.last_order, stmt.excluded.last_order),
+                "contact": _least(table.c.contact, stmt.excluded.contact),
+            },
+        )
+        db.execute(stmt, [
+            dict(contact_key=key, contact=name, first_order=first, last_order=last, order_count=count, total_value=total)
+            for key, (count, total, first, last, name) in deltas.items()
+        ])
+        return
+
+    # Primero la resta en SQL (toma el lock de escritura); después se lee lo que quedó
+    db.execute(
+        update(table).where(table.c.contact_key == bindparam("key")).values(
+            order_count=table.c.order_count - bindparam("count"),
+            total_value=table.c.total_value - bindparam("total"),
+        ),
+        [{"key": key, "count": d[0], "total": d[1]} for key, d in deltas.items()],
+    )
+    keys = list(deltas)
+    for i in range(0, len(keys), IN_BATCH):
+        batch = keys[i:i + IN_BATCH]
+        db.execute(delete(table).where(table.c.contact_key.in_(batch), table.c.order_count <= 0))
+        for key, first_order, last_order, contact in db.execute(
+            select(table.c.contact_key, table.c.first_order, table.c.last_order, table.c.contact)
+            .where(table.c.contact_key.in_(batch))
+        ):
+            _, _, first, last, name = deltas[key]
+            if first <= first_order or last >= last_order or name == contact:
+                _recompute_group(db, key)
+
+
+def _revenue_deltas(rows: Iterable[MovementRow]) -> Dict[BucketKey, list]:
+    """{bucket: [cantidad, suma, contactos]} para los buckets día y mes de cada fila."""
+    deltas: Dict[BucketKey, list] = {}
+    for r in rows:
+        dims = (_dimension(r.type), _dimension(r.seller), _dimension(r.payment_method), _dimension(r.expense_category))
+        contact = row_contact_key(r)
+        for grain in GRAINS:
+            key = (grain, bucket_start(grain, r.date)) + dims
+            d = deltas.get(key)
+            if d is None:
+                d = deltas[key] = [0, 0.0, set()]
+            d[0] += 1
+            d[1] += float(r.value or 0)
+            if contact:
+                d[2].add(contact)
+    return deltas
+
+
+_BUCKET_COLUMNS = (
+    RevenueBucket.grain, RevenueBucket.bucket_start, RevenueBucket.type, RevenueBucket.seller,
+    RevenueBucket.payment_method, RevenueBucket.expense_category,
+)
+
+
+def _load_buckets(db: Session, keys: Iterable[BucketKey], for_update: bool = False) -> Dict[BucketKey, tuple]:
+    """{clave: (id, cantidad, suma, sketch)} de los buckets existentes.
+
+    Con `for_update` las filas quedan bloqueadas hasta el commit (en SQLite no
+    hace falta: el upsert previo ya tomó el lock de escritura de la base).
+    """
+    starts: Dict[str, set] = {}
+    for key in keys:
+        starts.setdefault(key[0], set()).add(key[1])
+    current = {}
+    for grain, values in starts.items():
+        values = sorted(values)
+        for i in range(0, len(values), IN_BATCH):
+            batch = values[i:i + IN_BATCH]
+            stmt = (
+                select(*_BUCKET_COLUMNS, RevenueBucket.id, RevenueBucket.count, RevenueBucket.total, RevenueBucket.contact_keys_hll)
+                .where(RevenueBucket.grain == grain, RevenueBucket.bucket_start.in_(batch))
+            )
+            if for_update:
+                stmt = stmt.with_for_update()
+            for row in db.execute(stmt):
+                current[tuple(row[:6])] = tuple(row[6:])
+    return current
+
+
+def _bucket_contacts(db: Session, key: BucketKey) -> List[str]:
+    """Claves de contacto de los movimientos que hoy caen en el bucket (para rehacer el sketch)."""
+    grain, start = key[:2]
+    conditions = [Movement.date >= start, Movement.date < bucket_end(grain, start), Movement.contact_key != ""]
+    for dim, value in zip(DIMENSIONS, key[2:]):
+        conditions.append(func.coalesce(func.trim(getattr(Movement, dim)), "") == value)
+    return list(db.execute(select(Movement.contact_key).where(and_(*conditions)).distinct()).scalars())
+
+
+def _apply_revenue_buckets(db: Session, rows: List[MovementRow], sign: int):
+    # Con core y executemany: un import toca cientos de buckets por bloque
+    deltas = _revenue_deltas(rows)
+    if not deltas:
+        return
+    table = RevenueBucket.__table__
+    key_names = ("grain", "bucket_start") + DIMENSIONS
+
+    # Cantidad y suma se ajustan en SQL; esa escritura toma el lock antes de leer los sketches
+    if sign > 0:
+        sketches = {key: hll.add(hll.empty(), d[2]) for key, d in deltas.items()}
+        stmt = upsert(db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in key_names],
+            set_={"count": table.c.count + stmt.excluded.count, "total": table.c.total + stmt.excluded.total},
+        )
+        db.execute(stmt, [
+            dict(zip(key_names, key), count=count, total=total, contact_keys_hll=hll.to_bytes(sketches[key]))
+            for key, (count, total, _) in deltas.items()
+        ])
+    else:
+        db.execute(
+            update(table)
+            .where(*(table.c[name] == bindparam("k_" + name) for name in key_names))
+            .values(count=table.c.count - bindparam("d_count"), total=table.c.total - bindparam("d_total")),
+            [
+                dict(zip(["k_" + name for name in key_names], key), d_count=count, d_total=total)
+                for key, (count, total, _) in deltas.items()
+            ],
+        )
+
+    with_contacts = [key for key, d in deltas.items() if d[2]]
+    current = _load_buckets(db, with_contacts if sign > 0 else deltas, for_update=True)
+    updates, deletes = [], []
+    for key, (_, _, contacts) in deltas.items():
+        existing = current.get(key)
+        if existing is None:
+            continue
+        bucket_id, count, _, sketch = existing
+        if sign > 0:
+            # Los sketches se unen sobre la fila bloqueada, no sobre una lectura previa
+            merged = hll.to_bytes(hll.merge(hll.from_bytes(sketch), sketches[key]))
+            if merged != sketch:
+                updates.append({"id": bucket_id, "contact_keys_hll": merged})
+        elif count <= 0:
+            deletes.append(bucket_id)
+        elif contacts:
+            # Un HyperLogLog no permite restar: se rehace con lo que queda en el bucket
+            updates.append({"id": bucket_id, "contact_keys_hll": hll.to_bytes(hll.add(hll.empty(), _bucket_contacts(db, key)))})
+    if updates:
+        db.execute(update(RevenueBucket), updates)
+    if deletes:
+        db.execute(delete(RevenueBucket).where(RevenueBucket.id.in_(deletes)))
+
+
+def revenue_series(
+    db: Session,
+    grain: str,
+    desde: datetime,
+    hasta: datetime,
+    by: Optional[str] = None,
+    filters: Optional[Dict[str, str]] = None,
+) -> List[dict]:
+    """Serie por día, semana o mes leyendo sólo `revenue_buckets`.
+
+    El rango se alinea a buckets completos (`desde` cae al inicio de su día o
+    mes). `by` agrupa además por una dimensión; los contactos distintos se
+    estiman uniendo los sketches de los buckets de cada período.
+    """
+    source = "month" if grain == "month" else "day"
+    group_col = getattr(RevenueBucket, by) if by else None
+    columns = [RevenueBucket.bucket_start, RevenueBucket.total, RevenueBucket.count, RevenueBucket.contact_keys_hll]
+    stmt = select(*columns, *([group_col] if by else [])).where(
+        RevenueBucket.grain == source,
+        RevenueBucket.bucket_start >= bucket_start(source, desde),
+        RevenueBucket.bucket_start < hasta,
+    )
+    for dim, value in (filters or {}).items():
+        stmt = stmt.where(getattr(RevenueBucket, dim) == _dimension(value))
+
+    points: Dict[tuple, list] = {}
+    for row in db.execute(stmt):
+        start = row.bucket_start
+        if grain == "week":
+            start = datetime.fromordinal(start.toordinal() - start.weekday())
+        key = (start, row[4] if by else None)
+        p = points.get(key)
+        if p is None:
+            p = points[key] = [0.0, 0, hll.empty()]
+        p[0] += row.total
+        p[1] += row.count
+        hll.merge(p[2], hll.from_bytes(row.contact_keys_hll))
+    return [
+        {"periodo": start, "grupo": group, "total": total, "cantidad": count, "contactos": hll.estimate(registers)}
+        for (start, group), (total, count, registers) in sorted(points.items(), key=lambda kv: (kv[0][0], kv[0][1] or ""))
+    ]
+
+
+def rebuild_revenue_buckets(db: Session) -> int:
+    """Reconstruye `revenue_buckets` desde cero recorriendo movements en bloques."""
+    acc: Dict[BucketKey, list] = {}
+    stmt = (
+        select(*(getattr(Movement, f) for f in MovementRow._fields))
+        .where(Movement.date.is_not(None))
+        .execution_options(yield_per=REBUILD_BATCH)
+    )
+    for partition in db.execute(stmt).partitions():
+        for key, (count, total, contacts) in _revenue_deltas(MovementRow(*r) for r in partition).items():
+            a = acc.get(key)
+            if a is None:
+                a = acc[key] = [0, 0.0, hll.empty()]
+            a[0] += count
+            a[1] += total
+            hll.add(a[2], contacts)
+    db.execute(delete(RevenueBucket))
+    items = list(acc.items())
+    for i in range(0, len(items), REBUILD_BATCH):
+        db.execute(insert(RevenueBucket), [
+            {
+                "grain": key[0], "bucket_start": key[1], "type": key[2], "seller": key[3],
+                "payment_method": key[4], "expense_category": key[5],
+                "count": count, "total": total, "contact_keys_hll": hll.to_bytes(registers),
+            }
+            for key, (count, total, registers) in items[i:i + REBUILD_BATCH]
+        ])
+    db.commit()
+    return len(items)
+
+
+def rebuild_contact_rollups(db: Session) -> int:
+    """Reconstruye `contact_rollups` desde cero con un GROUP BY (por índice) sobre movements.contact_key."""
+    grouped = (
+        select(
+            Movement.contact_key,
+            display_column().label("contact"),
+            func.min(Movement.date).label("first_order"),
+            func.max(Movement.date).label("last_order"),
+            func.count(Movement.id).label("order_count"),
+            func.coalesce(func.sum(Movement.value), 0.0).label("total_value"),
+        )
+        .where(Movement.date.is_not(None))
+        .group_by(Movement.contact_key)
+    )
+    db.execute(delete(ContactRollup))
+    db.execute(
+        insert(ContactRollup).from_select(
+            ["contact_key", "contact", "first_order", "last_order", "order_count", "total_value"], grouped
+        )
+    )
+    db.commit()
+    return db.query(ContactRollup).count()
+
+
+def ensure_contact_rollups(db: Session):
+    """Construye los rollups la primera vez (tablas vacías pero con movimientos)."""
+    if db.query(Movement.id).first() is None:
+        return
+    if db.query(ContactRollup.contact).first() is None:
+        rebuild_contact_rollups(db)
+    if db.query(RevenueBucket.id).first() is None:
+        rebuild_revenue_buckets(db)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        total = rebuild_contact_rollups(db)
+        print(f"Rollup de contactos reconstruido: {total} contactos")
+        buckets = rebuild_revenue_buckets(db)
+        print(f"Buckets de facturación reconstruidos: {buckets}")
+    finally:
+        db.close()
@@ -1,27 +1,36 @@
 import os
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.templating import Jinja2Templates
 from jose import jwt, JWTError
-from schemas import LoginRequest, TokenResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import AsyncDB, SessionLocal, get_async_db, get_async_read_db
+from models import User
+from static_assets import asset_url, render_template
+from schemas import LoginRequest, TokenResponse, UserCreate, UserOut, UserUpdate
+from users import (
+    ROLES, AuthUser, dummy_hash, find_user, hash_password, needs_rehash, token_cache, verify_password,
+)
 
 router = APIRouter()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret-pietro")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 24 * 60
-
-ADMIN_USER = os.getenv("ADMIN_USER", "pietro")
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "pietro")
+MIN_PASSWORD_LENGTH = 8
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 # Templates directory: backend/templates
 _templates_dir = Path(__file__).resolve().parent.parent / "templates"
 templates = Jinja2Templates(directory=str(_templates_dir))
+templates.env.globals["asset"] = asset_url
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -31,22 +40,158 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 @router.get("/login", response_class=HTMLResponse)
 def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return render_template(templates, request, "login.html")
+
+def _set_password_hash(db: Session, user_id: int, encoded: str):
+    db.get(User, user_id).password_hash = encoded
+    db.commit()
 
 @router.post("/login", response_model=TokenResponse)
-def login(payload: LoginRequest):
-    if payload.username == ADMIN_USER and payload.password == ADMIN_PASSWORD:
-        token = create_access_token({"sub": payload.username})
-        return TokenResponse(access_token=token)
-    raise HTTPException(status_code=401, detail="Usuario o contraseña inválidos")
+async def login(payload: LoginRequest, db: AsyncDB = Depends(get_async_db)):
+    user = await db.run_sync(find_user, payload.username)
+    # PBKDF2 tarda a propósito: en el threadpool, para no frenar el event loop
+    encoded = user.password_hash if user else await run_in_threadpool(dummy_hash)
+    valid = await run_in_threadpool(verify_password, payload.password, encoded)
+    if user is None or not valid or not user.active:
+        raise HTTPException(status_code=401, detail="Usuario o contraseña inválidos")
+    token = create_access_token({"sub": user.username, "ver": user.token_version})
+    if needs_rehash(user.password_hash):
+        # Subieron PASSWORD_ITERATIONS: se aprovecha que tenemos la contraseña
+        encoded = await run_in_threadpool(hash_password, payload.password)
+        await db.run_sync(_set_password_hash, user.id, encoded)
+    return TokenResponse(access_token=token)
+
+def _load_account(username: str, version: int) -> Optional[AuthUser]:
+    # Contra la base principal: una réplica atrasada podría aceptar un token revocado
+    with SessionLocal() as db:
+        user = find_user(db, username)
+        if user is None or not user.active or user.token_version != version:
+            return None
+        return AuthUser(user.id, user.username, user.role, user.seller)
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_account(token: str = Depends(oauth2_scheme)) -> AuthUser:
+    account = token_cache.get(token)
+    if account is not None:
+        return account
     credentials_exception = HTTPException(status_code=401, detail="No autorizado")
+    generation = token_cache.generation
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        return username
     except JWTError:
         raise credentials_exception
+    username = payload.get("sub")
+    if username is None or "exp" not in payload:
+        raise credentials_exception
+    account = await run_in_threadpool(_load_account, username, payload.get("ver", 0))
+    if account is None:
+        raise credentials_exception
+    token_cache.put(token, account, float(payload["exp"]), generation)
+    return account
+
+async def get_current_user(account: AuthUser = Depends(get_current_account)) -> str:
+    return account.username
+
+async def require_admin(account: AuthUser = Depends(get_current_account)) -> AuthUser:
+    if account.role != "admin":
+        raise HTTPException(status_code=403, detail="Requiere permisos de administrador")
+    return account
+
+# Usuarios
+
+def _validate_role(role: Optional[str]):
+    if role is not None and role not in ROLES:
+        raise HTTPException(status_code=400, detail=f"Rol inválido (opciones: {', '.join(ROLES)})")
+
+def _validate_password(password: Optional[str]):
+    if password is not None and len(password) < MIN_PASSWORD_LENGTH:
+        raise HTTPException(
+            status_code=400, detail=f"La contraseña debe tener al menos {MIN_PASSWORD_LENGTH} caracteres"
+        )
+
+def _get_user(db: Session, user_id: int) -> User:
+    user = db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return user
+
+def _revoke_tokens(db: Session, user_id: int):
+    user = _get_user(db, user_id)
+    user.token_version += 1
+    db.commit()
+
+@router.get("/usuarios", response_model=List[UserOut])
+async def list_users(db: AsyncDB = Depends(get_async_read_db), admin: AuthUser = Depends(require_admin)):
+    return await db.run_sync(lambda s: list(s.execute(select(User).order_by(User.username)).scalars()))
+
+def _create_user(db: Session, payload: UserCreate, encoded: str) -> User:
+    if find_user(db, payload.username) is not None:
+        raise HTTPException(status_code=400, detail="El usuario ya existe")
+    user = User(username=payload.username, password_hash=encoded, role=payload.role, seller=payload.seller)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+@router.post("/usuarios", response_model=UserOut)
+async def create_user(payload: UserCreate, db: AsyncDB = Depends(get_async_db), admin: AuthUser = Depends(require_admin)):
+    payload.username = payload.username.strip()
+    if not payload.username:
+        raise HTTPException(status_code=400, detail="El usuario no puede estar vacío")
+    _validate_role(payload.role)
+    _validate_password(payload.password)
+    encoded = await run_in_threadpool(hash_password, payload.password)
+    return await db.run_sync(_create_user, payload, encoded)
+
+def _ensure_active_admin(db: Session):
+    # Se llama después del flush: en SQLite la escritura ya tomó el lock de la base y en
+    # PostgreSQL FOR UPDATE bloquea a los demás admins, así dos cambios simultáneos no
+    # pueden dejar cada uno al otro como el último
+    admins = db.execute(select(User.id).where(User.role == "admin", User.active.is_(True)).with_for_update()).all()
+    if not admins:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Tiene que quedar al menos un administrador activo")
+
+def _update_user(db: Session, user_id: int, payload: UserUpdate, encoded: Optional[str]) -> User:
+    user = _get_user(db, user_id)
+    was_admin = user.role == "admin" and user.active
+    data = payload.model_dump(exclude_unset=True, exclude={"password"})
+    # role y active no admiten null; seller sí (se desvincula del vendedor)
+    for key in ("role", "active"):
+        if data.get(key, False) is None:
+            del data[key]
+    # Cambiar la contraseña o desactivar al usuario cierra todas sus sesiones
+    if encoded is not None or data.get("active") is False:
+        user.token_version += 1
+    if encoded is not None:
+        user.password_hash = encoded
+    for key, value in data.items():
+        setattr(user, key, value)
+    if was_admin and not (user.role == "admin" and user.active):
+        db.flush()
+        _ensure_active_admin(db)
+    db.commit()
+    db.refresh(user)
+    return user
+
+@router.put("/usuarios/{user_id}", response_model=UserOut)
+async def update_user(
+    user_id: int,
+    payload: UserUpdate,
+    db: AsyncDB = Depends(get_async_db),
+    admin: AuthUser = Depends(require_admin),
+):
+    _validate_role(payload.role)
+    _validate_password(payload.password)
+    encoded = await run_in_threadpool(hash_password, payload.password) if payload.password else None
+    return await db.run_sync(_update_user, user_id, payload, encoded)
+
+@router.post("/usuarios/{user_id}/revocar")
+async def revoke_user_tokens(user_id: int, db: AsyncDB = Depends(get_async_db), admin: AuthUser = Depends(require_admin)):
+    await db.run_sync(_revoke_tokens, user_id)
+    return {"ok": True}
+
+@router.post("/logout")
+async def logout(db: AsyncDB = Depends(get_async_db), account: AuthUser = Depends(get_current_account)):
+    # Los tokens no guardan estado: se invalidan todas las sesiones del usuario
+    await db.run_sync(_revoke_tokens, account.id)
+    return {"ok": True}
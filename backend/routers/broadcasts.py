@@ -1,117 +1,190 @@
-import json
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Broadcast
-from schemas import BroadcastCreate, BroadcastOut
+from database import AsyncDB, get_async_db, get_async_read_db
+from models import Broadcast, BroadcastDelivery, BroadcastRecipient
+from schemas import BroadcastCreate, BroadcastOut, BroadcastSummaryOut
 from routers.auth import get_current_user
-from datetime import datetime
+from datetime import datetime, timezone
 
 router = APIRouter()
 
-@router.get("/", response_model=List[BroadcastOut])
-def list_broadcasts(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    items = db.query(Broadcast).order_by(Broadcast.id.desc()).all()
-    out = []
-    for b in items:
-        out.append(BroadcastOut(
+PREVIEW_RECIPIENTS = 5
+MAX_PAGE_SIZE = 200
+
+def get_recipients(db: Session, broadcast_id: int) -> List[str]:
+    return list(db.execute(
+        select(BroadcastRecipient.phone)
+        .where(BroadcastRecipient.broadcast_id == broadcast_id)
+        .order_by(BroadcastRecipient.position)
+    ).scalars())
+
+def set_recipients(db: Session, broadcast_id: int, phones: List[str]):
+    db.query(BroadcastRecipient).filter(BroadcastRecipient.broadcast_id == broadcast_id).delete()
+    if phones:
+        db.execute(
+            insert(BroadcastRecipient),
+            [{"broadcast_id": broadcast_id, "position": i, "phone": p} for i, p in enumerate(phones)],
+        )
+
+def as_utc(when: datetime) -> datetime:
+    # scheduled_time se guarda en UTC sin zona (el scheduler compara con utcnow);
+    # una fecha sin zona se toma como UTC
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+def broadcast_out(db: Session, b: Broadcast) -> BroadcastOut:
+    return BroadcastOut(
+        id=b.id,
+        message=b.message,
+        image_url=b.image_url,
+        recipients=get_recipients(db, b.id),
+        scheduled_time=b.scheduled_time,
+        status=b.status,
+    )
+
+def _list_broadcasts(db: Session, response: Response, limit: int, cursor: Optional[int], phone: Optional[str]):
+    query = db.query(Broadcast)
+    if cursor is not None:
+        # Keyset por id descendente: el cursor es el último id de la página anterior
+        query = query.filter(Broadcast.id < cursor)
+    if phone:
+        # Se guardan tal como se cargaron: se busca con y sin "+"
+        digits = phone.strip().lstrip("+")
+        sent_to = select(BroadcastRecipient.broadcast_id).where(BroadcastRecipient.phone.in_([digits, f"+{digits}"]))
+        query = query.filter(Broadcast.id.in_(sent_to))
+    items = query.order_by(Broadcast.id.desc()).limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = str(items[-1].id)
+
+    ids = [b.id for b in items]
+    counts: Dict[int, int] = dict(db.execute(
+        select(BroadcastRecipient.broadcast_id, func.count(BroadcastRecipient.id))
+        .where(BroadcastRecipient.broadcast_id.in_(ids))
+        .group_by(BroadcastRecipient.broadcast_id)
+    ).all()) if ids else {}
+    previews: Dict[int, List[str]] = {}
+    if ids:
+        for broadcast_id, phone_ in db.execute(
+            select(BroadcastRecipient.broadcast_id, BroadcastRecipient.phone)
+            .where(BroadcastRecipient.broadcast_id.in_(ids), BroadcastRecipient.position < PREVIEW_RECIPIENTS)
+            .order_by(BroadcastRecipient.broadcast_id, BroadcastRecipient.position)
+        ):
+            previews.setdefault(broadcast_id, []).append(phone_)
+
+    return [
+        BroadcastSummaryOut(
             id=b.id,
             message=b.message,
             image_url=b.image_url,
-            recipients=json.loads(b.recipients_json or "[]"),
+            recipients_count=counts.get(b.id, 0),
+            recipients_preview=previews.get(b.id, []),
             scheduled_time=b.scheduled_time,
             status=b.status,
-        ))
-    return out
+        )
+        for b in items
+    ]
 
-@router.get("/{broadcast_id}", response_model=BroadcastOut)
-def get_broadcast(broadcast_id: int, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+@router.get("/", response_model=List[BroadcastSummaryOut])
+async def list_broadcasts(
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    phone: Optional[str] = None,
+    db: AsyncDB = Depends(get_async_read_db),
+    user: str = Depends(get_current_user),
+):
+    return await db.run_sync(_list_broadcasts, response, limit, cursor, phone)
+
+def _get_broadcast(db: Session, broadcast_id: int) -> Broadcast:
     b = db.get(Broadcast, broadcast_id)
     if not b:
         raise HTTPException(status_code=404, detail="Difusión no encontrada")
-    return BroadcastOut(
-        id=b.id,
-        message=b.message,
-        image_url=b.image_url,
-        recipients=json.loads(b.recipients_json or "[]"),
-        scheduled_time=b.scheduled_time,
-        status=b.status,
-    )
+    return b
 
-@router.post("/", response_model=BroadcastOut)
-def create_broadcast(payload: BroadcastCreate, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+def _get_idle_broadcast(db: Session, broadcast_id: int) -> Broadcast:
+    # Mientras el scheduler la envía no se toca: el envío sigue con su lease
+    b = _get_broadcast(db, broadcast_id)
+    if b.status == "sending":
+        raise HTTPException(status_code=409, detail="La difusión se está enviando; esperá a que termine")
+    return b
+
+@router.get("/{broadcast_id}", response_model=BroadcastOut)
+async def get_broadcast(broadcast_id: int, db: AsyncDB = Depends(get_async_read_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(lambda s: broadcast_out(s, _get_broadcast(s, broadcast_id)))
+
+def _create_broadcast(db: Session, payload: BroadcastCreate) -> BroadcastOut:
     b = Broadcast(
         message=payload.message or "",
         image_url=payload.image_url,
-        recipients_json=json.dumps(payload.recipients),
         status="draft",
     )
     db.add(b)
+    db.flush()
+    set_recipients(db, b.id, payload.recipients)
     db.commit()
     db.refresh(b)
-    return BroadcastOut(
-        id=b.id,
-        message=b.message,
-        image_url=b.image_url,
-        recipients=json.loads(b.recipients_json or "[]"),
-        scheduled_time=b.scheduled_time,
-        status=b.status,
-    )
+    return broadcast_out(db, b)
 
-@router.post("/programar", response_model=BroadcastOut)
-def schedule_broadcast(id: int, when: datetime, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    b = db.get(Broadcast, id)
-    if not b:
-        raise HTTPException(status_code=404, detail="Difusión no encontrada")
-    b.scheduled_time = when
+@router.post("/", response_model=BroadcastOut)
+async def create_broadcast(payload: BroadcastCreate, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_create_broadcast, payload)
+
+def _schedule_broadcast(db: Session, id: int, when: datetime) -> BroadcastOut:
+    b = _get_idle_broadcast(db, id)
+    b.scheduled_time = as_utc(when)
     b.status = "scheduled"
+    # Una nueva programación vuelve a enviar a todos: se descarta el registro anterior
+    db.query(BroadcastDelivery).filter(BroadcastDelivery.broadcast_id == id).delete()
     db.commit()
     db.refresh(b)
-    return BroadcastOut(
-        id=b.id,
-        message=b.message,
-        image_url=b.image_url,
-        recipients=json.loads(b.recipients_json or "[]"),
-        scheduled_time=b.scheduled_time,
-        status=b.status,
-    )
+    return broadcast_out(db, b)
 
-@router.put("/{broadcast_id}", response_model=BroadcastOut)
-def update_broadcast(
+@router.post("/programar", response_model=BroadcastOut)
+async def schedule_broadcast(id: int, when: datetime, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_schedule_broadcast, id, when)
+
+def _update_broadcast(
+    db: Session,
     broadcast_id: int,
     payload: BroadcastCreate,
-    when: Optional[datetime] = None,
-    status: Optional[str] = None,
-    db: Session = Depends(get_db),
-    user: str = Depends(get_current_user),
-):
-    b = db.get(Broadcast, broadcast_id)
-    if not b:
-        raise HTTPException(status_code=404, detail="Difusión no encontrada")
+    when: Optional[datetime],
+    status: Optional[str],
+) -> BroadcastOut:
+    b = _get_idle_broadcast(db, broadcast_id)
     b.message = payload.message or ""
     b.image_url = payload.image_url
-    b.recipients_json = json.dumps(payload.recipients or [])
+    set_recipients(db, b.id, payload.recipients or [])
     if when is not None:
-        b.scheduled_time = when
+        b.scheduled_time = as_utc(when)
     if status is not None:
         b.status = status
     db.commit()
     db.refresh(b)
-    return BroadcastOut(
-        id=b.id,
-        message=b.message,
-        image_url=b.image_url,
-        recipients=json.loads(b.recipients_json or "[]"),
-        scheduled_time=b.scheduled_time,
-        status=b.status,
-    )
+    return broadcast_out(db, b)
 
-@router.delete("/{broadcast_id}")
-def delete_broadcast(broadcast_id: int, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    b = db.get(Broadcast, broadcast_id)
-    if not b:
-        raise HTTPException(status_code=404, detail="Difusión no encontrada")
+@router.put("/{broadcast_id}", response_model=BroadcastOut)
+async def update_broadcast(
+    broadcast_id: int,
+    payload: BroadcastCreate,
+    when: Optional[datetime] = None,
+    status: Optional[str] = None,
+    db: AsyncDB = Depends(get_async_db),
+    user: str = Depends(get_current_user),
+):
+    return await db.run_sync(_update_broadcast, broadcast_id, payload, when, status)
+
+def _delete_broadcast(db: Session, broadcast_id: int):
+    b = _get_idle_broadcast(db, broadcast_id)
+    db.query(BroadcastDelivery).filter(BroadcastDelivery.broadcast_id == broadcast_id).delete()
+    db.query(BroadcastRecipient).filter(BroadcastRecipient.broadcast_id == broadcast_id).delete()
     db.delete(b)
     db.commit()
+
+@router.delete("/{broadcast_id}")
+async def delete_broadcast(broadcast_id: int, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    await db.run_sync(_delete_broadcast, broadcast_id)
     return {"ok": True}
@@ -1,15 +1,28 @@
-from collections import defaultdict
-from datetime import datetime
+from datetime import date, datetime
 from typing import List
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from database import get_db
-from models import Movement, ControlVariables, ControlFrequency
+from churn_vectorized import (
+    churn_dicts, churn_row, fetch_movement_columns, fetch_rollup_rows, movement_columns, rollup_columns,
+    simulate_distributions,
+)
+from database import AsyncDB, get_async_db, get_db
+from exports import stream_export, stream_select
+from fast_json import ORJSON, dumps, model_json
+from models import ContactRollup, ControlVariables, ControlFrequency
+from result_cache import json_response, result_cache
+from rollups import rebuild_contact_rollups
 from routers.auth import get_current_user
 from schemas import (
     ChurnRowOut,
+    ChurnSimulationOut,
+    ChurnSimulationRequest,
+    ControlVariablesBase,
     ControlVariablesOut,
     ControlVariablesCreate,
     ControlFrequencyOut,
@@ -18,6 +31,12 @@ from schemas import (
 
 router = APIRouter()
 
+# Tablas de las que depende el resultado de /churn/ (clave y caché)
+CHURN_TABLES = ("movements", "contact_rollups", "control_variables", "control_frequencies")
+_churn_rows = TypeAdapter(List[ChurnRowOut])
+_simulation_out = TypeAdapter(ChurnSimulationOut)
+MAX_SIMULATION_CANDIDATES = 200
+
 
 def get_or_create_control_variables(db: Session) -> ControlVariables:
     obj = db.query(ControlVariables).first()
@@ -46,95 +65,227 @@ def seed_frequencies_if_needed(db: Session):
     db.commit()
 
 
-@router.get("/", response_model=List[ChurnRowOut])
-def calculate_churn(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    ctrl = get_or_create_control_variables(db)
+def lookup_frequency_coef(frecuencia: float, freqs: List[ControlFrequency], ctrl: ControlVariables) -> float:
+    # buscar frecuencia*coef en tabla guía (o usar coef global)
+    if freqs:
+        # escoger la frecuencia más cercana por debajo o igual
+        best = freqs[0]
+        for f in freqs:
+            if frecuencia >= f.frecuencia:
+                best = f
+            else:
+                break
+        return float(best.frecuencia_coef)
+    return frecuencia * float(ctrl.coeficiente_regular)
+
+
+def classify_contact(
+    contact: str,
+    primer: date,
+    ultimo: date,
+    cantidad: int,
+    fact_total: float,
+    ctrl: ControlVariables,
+    freqs: List[ControlFrequency],
+    today: date,
+) -> ChurnRowOut:
+    return ChurnRowOut(**classify_contact_row(contact, primer, ultimo, cantidad, fact_total, ctrl, freqs, today))
+
+
+def classify_contact_row(
+    contact: str,
+    primer: date,
+    ultimo: date,
+    cantidad: int,
+    fact_total: float,
+    ctrl: ControlVariables,
+    freqs: List[ControlFrequency],
+    today: date,
+) -> dict:
+    dias_ultimo = (today - ultimo).days
+    fact_prom = fact_total / cantidad if cantidad else 0.0
+
+    # frecuencia = días entre pedidos promedio
+    if cantidad > 1:
+        span_days = (ultimo - primer).days or 1
+        frecuencia = span_days / (cantidad - 1)
+    else:
+        frecuencia = float(ctrl.dias_nuevos)
+
+    frecuencia_coef = lookup_frequency_coef(frecuencia, freqs, ctrl)
+
+    # clasificación muy aproximada basada en tu tabla (se puede refinar luego)
+    if cantidad >= ctrl.pedidos_vip and dias_ultimo < ctrl.coeficiente_regular * frecuencia:
+        clasificacion = "1.1"  # Clientes fidelizados
+    elif cantidad >= ctrl.pedidos_activo_frecuente and dias_ultimo < ctrl.coeficiente_regular * frecuencia:
+        clasificacion = "1.2"  # Clientes a fidelizar
+    elif dias_ultimo > ctrl.coeficiente_regular * frecuencia and cantidad >= ctrl.pedidos_activo_frecuente:
+        clasificacion = "2.1"  # Fidelizados perdidos
+    elif dias_ultimo > ctrl.dias_nuevos:
+        clasificacion = "2.2"  # No fidelizados perdidos
+    else:
+        clasificacion = "4.1"  # Nuevos
+
+    return churn_row(
+        contacto=contact,
+        clasificacion=clasificacion,
+        cantidad_pedidos=cantidad,
+        facturacion_total=fact_total,
+        facturacion_promedio=fact_prom,
+        dias_ultimo_pedido=dias_ultimo,
+        primer_pedido=datetime.combine(primer, datetime.min.time()),
+        ultimo_pedido=datetime.combine(ultimo, datetime.min.time()),
+        frecuencia=frecuencia,
+        frecuencia_coef=frecuencia_coef,
+    )
+
+
+def _churn_settings(db: Session):
+    # Las frecuencias primero: su commit expiraría las variables ya leídas
     seed_frequencies_if_needed(db)
+    ctrl = get_or_create_control_variables(db)
     freqs = db.query(ControlFrequency).order_by(ControlFrequency.frecuencia).all()
+    return ctrl, freqs
 
-    # Agregar movimientos por contacto
-    per_contact = defaultdict(list)
-    movements = db.query(Movement).all()
-    for m in movements:
-        key = (m.contact or "").strip() or "(sin contacto)"
-        per_contact[key].append(m)
 
-    rows: List[ChurnRowOut] = []
+def _rollup_rows(db: Session):
+    return db.execute(
+        select(
+            ContactRollup.contact, ContactRollup.first_order, ContactRollup.last_order,
+            ContactRollup.order_count, ContactRollup.total_value,
+        ).order_by(ContactRollup.contact, ContactRollup.contact_key)
+    ).all()
+
+
+def _encode_churn(rows: list, fast: bool) -> bytes:
+    return dumps(rows) if fast else _churn_rows.dump_json(rows)
+
+
+def _classify_rollup_json(rows, ctrl, freqs, today: date, fast: bool) -> bytes:
+    # Los agregados por contacto vienen del rollup: sólo queda clasificar
+    classify = classify_contact_row if fast else classify_contact
+    return _encode_churn([
+        classify(contact, first.date(), last.date(), count, float(total), ctrl, freqs, today)
+        for contact, first, last, count, total in rows
+    ], fast)
+
+
+def _classify_vector_json(rows, names, ctrl, freqs, today: date, fast: bool) -> bytes:
+    dicts = churn_dicts(movement_columns(rows, names), ctrl, freqs, today)
+    return _encode_churn(dicts if fast else [ChurnRowOut(**row) for row in dicts], fast)
+
+
+async def _churn_json(db: AsyncDB, engine: str, fast: bool = False) -> bytes:
+    ctrl, freqs = await db.run_sync(_churn_settings)
     today = datetime.utcnow().date()
+    # orjson escribe los float igual que pydantic; con json el modo rápido no aplica
+    fast = fast and ORJSON
 
-    for contact, items in per_contact.items():
-        if not items:
-            continue
-        # ordenar por fecha
-        items.sort(key=lambda x: x.date)
-        dates = [i.date.date() for i in items if i.date]
-        if not dates:
-            continue
-        primer = dates[0]
-        ultimo = dates[-1]
-        dias_ultimo = (today - ultimo).days
-        cantidad = len(dates)
-        fact_total = float(sum(i.value or 0 for i in items))
-        fact_prom = fact_total / cantidad if cantidad else 0.0
-
-        # frecuencia = días entre pedidos promedio
-        if len(dates) > 1:
-            span_days = (dates[-1] - dates[0]).days or 1
-            frecuencia = span_days / (len(dates) - 1)
-        else:
-            frecuencia = float(ctrl.dias_nuevos)
-
-        # buscar frecuencia*coef en tabla guía (o usar coef global)
-        if freqs:
-            # escoger la frecuencia más cercana por debajo o igual
-            best = freqs[0]
-            for f in freqs:
-                if frecuencia >= f.frecuencia:
-                    best = f
-                else:
-                    break
-            frecuencia_coef = float(best.frecuencia_coef)
-        else:
-            frecuencia_coef = frecuencia * float(ctrl.coeficiente_regular)
-
-        # clasificación muy aproximada basada en tu tabla (se puede refinar luego)
-        if cantidad >= ctrl.pedidos_vip and dias_ultimo < ctrl.coeficiente_regular * frecuencia:
-            clasificacion = "1.1"  # Clientes fidelizados
-        elif cantidad >= ctrl.pedidos_activo_frecuente and dias_ultimo < ctrl.coeficiente_regular * frecuencia:
-            clasificacion = "1.2"  # Clientes a fidelizar
-        elif dias_ultimo > ctrl.coeficiente_regular * frecuencia and cantidad >= ctrl.pedidos_activo_frecuente:
-            clasificacion = "2.1"  # Fidelizados perdidos
-        elif dias_ultimo > ctrl.dias_nuevos:
-            clasificacion = "2.2"  # No fidelizados perdidos
-        else:
-            clasificacion = "4.1"  # Nuevos
-
-        rows.append(
-            ChurnRowOut(
-                contacto=contact,
-                clasificacion=clasificacion,
-                cantidad_pedidos=cantidad,
-                facturacion_total=fact_total,
-                facturacion_promedio=fact_prom,
-                dias_ultimo_pedido=dias_ultimo,
-                primer_pedido=datetime.combine(primer, datetime.min.time()),
-                ultimo_pedido=datetime.combine(ultimo, datetime.min.time()),
-                frecuencia=frecuencia,
-                frecuencia_coef=frecuencia_coef,
-            )
+    # Las consultas van por la sesión del request (AsyncSession con DB_ASYNC=1);
+    # clasificar y serializar es CPU y corre en el threadpool, no en el event loop
+    async def compute():
+        if engine == "vector":
+            # Recálculo completo desde movements, sin pasar por el rollup
+            rows, names = await db.run_sync(fetch_movement_columns)
+            return await run_in_threadpool(_classify_vector_json, rows, names, ctrl, freqs, today, fast)
+        rows = await db.run_sync(_rollup_rows)
+        return await run_in_threadpool(_classify_rollup_json, rows, ctrl, freqs, today, fast)
+
+    # Se cachea el JSON ya serializado: con miles de contactos validar el
+    # response_model en cada acierto costaría casi lo mismo que recalcular.
+    # Los dos modos dan los mismos bytes, así que comparten la entrada.
+    return await result_cache.get_or_compute_async(db, "churn", (engine, today), CHURN_TABLES, compute)
+
+
+@router.get("/", response_model=List[ChurnRowOut])
+async def calculate_churn(
+    response: Response,
+    engine: str = "rollup",
+    fast: bool = False,
+    db: AsyncDB = Depends(get_async_db),
+    user: str = Depends(get_current_user),
+):
+    if engine not in ("rollup", "vector"):
+        raise HTTPException(status_code=400, detail="Motor de churn inválido (rollup|vector)")
+    return json_response(await _churn_json(db, engine, fast), response)
+
+
+def _simulation_inputs(db: Session) -> ControlVariablesBase:
+    return ControlVariablesBase.model_validate(get_or_create_control_variables(db), from_attributes=True)
+
+
+def _simulate(actual: ControlVariablesBase, columns, payload: ChurnSimulationRequest) -> dict:
+    variables = [
+        actual.model_copy(update=c.model_dump(exclude_none=True)) for c in payload.candidatos
+    ]
+    today = datetime.utcnow().date()
+    results = [
+        {"variables": v, **dist}
+        for v, dist in zip([actual] + variables, simulate_distributions(*columns, [actual] + variables, today))
+    ]
+    return {"contactos": len(columns[0]), "actual": results[0], "candidatos": results[1:]}
+
+
+async def _rollup_columns(db: AsyncDB):
+    rows = await db.run_sync(fetch_rollup_rows)
+    return await run_in_threadpool(rollup_columns, rows)
+
+
+@router.post("/simulate", response_model=ChurnSimulationOut)
+async def simulate_churn(
+    payload: ChurnSimulationRequest,
+    response: Response,
+    db: AsyncDB = Depends(get_async_db),
+    user: str = Depends(get_current_user),
+):
+    """Distribución de clases con cada juego de variables candidato, sin guardar nada."""
+    if not payload.candidatos:
+        raise HTTPException(status_code=400, detail="Falta al menos un candidato")
+    if len(payload.candidatos) > MAX_SIMULATION_CANDIDATES:
+        raise HTTPException(
+            status_code=400, detail=f"Máximo {MAX_SIMULATION_CANDIDATES} candidatos por simulación"
         )
+    actual = await db.run_sync(_simulation_inputs)
+    # Los arreglos del rollup se cachean hasta que cambie: probar otra tanda no relee la tabla
+    columns = await result_cache.get_or_compute_async(
+        db, "churn-simulate", None, ("contact_rollups",), lambda: _rollup_columns(db)
+    )
+    # Las máscaras de NumPy y la validación de la respuesta, en el threadpool
+    result = await run_in_threadpool(_simulate, actual, columns, payload)
+    return json_response(await run_in_threadpool(model_json, _simulation_out, result), response)
+
+
+@router.get("/export")
+def export_churn(fmt: str = Query("csv", alias="format"), user: str = Depends(get_current_user)):
+    columns = list(ChurnRowOut.model_fields)
+
+    def produce(db: Session):
+        ctrl = get_or_create_control_variables(db)
+        seed_frequencies_if_needed(db)
+        freqs = db.query(ControlFrequency).order_by(ControlFrequency.frecuencia).all()
+        today = datetime.utcnow().date()
+        for (r,) in stream_select(db, select(ContactRollup).order_by(ContactRollup.contact, ContactRollup.contact_key)):
+            row = classify_contact(
+                r.contact, r.first_order.date(), r.last_order.date(), r.order_count, float(r.total_value), ctrl, freqs, today
+            )
+            yield [getattr(row, c) for c in columns]
+
+    # Puede crear las variables de control la primera vez: va a la base principal
+    return stream_export(columns, produce, fmt, "churn", writable=True)
+
 
-    return rows
+@router.post("/rollup/rebuild")
+def rebuild_rollup(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+    total = rebuild_contact_rollups(db)
+    return {"ok": True, "contactos": total}
 
 
 @router.get("/control/variables", response_model=ControlVariablesOut)
-def get_control_variables(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    obj = get_or_create_control_variables(db)
-    return obj
+async def get_control_variables(db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(get_or_create_control_variables)
 
 
-@router.put("/control/variables", response_model=ControlVariablesOut)
-def update_control_variables(payload: ControlVariablesCreate, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+def _update_control_variables(db: Session, payload: ControlVariablesCreate) -> ControlVariables:
     obj = get_or_create_control_variables(db)
     for field, value in payload.dict().items():
         setattr(obj, field, value)
@@ -143,14 +294,22 @@ def update_control_variables(payload: ControlVariablesCreate, db: Session = Depe
     return obj
 
 
-@router.get("/control/frequencies", response_model=List[ControlFrequencyOut])
-def list_control_frequencies(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+@router.put("/control/variables", response_model=ControlVariablesOut)
+async def update_control_variables(payload: ControlVariablesCreate, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_update_control_variables, payload)
+
+
+def _list_control_frequencies(db: Session) -> List[ControlFrequency]:
     seed_frequencies_if_needed(db)
     return db.query(ControlFrequency).order_by(ControlFrequency.frecuencia).all()
 
 
-@router.put("/control/frequencies/{freq_id}", response_model=ControlFrequencyOut)
-def update_control_frequency(freq_id: int, payload: ControlFrequencyCreate, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+@router.get("/control/frequencies", response_model=List[ControlFrequencyOut])
+async def list_control_frequencies(db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_list_control_frequencies)
+
+
+def _update_control_frequency(db: Session, freq_id: int, payload: ControlFrequencyCreate) -> ControlFrequency:
     obj = db.get(ControlFrequency, freq_id)
     if not obj:
         raise ValueError("Frecuencia no encontrada")
@@ -159,3 +318,8 @@ def update_control_frequency(freq_id: int, payload: ControlFrequencyCreate, db:
     db.commit()
     db.refresh(obj)
     return obj
+
+
+@router.put("/control/frequencies/{freq_id}", response_model=ControlFrequencyOut)
+async def update_control_frequency(freq_id: int, payload: ControlFrequencyCreate, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_update_control_frequency, freq_id, payload)
@@ -1,69 +1,192 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from database import get_db
+from contacts import client_totals, link_client
+from database import AsyncDB, get_async_db, get_async_read_db
+from etags import etag_tables
+from exports import stream_export, stream_select
+from fast_json import model_json, rows_json
 from models import Client
-from schemas import ClientCreate, ClientUpdate, ClientOut
+from result_cache import json_response
+from search import DEFAULT_LIMIT, MAX_LIMIT, apply_client_search
+from tags import clear_client_tags, parse_tag_params, set_client_tags, tag_counts, tag_filter
+from schemas import ClientCreate, ClientUpdate, ClientOut, ClientTotalsOut, TagCountOut
 from routers.auth import get_current_user
 from datetime import datetime
 
 router = APIRouter()
 
+def apply_client_filters(
+    query,
+    estado: Optional[str],
+    tags: List[str],
+    q: Optional[str],
+    limit: Optional[int] = None,
+    tag_mode: str = "any",
+):
+    """Aplica filtros y orden: por relevancia si hay búsqueda, si no por id descendente."""
+    if estado:
+        query = query.filter(Client.status == estado)
+    if tags:
+        query = query.filter(tag_filter(tags, tag_mode))
+    order_by = []
+    if q:
+        # El top-N dentro de FTS5 sólo es seguro si no hay otros filtros que descarten matches
+        candidates = limit if limit and not (estado or tags) else None
+        query, order_by = apply_client_search(query, q, candidates)
+    query = query.order_by(*order_by, Client.id.desc())
+    return query.limit(limit) if limit else query
+
+def tag_params(tag: Optional[List[str]], tag_mode: str) -> List[str]:
+    if tag_mode not in ("any", "all"):
+        raise HTTPException(status_code=400, detail="tag_mode debe ser 'any' o 'all'")
+    return parse_tag_params(tag)
+
+# Modo rápido: las columnas de ClientOut como tuplas, codificadas sin pasar por pydantic
+FAST_COLUMNS = list(ClientOut.model_fields)
+FAST_SELECT = [getattr(Client, c) for c in FAST_COLUMNS]
+
+_client_list = TypeAdapter(List[ClientOut])
+_client_totals = TypeAdapter(List[ClientTotalsOut])
+
+def _rows(db: Session, query) -> list:
+    return db.execute(query).all()
+
+def _objects(db: Session, query) -> list:
+    return db.scalars(query).all()
+
+# Las consultas van por la sesión del request (AsyncSession con DB_ASYNC=1); validar
+# y armar el JSON de toda la tabla es CPU y corre en el threadpool (ver fast_json.model_json)
+async def _fast_clients(db: AsyncDB, query) -> bytes:
+    return await run_in_threadpool(rows_json, FAST_COLUMNS, await db.run_sync(_rows, query))
+
+async def _clients_json(db: AsyncDB, query) -> bytes:
+    return await run_in_threadpool(model_json, _client_list, await db.run_sync(_objects, query))
+
 @router.get("/", response_model=List[ClientOut])
-def list_clients(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    return db.query(Client).order_by(Client.id.desc()).all()
+async def list_clients(
+    response: Response,
+    fast: bool = False,
+    db: AsyncDB = Depends(get_async_read_db),
+    user: str = Depends(get_current_user),
+):
+    if fast:
+        query = select(*FAST_SELECT).order_by(Client.id.desc())
+        return json_response(await _fast_clients(db, query), response)
+    return json_response(await _clients_json(db, select(Client).order_by(Client.id.desc())), response)
 
 @router.get("/filtrar", response_model=List[ClientOut])
-def filter_clients(
+async def filter_clients(
+    response: Response,
     estado: Optional[str] = None,
-    tag: Optional[str] = None,
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = "any",
     q: Optional[str] = None,
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    fast: bool = False,
+    db: AsyncDB = Depends(get_async_read_db),
     user: str = Depends(get_current_user),
 ):
-    query = db.query(Client)
-    if estado:
-        query = query.filter(Client.status == estado)
-    if tag:
-        query = query.filter(Client.tags.like(f"%{tag}%"))
-    if q:
-        qlike = f"%{q}%"
-        query = query.filter((Client.name.like(qlike)) | (Client.phone.like(qlike)) | (Client.notes.like(qlike)))
-    return query.order_by(Client.id.desc()).all()
+    # Una búsqueda de texto devuelve los mejores resultados, no toda la tabla
+    if limit is None and q:
+        limit = DEFAULT_LIMIT
+    tags = tag_params(tag, tag_mode)
+    if fast:
+        query = apply_client_filters(select(*FAST_SELECT), estado, tags, q, limit, tag_mode)
+        return json_response(await _fast_clients(db, query), response)
+    query = apply_client_filters(select(Client), estado, tags, q, limit, tag_mode)
+    return json_response(await _clients_json(db, query), response)
 
-@router.get("/{client_id}", response_model=ClientOut)
-def get_client(client_id: int, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+@router.get("/tags", response_model=List[TagCountOut])
+async def list_tags(db: AsyncDB = Depends(get_async_read_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(tag_counts)
+
+@router.get("/resumen", response_model=List[ClientTotalsOut])
+@etag_tables("clients", "movements")
+async def client_summary(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncDB = Depends(get_async_read_db),
+    user: str = Depends(get_current_user),
+):
+    """Pedidos y facturación de cada cliente, por sus movimientos vinculados (client_id)."""
+    totals = await db.run_sync(client_totals, limit)
+    return json_response(await run_in_threadpool(model_json, _client_totals, totals), response)
+
+EXPORT_COLUMNS = ["id", "name", "phone", "status", "tags", "last_contact", "owner", "next_action", "notes", "zone"]
+
+@router.get("/export")
+def export_clients(
+    estado: Optional[str] = None,
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = "any",
+    q: Optional[str] = None,
+    fmt: str = Query("csv", alias="format"),
+    user: str = Depends(get_current_user),
+):
+    stmt = apply_client_filters(
+        select(*[getattr(Client, c) for c in EXPORT_COLUMNS]), estado, tag_params(tag, tag_mode), q, tag_mode=tag_mode
+    )
+    return stream_export(EXPORT_COLUMNS, lambda db: stream_select(db, stmt), fmt, "clientes")
+
+def _get_client(db: Session, client_id: int) -> Client:
     obj = db.get(Client, client_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     return obj
 
-@router.post("/", response_model=ClientOut)
-def create_client(payload: ClientCreate, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+@router.get("/{client_id}", response_model=ClientOut)
+async def get_client(client_id: int, db: AsyncDB = Depends(get_async_read_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_get_client, client_id)
+
+def _create_client(db: Session, payload: ClientCreate) -> Client:
     obj = Client(**payload.dict())
     obj.updated_at = datetime.utcnow()
     db.add(obj)
+    db.flush()
+    set_client_tags(db, obj.id, obj.tags)
+    link_client(db, obj)
     db.commit()
     db.refresh(obj)
     return obj
 
-@router.put("/{client_id}", response_model=ClientOut)
-def update_client(client_id: int, payload: ClientUpdate, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    obj = db.get(Client, client_id)
-    if not obj:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
-    for field, value in payload.dict(exclude_unset=True).items():
+@router.post("/", response_model=ClientOut)
+async def create_client(payload: ClientCreate, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_create_client, payload)
+
+def _update_client(db: Session, client_id: int, payload: ClientUpdate) -> Client:
+    obj = _get_client(db, client_id)
+    old_key = obj.contact_key
+    changes = payload.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(obj, field, value)
     obj.updated_at = datetime.utcnow()
+    if "tags" in changes:
+        set_client_tags(db, obj.id, obj.tags)
+    if "name" in changes:
+        db.flush()
+        link_client(db, obj, old_key)
     db.commit()
     db.refresh(obj)
     return obj
 
-@router.delete("/{client_id}")
-def delete_client(client_id: int, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    obj = db.get(Client, client_id)
-    if not obj:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+@router.put("/{client_id}", response_model=ClientOut)
+async def update_client(client_id: int, payload: ClientUpdate, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_update_client, client_id, payload)
+
+def _delete_client(db: Session, client_id: int):
+    obj = _get_client(db, client_id)
+    clear_client_tags(db, client_id)
     db.delete(obj)
+    db.flush()
+    # Sus movimientos pasan a otro cliente con la misma clave, o quedan sin cliente
+    link_client(db, obj)
     db.commit()
+
+@router.delete("/{client_id}")
+async def delete_client(client_id: int, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    await db.run_sync(_delete_client, client_id)
     return {"ok": True}
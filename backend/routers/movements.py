@@ -1,42 +1,238 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import io
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 
-from database import get_db
-from models import Movement
-from schemas import MovementCreate, MovementOut
+from contacts import client_ids
+from database import AsyncDB, get_async_db, get_async_read_db, get_db
+from exports import stream_export, stream_select
+from fast_json import model_json, rows_json
+from import_movements import import_csv
+from models import Movement, normalize_contact
+from result_cache import json_response
+from rollups import DIMENSIONS, apply_movements, movement_row, rebuild_revenue_buckets, revenue_series
+from schemas import ImportReportOut, MovementCreate, MovementOut, RevenuePointOut
 from routers.auth import get_current_user
 
 router = APIRouter()
 
 
+MAX_PAGE_SIZE = 1000
+
+
+class MovementFilters:
+    """Filtros comunes de listado/exportación de movimientos (query params)."""
+
+    def __init__(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        type: Optional[str] = None,
+        contact: Optional[str] = None,
+        seller: Optional[str] = None,
+        status: Optional[str] = None,
+        client_id: Optional[int] = None,
+    ):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.type = type
+        self.contact = contact
+        self.seller = seller
+        self.status = status
+        self.client_id = client_id
+
+    def apply(self, query):
+        if self.date_from:
+            query = query.filter(Movement.date >= self.date_from)
+        if self.date_to:
+            query = query.filter(Movement.date <= self.date_to)
+        if self.type:
+            query = query.filter(Movement.type == self.type)
+        if self.contact:
+            # Mismo criterio que los rollups: "José Pérez" y " jose  perez" son el mismo contacto
+            query = query.filter(Movement.contact_key == normalize_contact(self.contact))
+        if self.seller:
+            query = query.filter(Movement.seller == self.seller)
+        if self.status:
+            query = query.filter(Movement.status == self.status)
+        if self.client_id:
+            query = query.filter(Movement.client_id == self.client_id)
+        return query
+
+
+def encode_cursor(m: Movement) -> str:
+    raw = f"{m.date.isoformat()}|{m.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date_s, id_s = raw.rsplit("|", 1)
+        return datetime.fromisoformat(date_s), int(id_s)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+# Modo rápido: las columnas de MovementOut como tuplas, codificadas sin pasar por pydantic
+FAST_COLUMNS = list(MovementOut.model_fields)
+FAST_SELECT = [getattr(Movement, c) for c in FAST_COLUMNS]
+_movement_list = TypeAdapter(List[MovementOut])
+
+
+def _query_movements(
+    db: Session,
+    filters: MovementFilters,
+    limit: Optional[int],
+    cursor: Optional[str],
+    fast: bool = False,
+) -> tuple[list, Optional[str]]:
+    """(filas de la página, cursor de la siguiente o None)."""
+    # Las filas de FAST_SELECT también tienen .date e .id para el cursor
+    query = filters.apply(db.query(*FAST_SELECT) if fast else db.query(Movement))
+    query = query.order_by(Movement.date.desc(), Movement.id.desc())
+    if limit is None and cursor is None:
+        # Sin paginar: listado completo (compatibilidad)
+        return query.all(), None
+    limit = limit or 100
+    if cursor:
+        # Keyset sobre (date, id): cada página cuesta lo mismo sin importar el offset
+        query = query.filter(tuple_(Movement.date, Movement.id) < tuple_(*decode_cursor(cursor)))
+    items = query.limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1])
+    return items, None
+
+
+def _encode_movements(items: list, fast: bool) -> bytes:
+    if fast:
+        return rows_json(FAST_COLUMNS, items, float_columns=["value"])
+    return model_json(_movement_list, items)
+
+
 @router.get("/", response_model=List[MovementOut])
-def list_movements(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    return db.query(Movement).order_by(Movement.date.desc(), Movement.id.desc()).all()
+async def list_movements(
+    response: Response,
+    filters: MovementFilters = Depends(),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fast: bool = False,
+    db: AsyncDB = Depends(get_async_read_db),
+    user: str = Depends(get_current_user),
+):
+    # Sin paginar puede ser la tabla entera: la consulta va por la sesión del
+    # request y la validación y el JSON, en el threadpool (ver fast_json.model_json)
+    items, next_cursor = await db.run_sync(_query_movements, filters, limit, cursor, fast)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return json_response(await run_in_threadpool(_encode_movements, items, fast), response)
 
 
-@router.post("/", response_model=MovementOut)
-def create_movement(payload: MovementCreate, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+EXPORT_COLUMNS = ["id", "date", "type", "seller", "description", "expense_category", "contact", "status", "payment_method", "value"]
+
+
+@router.get("/export")
+def export_movements(
+    filters: MovementFilters = Depends(),
+    fmt: str = Query("csv", alias="format"),
+    user: str = Depends(get_current_user),
+):
+    stmt = filters.apply(select(*[getattr(Movement, c) for c in EXPORT_COLUMNS]))
+    stmt = stmt.order_by(Movement.date.desc(), Movement.id.desc())
+    return stream_export(EXPORT_COLUMNS, lambda db: stream_select(db, stmt), fmt, "movimientos")
+
+
+def _create_movement(db: Session, payload: MovementCreate) -> Movement:
     obj = Movement(**payload.dict())
+    obj.contact_key = normalize_contact(obj.contact)
+    obj.client_id = client_ids(db, [obj.contact_key]).get(obj.contact_key)
     db.add(obj)
+    apply_movements(db, [movement_row(obj)])
     db.commit()
     db.refresh(obj)
     return obj
 
 
-@router.get("/{movement_id}", response_model=MovementOut)
-def get_movement(movement_id: int, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+@router.post("/", response_model=MovementOut)
+async def create_movement(payload: MovementCreate, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_create_movement, payload)
+
+
+# La importación y los rebuilds son CPU de punta a punta: siguen en el
+# threadpool con Session sync para no frenar el event loop en modo async
+@router.post("/import", response_model=ImportReportOut)
+def import_movements_csv(file: UploadFile = File(...), db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+    # El archivo se lee en streaming desde el temporal de la subida
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return import_csv(text, db)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El CSV debe estar en UTF-8")
+    finally:
+        text.detach()
+
+
+@router.get("/series", response_model=List[RevenuePointOut])
+async def movement_series(
+    grain: str = "day",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    by: Optional[str] = None,
+    type: Optional[str] = None,
+    seller: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    expense_category: Optional[str] = None,
+    db: AsyncDB = Depends(get_async_read_db),
+    user: str = Depends(get_current_user),
+):
+    """Suma, cantidad y contactos distintos por período, desde los rollups (no lee movements)."""
+    if grain not in ("day", "week", "month"):
+        raise HTTPException(status_code=400, detail="grain inválido (day|week|month)")
+    if by is not None and by not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"by inválido ({'|'.join(DIMENSIONS)})")
+    hasta = hasta or datetime.utcnow()
+    desde = desde or hasta - timedelta(days=365)
+    filters = {
+        dim: value
+        for dim, value in zip(DIMENSIONS, (type, seller, payment_method, expense_category))
+        if value is not None
+    }
+    return await db.run_sync(revenue_series, grain, desde, hasta, by, filters)
+
+
+@router.post("/series/rebuild")
+def rebuild_series(db: Session = Depends(get_db), user: str = Depends(get_current_user)):
+    total = rebuild_revenue_buckets(db)
+    return {"ok": True, "buckets": total}
+
+
+def _get_movement(db: Session, movement_id: int) -> Movement:
     obj = db.get(Movement, movement_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     return obj
 
 
-@router.delete("/{movement_id}")
-def delete_movement(movement_id: int, db: Session = Depends(get_db), user: str = Depends(get_current_user)):
-    obj = db.get(Movement, movement_id)
-    if not obj:
-        raise HTTPException(status_code=404, detail="Movimiento no encontrado")
+@router.get("/{movement_id}", response_model=MovementOut)
+async def get_movement(movement_id: int, db: AsyncDB = Depends(get_async_read_db), user: str = Depends(get_current_user)):
+    return await db.run_sync(_get_movement, movement_id)
+
+
+def _delete_movement(db: Session, movement_id: int):
+    obj = _get_movement(db, movement_id)
     db.delete(obj)
+    db.flush()
+    apply_movements(db, [movement_row(obj)], sign=-1)
     db.commit()
+
+
+@router.delete("/{movement_id}")
+async def delete_movement(movement_id: int, db: AsyncDB = Depends(get_async_db), user: str = Depends(get_current_user)):
+    await db.run_sync(_delete_movement, movement_id)
     return {"ok": True}
@@ -1,20 +1,59 @@
-import os
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
+from typing import AsyncIterator
+
+from fastapi import APIRouter, HTTPException, Depends, Request
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from images import MAX_UPLOAD_BYTES, save_image
 from routers.auth import get_current_user
 
 router = APIRouter()
 
-UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads"))
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-@router.post("/upload-image")
-async def upload_image(file: UploadFile = File(...), user: str = Depends(get_current_user)):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Solo imágenes")
-    filename = file.filename
-    dest_path = os.path.join(UPLOAD_DIR, filename)
-    contents = await file.read()
-    with open(dest_path, "wb") as f:
-        f.write(contents)
-    # Nota: servir archivos estáticos depende del host. Devolvemos ruta relativa.
-    return {"file_url": f"/uploads/{filename}"}
+# Margen para los bordes y encabezados del multipart
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413, detail=f"La imagen supera el máximo de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+    )
+
+
+async def _capped(stream: AsyncIterator[bytes], limit: int) -> AsyncIterator[bytes]:
+    # Corta la lectura del cuerpo en cuanto pasa el tope, aunque no haya Content-Length (chunked)
+    size = 0
+    async for chunk in stream:
+        size += len(chunk)
+        if size > limit:
+            raise _too_large()
+        yield chunk
+
+
+# El multipart se parsea a mano sobre request.stream(): con File(...) FastAPI
+# guardaba el cuerpo entero en un temporal antes de poder aplicar el tope
+@router.post(
+    "/upload-image",
+    openapi_extra={"requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+    }}}}},
+)
+async def upload_image(request: Request, user: str = Depends(get_current_user)):
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Se espera multipart/form-data con el campo file")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+        raise _too_large()
+    parser = MultiPartParser(request.headers, _capped(request.stream(), MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD), max_files=1)
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=400, detail="Falta el campo file")
+        if not (file.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail="Solo imágenes")
+        # Nota: servir archivos estáticos depende del host. Devolvemos rutas relativas.
+        return await save_image(file)
+    finally:
+        await form.close()
@@ -0,0 +1,231 @@
+"""Scheduler en proceso que envía las difusiones programadas.
+
+Arranca desde el lifespan de FastAPI. En cada tick toma (con un UPDATE
+condicional, atómico aunque haya varios workers) una difusión vencida por vez
+usando el índice (status, scheduled_time), y la despacha por lotes. El estado
+de cada destinatario queda en `broadcast_deliveries`: si el proceso se cae, la
+difusión queda "sending" con un lease vencido y se retoma sólo con los
+pendientes, sin reenviar lo ya entregado. `scheduled_time` está en UTC sin zona.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Broadcast, BroadcastDelivery
+from routers.broadcasts import get_recipients
+from whatsapp_client import get_sender, is_configured, normalize_recipient
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("BROADCAST_SCHEDULER_ENABLED", "1") == "1"
+INTERVAL_SECONDS = float(os.getenv("BROADCAST_SCHEDULER_INTERVAL", "15"))
+# Difusiones despachadas por tick (se toman de a una) y destinatarios por lote de envío
+CLAIM_LIMIT = int(os.getenv("BROADCAST_SCHEDULER_CLAIM", "5"))
+BATCH_SIZE = int(os.getenv("BROADCAST_SCHEDULER_BATCH", "200"))
+# Si una difusión "sending" no renovó su lease en este tiempo, se retoma
+LEASE_SECONDS = int(os.getenv("BROADCAST_SCHEDULER_LEASE", "300"))
+# Las programadas que vencieron hace más que esto no se envían: quedan "expired"
+# (p. ej. al arrancar con difusiones viejas o después de estar caído). 0 = sin límite
+GRACE_MINUTES = float(os.getenv("BROADCAST_SCHEDULER_GRACE", "60"))
+
+
+def expire_overdue_broadcasts(db: Session, now: datetime, grace_minutes: float = GRACE_MINUTES) -> List[int]:
+    """Marca "expired" las programadas vencidas hace más de `grace_minutes` y devuelve sus ids."""
+    if grace_minutes <= 0:
+        return []
+    cutoff = now - timedelta(minutes=grace_minutes)
+    overdue = and_(Broadcast.status == "scheduled", Broadcast.scheduled_time < cutoff)
+    ids = list(db.execute(select(Broadcast.id).where(overdue)).scalars())
+    if ids:
+        db.execute(
+            update(Broadcast)
+            .where(Broadcast.id.in_(ids), overdue)
+            .values(status="expired")
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return ids
+
+
+def claim_due_broadcasts(db: Session, now: datetime, limit: int = CLAIM_LIMIT) -> List[int]:
+    """Marca como "sending" difusiones vencidas (o con lease vencido) y devuelve sus ids."""
+    stale = now - timedelta(seconds=LEASE_SECONDS)
+    due = or_(
+        and_(Broadcast.status == "scheduled", Broadcast.scheduled_time <= now),
+        and_(Broadcast.status == "sending", Broadcast.claimed_at < stale),
+    )
+    candidates = db.execute(
+        select(Broadcast.id, Broadcast.status).where(due).order_by(Broadcast.scheduled_time).limit(limit)
+    ).all()
+    claimed = []
+    for broadcast_id, status in candidates:
+        # Compare-and-set: sólo uno gana si dos workers ven la misma fila
+        cond = Broadcast.scheduled_time <= now if status == "scheduled" else Broadcast.claimed_at < stale
+        result = db.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == status, cond)
+            .values(status="sending", claimed_at=now)
+        )
+        if result.rowcount == 1:
+            claimed.append(broadcast_id)
+    db.commit()
+    return claimed
+
+
+def prepare_deliveries(db: Session, broadcast_id: int) -> Optional[Tuple[str, Optional[str]]]:
+    """Crea las filas de entrega que falten; devuelve (mensaje, imagen)."""
+    b = db.get(Broadcast, broadcast_id)
+    if b is None:
+        return None
+    existing = set(db.execute(select(BroadcastDelivery.phone).where(BroadcastDelivery.broadcast_id == broadcast_id)).scalars())
+    for raw in get_recipients(db, broadcast_id):
+        phone = normalize_recipient(raw)
+        if phone and phone not in existing:
+            existing.add(phone)
+            db.add(BroadcastDelivery(broadcast_id=broadcast_id, phone=phone))
+    db.commit()
+    return b.message or "", b.image_url
+
+
+def next_pending(db: Session, broadcast_id: int, lease: datetime, limit: int = BATCH_SIZE) -> Optional[Tuple[datetime, List[Tuple[int, str]]]]:
+    """Renueva el lease y devuelve (nuevo lease, próximo lote); None si el lease ya no es nuestro."""
+    now = datetime.utcnow()
+    renewed = db.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == "sending", Broadcast.claimed_at == lease)
+        .values(claimed_at=now)
+    )
+    if renewed.rowcount != 1:
+        db.rollback()
+        return None
+    rows = db.execute(
+        select(BroadcastDelivery.id, BroadcastDelivery.phone)
+        .where(BroadcastDelivery.broadcast_id == broadcast_id, BroadcastDelivery.status == "pending")
+        .order_by(BroadcastDelivery.id)
+        .limit(limit)
+    ).all()
+    db.commit()
+    return now, [(r.id, r.phone) for r in rows]
+
+
+def record_results(db: Session, batch: List[Tuple[int, str]], results: List[dict]):
+    now = datetime.utcnow()
+    for (delivery_id, _), res in zip(batch, results):
+        values = {"attempts": BroadcastDelivery.attempts + 1}
+        if res.get("ok"):
+            values.update(status="sent", sent_at=now, error=None)
+        else:
+            values.update(status="failed", error=json.dumps(res.get("error"), ensure_ascii=False, default=str))
+        db.execute(update(BroadcastDelivery).where(BroadcastDelivery.id == delivery_id).values(**values))
+    db.commit()
+
+
+def finish_broadcast(db: Session, broadcast_id: int, lease: datetime) -> Optional[str]:
+    """Cierra la difusión sólo si sigue "sending" con nuestro lease; si no, devuelve None."""
+    failed = db.execute(
+        select(func.count(BroadcastDelivery.id))
+        .where(BroadcastDelivery.broadcast_id == broadcast_id, BroadcastDelivery.status == "failed")
+    ).scalar_one()
+    status = "failed" if failed else "sent"
+    result = db.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == "sending", Broadcast.claimed_at == lease)
+        .values(status=status, claimed_at=None)
+    )
+    db.commit()
+    return status if result.rowcount == 1 else None
+
+
+def _with_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def dispatch_broadcast(broadcast_id: int, lease: datetime) -> Optional[str]:
+    """Envía los pendientes mientras el lease (`claimed_at` del claim) siga siendo nuestro."""
+    prepared = await asyncio.to_thread(_with_session, prepare_deliveries, broadcast_id)
+    if prepared is None:
+        return None
+    message, image_url = prepared
+    sender = get_sender()
+    while True:
+        pending = await asyncio.to_thread(_with_session, next_pending, broadcast_id, lease)
+        if pending is None:
+            logger.warning("Difusión %s: se perdió el lease, se deja de enviar", broadcast_id)
+            return None
+        lease, batch = pending
+        if not batch:
+            break
+        results = await sender.send_many([phone for _, phone in batch], message, image_url)
+        await asyncio.to_thread(_with_session, record_results, batch, results)
+    return await asyncio.to_thread(_with_session, finish_broadcast, broadcast_id, lease)
+
+
+class BroadcastScheduler:
+    def __init__(self, interval: float = INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    async def tick(self) -> List[int]:
+        if not is_configured():
+            return []
+        claimed = []
+        # De a una: el lease de una difusión tomada sólo se renueva mientras se
+        # envía, así que no se toma la siguiente hasta terminar la anterior
+        for _ in range(CLAIM_LIMIT):
+            now = datetime.utcnow()
+            expired = await asyncio.to_thread(_with_session, expire_overdue_broadcasts, now)
+            if expired:
+                logger.warning(
+                    "Difusiones vencidas hace más de %s min, no se envían (quedan \"expired\"): %s",
+                    GRACE_MINUTES, expired,
+                )
+            batch = await asyncio.to_thread(_with_session, claim_due_broadcasts, now, 1)
+            if not batch:
+                break
+            broadcast_id = batch[0]
+            claimed.append(broadcast_id)
+            status = await dispatch_broadcast(broadcast_id, now)
+            logger.info("Difusión %s despachada: %s", broadcast_id, status)
+        return claimed
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Error en el scheduler de difusiones")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Cancelar a mitad de un envío es seguro: la difusión queda "sending" y
+        # se retoma con los pendientes cuando vence el lease
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+scheduler = BroadcastScheduler()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 # Auth
@@ -11,6 +11,28 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
+class UserCreate(BaseModel):
+    username: str
+    password: str
+    role: str = "seller"
+    seller: Optional[str] = None
+
+class UserUpdate(BaseModel):
+    password: Optional[str] = None
+    role: Optional[str] = None
+    seller: Optional[str] = None
+    active: Optional[bool] = None
+
+class UserOut(BaseModel):
+    id: int
+    username: str
+    role: str
+    seller: Optional[str] = None
+    active: bool
+    created_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
 # Clients
 class ClientBase(BaseModel):
     name: str
@@ -42,6 +64,10 @@ class ClientOut(ClientBase):
     class Config:
         from_attributes = True
 
+class TagCountOut(BaseModel):
+    name: str
+    count: int
+
 
 class ControlVariablesBase(BaseModel):
     coeficiente_regular: float = 1.5
@@ -62,6 +88,32 @@ class ControlVariablesOut(ControlVariablesBase):
         from_attributes = True
 
 
+class ControlVariablesCandidate(BaseModel):
+    """Juego de variables a simular: lo que no se manda toma el valor guardado."""
+    coeficiente_regular: Optional[float] = None
+    dias_nuevos: Optional[int] = None
+    pedidos_activo_frecuente: Optional[int] = None
+    pedidos_nuevo: Optional[int] = None
+    pedidos_vip: Optional[int] = None
+
+
+class ChurnSimulationRequest(BaseModel):
+    candidatos: List[ControlVariablesCandidate]
+
+
+class ChurnSimulationResult(BaseModel):
+    variables: ControlVariablesBase
+    # clase (1.1, 1.2, 2.1, 2.2, 4.1) -> contactos / facturación total
+    distribucion: Dict[str, int]
+    facturacion: Dict[str, float]
+
+
+class ChurnSimulationOut(BaseModel):
+    contactos: int
+    actual: ChurnSimulationResult
+    candidatos: List[ChurnSimulationResult]
+
+
 class ControlFrequencyBase(BaseModel):
     frecuencia: int
     frecuencia_coef: float
@@ -111,10 +163,50 @@ class MovementCreate(MovementBase):
 
 class MovementOut(MovementBase):
     id: int
+    client_id: Optional[int] = None
 
     class Config:
         from_attributes = True
 
+class ClientTotalsOut(BaseModel):
+    client_id: int
+    nombre: str
+    pedidos: int
+    facturacion_total: float
+    primer_pedido: datetime
+    ultimo_pedido: datetime
+
+
+class RevenuePointOut(BaseModel):
+    periodo: datetime
+    grupo: Optional[str] = None
+    total: float
+    cantidad: int
+    contactos: int
+
+
+class ImportRejectedRow(BaseModel):
+    line: int
+    error: str
+    row: dict
+
+
+class ImportWarningRow(BaseModel):
+    line: int
+    warning: str
+
+
+class ImportReportOut(BaseModel):
+    read: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    repeated_count: int = 0
+    rejected_count: int = 0
+    rejected: List[ImportRejectedRow] = []
+    warnings: List[ImportWarningRow] = []
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+
 # Broadcasts
 class BroadcastCreate(BaseModel):
     message: Optional[str] = ""
@@ -130,3 +222,13 @@ class BroadcastOut(BaseModel):
     status: str
     class Config:
         from_attributes = True
+
+class BroadcastSummaryOut(BaseModel):
+    id: int
+    message: Optional[str] = ""
+    image_url: Optional[str] = None
+    recipients_count: int
+    # Primeros destinatarios, para mostrar en el listado
+    recipients_preview: List[str] = []
+    scheduled_time: Optional[datetime] = None
+    status: str
@@ -0,0 +1,166 @@
+"""Búsqueda de texto completo sobre clientes (nombre, teléfono y notas).
+
+En SQLite se usa una tabla FTS5 `clients_fts` (rowid = clients.id) con
+tokenizer `unicode61 remove_diacritics 2` para que "jose" encuentre "José", e
+índices de prefijo para la búsqueda mientras se escribe. Se mantiene al día con
+triggers sobre `clients`, así que cualquier alta, edición o baja (desde la API,
+importaciones o SQL directo) queda indexada.
+
+En PostgreSQL el equivalente es un índice GIN sobre la expresión tsvector
+(con `unaccent` si la extensión está disponible); al ser un índice de
+expresión se actualiza solo. Con otros motores, o si el SQLite no trae FTS5,
+se cae al LIKE de siempre.
+"""
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Integer, bindparam, column, func, literal_column, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from models import Client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# Pesos de bm25 por columna (name, phone, notes)
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Se fija en `ensure_client_search` según lo que soporte la base
+_backend: Optional[str] = None
+
+clients_fts = table("clients_fts", column("rowid", Integer))
+
+# Teléfono sólo con dígitos, para que "11 5555" y "+54 9 11-5555" coincidan
+_SQLITE_DIGITS = "replace(replace(replace(replace(replace(replace(coalesce({p}, ''), ' ', ''), '-', ''), '+', ''), '(', ''), ')', ''), '.', '')"
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5("
+    "name, phone, notes, tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+    """CREATE TRIGGER IF NOT EXISTS clients_fts_ai AFTER INSERT ON clients BEGIN
+        INSERT INTO clients_fts(rowid, name, phone, notes)
+        VALUES (new.id, new.name, coalesce(new.phone, '') || ' ' || {digits_new}, new.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS clients_fts_ad AFTER DELETE ON clients BEGIN
+        DELETE FROM clients_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS clients_fts_au AFTER UPDATE OF name, phone, notes ON clients BEGIN
+        DELETE FROM clients_fts WHERE rowid = old.id;
+        INSERT INTO clients_fts(rowid, name, phone, notes)
+        VALUES (new.id, new.name, coalesce(new.phone, '') || ' ' || {digits_new}, new.notes);
+    END""",
+]
+
+_SQLITE_REBUILD = [
+    "DELETE FROM clients_fts",
+    "INSERT INTO clients_fts(rowid, name, phone, notes) "
+    "SELECT id, name, coalesce(phone, '') || ' ' || {digits_row}, notes FROM clients",
+]
+
+
+def _sqlite_sql(stmt: str) -> str:
+    return stmt.format(digits_new=_SQLITE_DIGITS.format(p="new.phone"), digits_row=_SQLITE_DIGITS.format(p="phone"))
+
+
+def _ensure_sqlite(engine: Engine) -> bool:
+    try:
+        with engine.begin() as conn:
+            for stmt in _SQLITE_DDL:
+                conn.execute(text(_sqlite_sql(stmt)))
+            indexed = conn.execute(text("SELECT count(*) FROM clients_fts")).scalar_one()
+            total = conn.execute(text("SELECT count(*) FROM clients")).scalar_one()
+            # Primera vez (o base tocada sin triggers): se reindexa todo
+            if indexed != total:
+                for stmt in _SQLITE_REBUILD:
+                    conn.execute(text(_sqlite_sql(stmt)))
+    except DBAPIError:
+        logger.warning("SQLite sin FTS5: la búsqueda de clientes usa LIKE")
+        return False
+    return True
+
+
+def _pg_document():
+    doc = func.concat_ws(" ", Client.name, Client.phone, Client.notes)
+    return func.to_tsvector(literal_column("'simple'::regconfig"), func.f_unaccent(doc))
+
+
+def _ensure_postgres(engine: Engine) -> bool:
+    try:
+        with engine.begin() as conn:
+            has_unaccent = conn.execute(
+                text("SELECT 1 FROM pg_available_extensions WHERE name = 'unaccent'")
+            ).first() is not None
+            if has_unaccent:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+                body = "SELECT public.unaccent('public.unaccent', $1)"
+            else:
+                body = "SELECT $1"
+            # unaccent() no es IMMUTABLE: hace falta un wrapper para usarlo en un índice
+            conn.execute(text(
+                f"CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text "
+                f"LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS $$ {body} $$"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_clients_search ON clients USING GIN "
+                "(to_tsvector('simple'::regconfig, f_unaccent(concat_ws(' ', name, phone, notes))))"
+            ))
+    except DBAPIError:
+        logger.warning("No se pudo crear el índice de búsqueda de clientes: se usa LIKE")
+        return False
+    return True
+
+
+def ensure_client_search(engine: Engine):
+    global _backend
+    if engine.dialect.name == "sqlite" and _ensure_sqlite(engine):
+        _backend = "fts5"
+    elif engine.dialect.name == "postgresql" and _ensure_postgres(engine):
+        _backend = "tsvector"
+    else:
+        _backend = None
+
+
+def search_terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q or "")
+
+
+def apply_client_search(query, q: str, candidates: Optional[int] = None) -> Tuple[object, list]:
+    """Filtra `query` (Query o Select sobre Client) por `q`.
+
+    Devuelve la consulta filtrada y el ORDER BY por relevancia. Cada palabra
+    se busca como prefijo y deben aparecer todas. Con `candidates`, en FTS5 el
+    top por bm25 se resuelve dentro de la tabla virtual y sólo esos
+    `candidates` clientes llegan al join; el ranking sigue siendo sobre todos
+    los matches.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return query, []
+    if _backend == "fts5":
+        # Cada término entre comillas: el texto del usuario nunca se interpreta como sintaxis FTS5
+        match = " AND ".join('"{}"*'.format(t) for t in terms)
+        # "score" y no "rank": rank es una columna oculta de FTS5
+        score = func.bm25(literal_column("clients_fts"), *BM25_WEIGHTS).label("score")
+        hits = (
+            select(clients_fts.c.rowid.label("client_id"), score)
+            .where(literal_column("clients_fts").op("MATCH")(bindparam("fts_query", match)))
+        )
+        if candidates:
+            # Mismo orden que la consulta de afuera (relevancia, id descendente)
+            hits = hits.order_by(score, clients_fts.c.rowid.desc()).limit(candidates)
+        hits = hits.subquery("fts_hits")
+        # bm25 de FTS5 es negativo: más chico es más relevante
+        return query.join(hits, hits.c.client_id == Client.id), [hits.c.score]
+    if _backend == "tsvector":
+        tsquery = func.to_tsquery(
+            literal_column("'simple'::regconfig"),
+            func.f_unaccent(" & ".join(f"{t}:*" for t in terms)),
+        )
+        document = _pg_document()
+        return query.filter(document.op("@@")(tsquery)), [func.ts_rank(document, tsquery).desc()]
+    for t in terms:
+        qlike = f"%{t}%"
+        query = query.filter((Client.name.like(qlike)) | (Client.phone.like(qlike)) | (Client.notes.like(qlike)))
+    return query, []
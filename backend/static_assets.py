@@ -0,0 +1,148 @@
+"""Assets del frontend con huella de contenido, precomprimidos, y páginas con ETag.
+
+`build_assets()` copia `script.js`, `assets/style.css` y `static/img/*` a
+`ASSETS_BUILD_DIR` como `<nombre>.<hash12><ext>`, con sus versiones `.gz` (y
+`.br` si está el paquete `brotli`) ya comprimidas al máximo. Como el nombre
+depende del contenido, `/build` los sirve con caché `immutable` (ver
+static_files.py); un cambio en el archivo genera otra URL. Se puede correr en
+el build (`python static_assets.py`) y al arrancar sólo confirma lo que ya existe.
+
+Las páginas HTML se sirven con las URLs de los assets reemplazadas por las de
+`/build` y un ETag del contenido final: el navegador revalida con
+If-None-Match y, si nada cambió, recibe un 304 sin cuerpo.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se sirve gzip
+    brotli = None
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BUILD_DIR = Path(os.getenv("ASSETS_BUILD_DIR", str(Path(__file__).resolve().parent / "build")))
+BUILD_URL = "/build"
+
+# Extensiones que vale la pena comprimir (las imágenes ya vienen comprimidas)
+COMPRESSIBLE = {".js", ".css", ".html", ".svg", ".json", ".txt", ".map"}
+# <nombre>.<hash12><ext> (las versiones .gz/.br nunca se piden directo)
+FINGERPRINTED = re.compile(r"^.+\.[0-9a-f]{12}\.[a-z0-9]+$")
+PAGE_CACHE_CONTROL = "no-cache"
+
+
+def asset_sources() -> Dict[str, Path]:
+    """URL con la que el HTML referencia cada asset -> archivo fuente."""
+    sources = {
+        "/script.js": PROJECT_ROOT / "script.js",
+        "/assets/style.css": PROJECT_ROOT / "assets" / "style.css",
+    }
+    img_dir = PROJECT_ROOT / "static" / "img"
+    if img_dir.is_dir():
+        for path in sorted(img_dir.iterdir()):
+            if path.is_file():
+                sources[f"/static/img/{path.name}"] = path
+    return {url: path for url, path in sources.items() if path.is_file()}
+
+
+def _write_once(dest: Path, data: bytes):
+    # Mismo nombre = mismo contenido: si ya está no se toca (varios workers arrancando a la vez)
+    if dest.exists():
+        return
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=".asset-")
+    with os.fdopen(fd, "wb") as out:
+        out.write(data)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, dest)
+
+
+def build_assets(build_dir: Path = BUILD_DIR) -> Dict[str, str]:
+    """Genera los archivos con huella (y comprimidos) y devuelve URL original -> URL de /build."""
+    build_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for url, source in asset_sources().items():
+        data = source.read_bytes()
+        name = f"{source.stem}.{hashlib.sha256(data).hexdigest()[:12]}{source.suffix}"
+        dest = build_dir / name
+        if source.suffix in COMPRESSIBLE:
+            gz, br = dest.with_name(name + ".gz"), dest.with_name(name + ".br")
+            if not gz.exists():
+                # mtime=0: el .gz es reproducible, igual que el nombre
+                _write_once(gz, gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None and not br.exists():
+                _write_once(br, brotli.compress(data, quality=11))
+        _write_once(dest, data)
+        manifest[url] = f"{BUILD_URL}/{name}"
+    return manifest
+
+
+manifest: Dict[str, str] = build_assets()
+
+
+def asset_url(url: str) -> str:
+    """URL con huella del asset (para las plantillas: `{{ asset('/assets/style.css') }}`)."""
+    return manifest.get(url, url)
+
+
+def rewrite_asset_urls(html: str) -> str:
+    # Sólo las URLs entre comillas: "/script.js" no toca "/script.json"
+    for url, fingerprinted in manifest.items():
+        html = html.replace(f'"{url}"', f'"{fingerprinted}"')
+    return html
+
+
+def html_response(request: Request, body: bytes, media_type: str = "text/html; charset=utf-8") -> Response:
+    """Respuesta con ETag del contenido: 304 sin cuerpo si el navegador ya la tiene."""
+    # Import local: etags depende de routers.auth, que usa este módulo para /login
+    from etags import etag_matches
+
+    # Débil: el mismo contenido puede salir comprimido o no (ver compression.py)
+    etag = 'W/"{}"'.format(hashlib.sha256(body).hexdigest()[:24])
+    headers = {"ETag": etag, "Cache-Control": PAGE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+# archivo -> (mtime_ns, cuerpo ya reescrito)
+_pages: Dict[Path, Tuple[int, bytes]] = {}
+
+
+def _page_body(path: Path) -> bytes:
+    mtime = path.stat().st_mtime_ns
+    cached = _pages.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    body = path.read_bytes()
+    if path.suffix == ".html":
+        body = rewrite_asset_urls(body.decode("utf-8")).encode("utf-8")
+    _pages[path] = (mtime, body)
+    return body
+
+
+def page_response(request: Request, filename: str, media_type: Optional[str] = None) -> Response:
+    """Sirve un archivo de la raíz del proyecto (HTML con assets reescritos) con ETag."""
+    path = PROJECT_ROOT / filename
+    if media_type is None:
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+    return html_response(request, _page_body(path), media_type)
+
+
+def render_template(templates, request: Request, name: str, context: Optional[dict] = None) -> Response:
+    """Como `TemplateResponse`, pero con ETag del HTML renderizado."""
+    body = templates.get_template(name).render({"request": request, **(context or {})})
+    return html_response(request, body.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    for original, built in build_assets().items():
+        print(f"{original} -> {built}")
@@ -0,0 +1,72 @@
+"""Archivos estáticos con caché larga para los que tienen el contenido en el nombre,
+y versiones precomprimidas elegidas según Accept-Encoding."""
+import os
+import re
+from mimetypes import guess_type
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles que marca `immutable` los archivos cuyo nombre coincide con `pattern`.
+
+    Si el contenido cambia, cambia el nombre (y la URL): el navegador y los
+    CDN pueden guardarlos un año sin volver a preguntar. El resto se sirve
+    como siempre, con ETag/Last-Modified.
+    """
+
+    def __init__(self, *args, pattern: re.Pattern, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pattern = pattern
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if self.pattern.match(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+# Content-Encoding -> extensión del archivo precomprimido, en orden de preferencia
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepted_encodings(scope) -> set:
+    """Codificaciones de Accept-Encoding, sin las que vienen con q=0."""
+    header = Headers(scope=scope).get("accept-encoding", "")
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        name, _, value = params.partition("=")
+        try:
+            q = float(value) if name.strip() == "q" else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(ImmutableStaticFiles):
+    """Sirve `<archivo>.br` / `<archivo>.gz` (generados en el build) si el cliente los acepta."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        accepted = accepted_encodings(scope)
+        for encoding, suffix in PRECOMPRESSED:
+            compressed = f"{full_path}{suffix}"
+            if encoding in accepted and os.path.isfile(compressed):
+                media_type = guess_type(str(full_path))[0] or "text/plain"
+                response = FileResponse(compressed, status_code=status_code, stat_result=os.stat(compressed), media_type=media_type)
+                response.headers["Content-Encoding"] = encoding
+                if self.is_not_modified(response.headers, Headers(scope=scope)):
+                    response = NotModifiedResponse(response.headers)
+                break
+        else:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Vary"] = "Accept-Encoding"
+        if self.pattern.match(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
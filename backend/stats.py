@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from dashboard import period_start
+from models import Movement
+
+
+def movement_kpis(db: Session, now: Optional[datetime] = None, days: int = 30) -> dict:
+    """KPIs de movimientos calculados con agregados SQL.
+
+    No carga filas en memoria: la ventana de `days` días se resuelve con el
+    índice sobre `movements.date` y el resto son SUM/COUNT del lado de la base.
+    La ventana son días UTC completos (hoy y los `days - 1` anteriores, como el
+    período del dashboard): el resultado sólo cambia con los datos o al pasar
+    la medianoche, que es cuando vencen su ETag y su caché.
+    """
+    now = now or datetime.utcnow()
+    cutoff = period_start(now, days)
+
+    ingresos_totales = db.execute(select(func.coalesce(func.sum(Movement.value), 0.0))).scalar_one()
+
+    pedidos, ingresos, activos = db.execute(
+        select(
+            func.count(Movement.id),
+            func.coalesce(func.sum(Movement.value), 0.0),
+            # Por contact_key, como churn y el dashboard; COUNT(DISTINCT) ignora
+            # NULL, así que los contactos vacíos (clave "") no cuentan
+            func.count(func.distinct(func.nullif(Movement.contact_key, ""))),
+        ).where(Movement.date >= cutoff)
+    ).one()
+
+    ingresos = float(ingresos)
+    return {
+        "ingresos_totales": float(ingresos_totales),
+        "ingresos_30d": ingresos,
+        "pedidos_30d": pedidos,
+        "ticket_promedio_30d": ingresos / pedidos if pedidos else 0.0,
+        "clientes_activos_30d": activos,
+    }
@@ -0,0 +1,111 @@
+"""Etiquetas de clientes normalizadas en `tags` / `client_tags`.
+
+`Client.tags` sigue siendo el texto separado por comas que carga el usuario
+(y el que devuelve la API); las tablas se sincronizan desde ese texto en cada
+alta o edición y son las que se usan para filtrar y contar, por índice y con
+coincidencia exacta ("vip" ya no coincide con "novip").
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import Client, ClientTag, Tag
+
+BACKFILL_BATCH = 1000
+
+
+def normalize_tag(raw: str) -> str:
+    return " ".join(raw.split()).lower()
+
+
+def parse_tags(raw: Optional[str]) -> List[str]:
+    """"VIP, mayorista,,vip" -> ["vip", "mayorista"] (sin repetidos, en orden)."""
+    seen = []
+    for part in (raw or "").split(","):
+        name = normalize_tag(part)
+        if name and name not in seen:
+            seen.append(name)
+    return seen
+
+
+def parse_tag_params(values: Optional[Iterable[str]]) -> List[str]:
+    # Acepta ?tag=a&tag=b y también ?tag=a,b
+    names: List[str] = []
+    for value in values or []:
+        for name in parse_tags(value):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def tag_ids(db: Session, names: List[str], create: bool = False) -> Dict[str, int]:
+    if not names:
+        return {}
+    ids = dict(db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    missing = [n for n in names if n not in ids]
+    if create and missing:
+        db.execute(insert(Tag), [{"name": n} for n in missing])
+        ids.update(db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(missing))).all())
+    return ids
+
+
+def set_client_tags(db: Session, client_id: int, raw: Optional[str]):
+    """Deja en client_tags exactamente las etiquetas de `raw`. No hace commit."""
+    wanted = set(tag_ids(db, parse_tags(raw), create=True).values())
+    current = set(db.execute(select(ClientTag.tag_id).where(ClientTag.client_id == client_id)).scalars())
+    if current - wanted:
+        db.execute(delete(ClientTag).where(ClientTag.client_id == client_id, ClientTag.tag_id.in_(current - wanted)))
+    if wanted - current:
+        db.execute(insert(ClientTag), [{"client_id": client_id, "tag_id": t} for t in wanted - current])
+
+
+def clear_client_tags(db: Session, client_id: int):
+    db.execute(delete(ClientTag).where(ClientTag.client_id == client_id))
+
+
+def tag_filter(names: List[str], mode: str = "any"):
+    """Condición sobre Client.id: alguna (any) o todas (all) las etiquetas."""
+    matching = (
+        select(ClientTag.client_id)
+        .join(Tag, Tag.id == ClientTag.tag_id)
+        .where(Tag.name.in_(names))
+    )
+    if mode == "all" and len(names) > 1:
+        matching = matching.group_by(ClientTag.client_id).having(func.count(ClientTag.tag_id) == len(names))
+    return Client.id.in_(matching)
+
+
+def tag_counts(db: Session) -> List[dict]:
+    rows = db.execute(
+        select(Tag.name, func.count(ClientTag.client_id))
+        .join(ClientTag, ClientTag.tag_id == Tag.id)
+        .group_by(Tag.id, Tag.name)
+        .order_by(func.count(ClientTag.client_id).desc(), Tag.name)
+    ).all()
+    return [{"name": name, "count": count} for name, count in rows]
+
+
+def backfill_client_tags(db: Session):
+    """Carga client_tags desde Client.tags para los clientes que aún no tienen filas."""
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Client.id, Client.tags)
+            .where(
+                Client.id > last_id,
+                func.coalesce(Client.tags, "") != "",
+                ~select(ClientTag.client_id).where(ClientTag.client_id == Client.id).exists(),
+            )
+            .order_by(Client.id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            return
+        parsed = [(client_id, parse_tags(raw)) for client_id, raw in rows]
+        ids = tag_ids(db, sorted({n for _, names in parsed for n in names}), create=True)
+        links = [{"client_id": client_id, "tag_id": ids[n]} for client_id, names in parsed for n in names]
+        if links:
+            db.execute(insert(ClientTag), links)
+        db.commit()
+        last_id = rows[-1].id
@@ -0,0 +1,54 @@
+"""Configuración común de los tests: base SQLite temporal y app sin tareas de fondo.
+
+Las variables de entorno se fijan antes de importar `database`/`main`, que leen
+DB_URL al importarse. Correr desde backend/: `python -m pytest -q tests`.
+"""
+import os
+import sys
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="pietro-tests-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ.pop("DB_READ_URL", None)
+os.environ.pop("DB_READ_ONLY", None)
+os.environ["BROADCAST_SCHEDULER_ENABLED"] = "0"
+os.environ["METRICS_ENABLED"] = "0"
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+import main  # noqa: E402,F401  crea las tablas y corre las migraciones
+from database import Base, SessionLocal  # noqa: E402
+from models import DataVersion, User  # noqa: E402
+from result_cache import result_cache  # noqa: E402
+
+# Se siembran al arrancar: los tests no los borran
+KEEP_TABLES = {DataVersion.__tablename__, User.__tablename__}
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        # Cada test arranca con las tablas de datos vacías y la caché limpia
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name not in KEEP_TABLES:
+                session.execute(delete(table))
+        session.commit()
+        session.close()
+        result_cache.clear()
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from routers.auth import create_access_token
+
+    with TestClient(main.app) as c:
+        c.headers["Authorization"] = "Bearer " + create_access_token({"sub": "pietro"})
+        yield c
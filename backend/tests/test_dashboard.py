@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+from routers.movements import _create_movement
+from schemas import MovementCreate
+
+
+def add(db, contact, value, type="Venta", days_ago=1):
+    when = datetime.utcnow() - timedelta(days=days_ago)
+    _create_movement(db, MovementCreate(date=when, type=type, contact=contact, value=value))
+
+
+def test_top_sales_are_all_time_sales_only(client, db):
+    add(db, "José Pérez", 100)
+    add(db, " jose  perez", 50, days_ago=400)
+    add(db, "Ana", 120)
+    add(db, "Ana", 500, type="Gasto")
+    add(db, "", 900)
+
+    body = client.get("/dashboard", params={"days": 30}).json()
+
+    assert body["top_ventas"] == [
+        {"contacto": "José Pérez", "facturacion": 150.0},
+        {"contacto": "Ana", "facturacion": 120.0},
+    ]
+    # El top del período sigue saliendo del rollup (ventas y gastos)
+    assert body["top_clientes"][0] == {"contacto": "(sin contacto)", "facturacion": 900.0}
+    assert {"contacto": "Ana", "facturacion": 620.0} in body["top_clientes"]
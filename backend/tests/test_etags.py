@@ -0,0 +1,34 @@
+def revalidate(client, path):
+    first = client.get(path)
+    assert first.status_code == 200
+    return client.get(path, headers={"If-None-Match": first.headers["ETag"]})
+
+
+def post_movement(client, contact):
+    r = client.post("/movimientos/", json={
+        "date": "2024-06-01T12:00:00", "type": "Venta", "contact": contact, "value": 100.0,
+    })
+    assert r.status_code == 200
+
+
+def test_unchanged_data_is_304(client):
+    assert revalidate(client, "/clientes/").status_code == 304
+
+
+def test_client_summary_etag_follows_movements(client):
+    assert client.post("/clientes/", json={"name": "Ana", "phone": "1"}).status_code == 200
+    post_movement(client, "Ana")
+    first = client.get("/clientes/resumen")
+    assert [(r["nombre"], r["pedidos"]) for r in first.json()] == [("Ana", 1)]
+
+    post_movement(client, "ana")
+    second = client.get("/clientes/resumen", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.json()[0]["pedidos"] == 2
+
+
+def test_router_tables_unchanged_for_other_client_routes(client):
+    first = client.get("/clientes/")
+    post_movement(client, "Ana")
+    # /clientes/ no lee movements: sigue valiendo el ETag
+    assert client.get("/clientes/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
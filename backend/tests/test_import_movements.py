@@ -0,0 +1,122 @@
+import io
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, inspect, select
+from sqlalchemy.orm import Session
+
+import import_movements
+from database import Base
+from import_movements import import_csv
+from migrations import ensure_unique_natural_key
+from models import Movement, movement_natural_key
+
+HEADER = "Fecha,Tipo,Vendedor,Descripción,Categoria de Gasto,Contacto,Estado,M. de Pago,Valor\n"
+SALE = "01/06/2024,Venta,Lu,Pizza,No Aplica,Ana,Pagada,Efectivo,\"$ 1.500\"\n"
+OTHER = "02/06/2024,Venta,Lu,Empanadas,No Aplica,Beto,Pagada,Efectivo,\"$ 900\"\n"
+
+
+def run_import(db, body, chunk_size=500):
+    return import_csv(io.StringIO(HEADER + body), db, chunk_size)
+
+
+def count_movements(db):
+    return db.query(Movement).count()
+
+
+def test_identical_rows_in_file_are_kept_and_warned(db):
+    report = run_import(db, SALE + OTHER + SALE + SALE, chunk_size=2)
+
+    assert report.inserted == 4
+    assert report.duplicates == 0
+    assert report.repeated_count == 2
+    assert [(w.line, w.warning) for w in report.warnings] == [
+        (4, "Fila idéntica a la línea 2: se importa como otro movimiento"),
+        (5, "Fila idéntica a la línea 2: se importa como otro movimiento"),
+    ]
+    assert count_movements(db) == 4
+
+
+def test_repeat_tracking_is_bounded(db, monkeypatch):
+    monkeypatch.setattr(import_movements, "REPEAT_WINDOW", 2)
+    third = "03/06/2024,Venta,Lu,Fugazza,No Aplica,Caro,Pagada,Efectivo,\"$ 700\"\n"
+
+    # SALE sigue en la ventana (fue vista hace poco): es una repetición
+    report = run_import(db, SALE + OTHER + SALE)
+    assert (report.inserted, report.repeated_count) == (3, 1)
+
+    # Con dos filas distintas en el medio SALE salió de la ventana: cuenta como duplicado
+    report = run_import(db, SALE + OTHER + third + SALE)
+    assert (report.inserted, report.duplicates, report.repeated_count) == (1, 3, 0)
+    assert count_movements(db) == 4
+
+
+def test_reimport_is_idempotent(db):
+    run_import(db, SALE + SALE + OTHER)
+    again = run_import(db, SALE + SALE + OTHER)
+
+    assert again.inserted == 0
+    assert again.duplicates == 3
+    assert count_movements(db) == 3
+
+
+def test_file_with_more_repeats_adds_only_the_new_ones(db):
+    run_import(db, SALE)
+    report = run_import(db, SALE + SALE)
+
+    assert (report.inserted, report.duplicates) == (1, 1)
+    assert count_movements(db) == 2
+
+
+def test_hand_entered_duplicates_get_their_own_key(db):
+    fields = dict(date=datetime(2024, 6, 1), type="Venta", contact="Ana", value=1500.0, description="Pizza")
+    db.add_all([Movement(**fields), Movement(**fields)])
+    db.commit()
+
+    keys = db.execute(select(Movement.natural_key).order_by(Movement.id)).scalars().all()
+    base = (fields["date"], "Ana", 1500.0, "Pizza")
+    assert keys == [movement_natural_key(*base), movement_natural_key(*base, 1)]
+    # El archivo con esas dos ventas ya está importado
+    assert run_import(db, SALE + SALE).duplicates == 2
+
+
+def test_concurrent_insert_is_retried(db, monkeypatch):
+    # Otra importación inserta la misma fila entre el SELECT de claves y el INSERT
+    original = import_movements.fill_contact_columns
+    raced = []
+
+    def racing_fill(session, rows):
+        if not raced:
+            raced.append(True)
+            other = Session(bind=session.get_bind())
+            other.execute(insert(Movement), [dict(rows[0], contact_key="ana", client_id=None)])
+            other.commit()
+            other.close()
+        original(session, rows)
+
+    monkeypatch.setattr(import_movements, "fill_contact_columns", racing_fill)
+    report = run_import(db, SALE + OTHER)
+
+    assert (report.inserted, report.duplicates) == (1, 1)
+    assert count_movements(db) == 2
+
+
+def test_migration_renumbers_legacy_duplicates(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(engine)
+    # Base anterior: índice no único y la misma clave en filas idénticas
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_movements_natural_key")
+        conn.exec_driver_sql("CREATE INDEX ix_movements_natural_key ON movements (natural_key)")
+        base = (datetime(2024, 6, 1), "Ana", 1500.0, "Pizza")
+        row = dict(date=base[0], type="Venta", contact="Ana", value=1500.0, description="Pizza",
+                   natural_key=movement_natural_key(*base))
+        conn.execute(insert(Movement), [row, row, row])
+
+    ensure_unique_natural_key(engine)
+
+    indexes = {i["name"]: i for i in inspect(engine).get_indexes("movements")}
+    assert indexes["ix_movements_natural_key"]["unique"]
+    with engine.connect() as conn:
+        keys = conn.execute(select(Movement.natural_key).order_by(Movement.id)).scalars().all()
+    assert keys == [movement_natural_key(*base, n) for n in range(3)]
+    engine.dispose()
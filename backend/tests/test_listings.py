@@ -0,0 +1,92 @@
+import asyncio
+import importlib
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from models import Client, Movement
+
+# Pueden traer la tabla entera o calcular con CPU: consultan por la sesión async
+# del request y dejan la validación, la clasificación y el JSON al threadpool
+CPU_STEPS = [
+    ("GET", "/clientes/", "routers.clients", "model_json"),
+    ("GET", "/clientes/?fast=1", "routers.clients", "rows_json"),
+    ("GET", "/clientes/filtrar?q=cliente", "routers.clients", "model_json"),
+    ("GET", "/clientes/resumen", "routers.clients", "model_json"),
+    ("GET", "/movimientos/", "routers.movements", "_encode_movements"),
+    ("GET", "/churn/", "routers.churn", "_classify_rollup_json"),
+    ("GET", "/churn/?engine=vector", "routers.churn", "_classify_vector_json"),
+    ("POST", "/churn/simulate", "routers.churn", "_simulate"),
+]
+
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@pytest.mark.parametrize("method,path,module,name", CPU_STEPS)
+def test_cpu_work_runs_off_the_event_loop(client, seeded, monkeypatch, method, path, module, name):
+    [route] = [r for r in main.app.routes if getattr(r, "path", None) == path.split("?")[0] and method in r.methods]
+    assert asyncio.iscoroutinefunction(route.endpoint)
+
+    module = importlib.import_module(module)
+    original = getattr(module, name)
+    calls = []
+
+    def spy(*args, **kwargs):
+        calls.append(on_event_loop())
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, spy)
+    body = {"candidatos": [{"pedidos_vip": 3}]} if method == "POST" else None
+    assert client.request(method, path, json=body).status_code == 200
+    assert calls and not any(calls)
+
+
+@pytest.fixture
+def seeded(db):
+    start = datetime(2024, 6, 1)
+    db.add_all(Client(name=f"Cliente {i}", phone=str(i), notes="ñandú") for i in range(5))
+    db.add_all(
+        Movement(date=start + timedelta(hours=i), type="Venta", contact=f"Cliente {i % 5}", value=1.5 * i + 1e16 * (i == 3))
+        for i in range(12)
+    )
+    db.commit()
+
+
+@pytest.mark.parametrize("path", ["/clientes/", "/clientes/filtrar?q=cliente", "/movimientos/", "/movimientos/?limit=5"])
+def test_prebuilt_body_matches_fast_mode(client, seeded, path):
+    normal = client.get(path)
+    fast = client.get(path, params={"fast": 1})
+    assert normal.status_code == 200
+    assert normal.headers["content-type"] == "application/json"
+    assert normal.content == fast.content
+
+
+def test_headers_survive_prebuilt_response(client, seeded):
+    r = client.get("/movimientos/", params={"limit": 5})
+    assert len(r.json()) == 5
+    assert r.headers["X-Next-Cursor"]
+    assert r.headers["ETag"]
+    assert client.get("/movimientos/", headers={"If-None-Match": r.headers["ETag"]}, params={"limit": 5}).status_code == 304
+
+
+def test_contact_filter_uses_normalized_key_across_pages(client, seeded):
+    first = client.get("/movimientos/", params={"contact": "  CLIENTE   1 ", "limit": 2})
+    assert [m["contact"] for m in first.json()] == ["Cliente 1", "Cliente 1"]
+    rest = client.get("/movimientos/", params={"contact": "cliente 1", "limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [m["contact"] for m in rest.json()] == ["Cliente 1"]
+    assert "X-Next-Cursor" not in rest.headers
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_streaming_exports_are_not_gzipped(client, seeded, fmt):
+    r = client.get("/movimientos/export", params={"format": fmt}, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert "content-encoding" not in r.headers
+    assert "Cliente 1" in r.text
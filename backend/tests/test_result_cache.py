@@ -0,0 +1,147 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from models import Broadcast, Client, Movement
+from result_cache import result_cache
+from versions import get_versions
+
+TABLES = ("clients", "broadcasts", "movements")
+
+
+def new_client(name="Ana"):
+    return Client(name=name, phone="5491100000000")
+
+
+def new_movement(contact="Ana", value=100.0):
+    return Movement(date=datetime(2024, 6, 1), type="Venta", contact=contact, value=value)
+
+
+def new_broadcast():
+    return Broadcast(message="Hola", recipients_json="[]")
+
+
+FACTORIES = {
+    "clients": new_client,
+    "movements": new_movement,
+    "broadcasts": new_broadcast,
+}
+EDITS = {
+    "clients": lambda obj: setattr(obj, "notes", "llamar"),
+    "movements": lambda obj: setattr(obj, "value", 250.0),
+    "broadcasts": lambda obj: setattr(obj, "status", "scheduled"),
+}
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+def cached(db, compute, tables=TABLES):
+    return result_cache.get_or_compute(db, "test", (), tables, compute)
+
+
+def test_hit_until_a_table_changes(db):
+    compute = Counter()
+    assert cached(db, compute) == 1
+    assert cached(db, compute) == 1
+    assert compute.calls == 1
+
+
+@pytest.mark.parametrize("table", TABLES)
+def test_create_update_delete_invalidate(db, table):
+    compute = Counter()
+    cached(db, compute)
+
+    obj = FACTORIES[table]()
+    db.add(obj)
+    db.commit()
+    assert cached(db, compute) == 2
+
+    EDITS[table](obj)
+    db.commit()
+    assert cached(db, compute) == 3
+
+    db.delete(obj)
+    db.commit()
+    assert cached(db, compute) == 4
+
+
+def test_core_update_invalidates(db):
+    db.add(new_movement())
+    db.commit()
+    compute = Counter()
+    cached(db, compute)
+
+    db.execute(update(Movement).values(value=1.0))
+    db.commit()
+    assert cached(db, compute) == 2
+
+
+def test_commit_drops_entry_and_bumps_version(db):
+    compute = Counter()
+    cached(db, compute)
+    before = get_versions(db, TABLES)
+    invalidations = result_cache.stats()["invalidations"]
+
+    db.add(new_client())
+    db.commit()
+
+    after = get_versions(db, TABLES)
+    assert after["clients"] == before["clients"] + 1
+    assert after["movements"] == before["movements"]
+    assert result_cache.stats()["invalidations"] == invalidations + 1
+
+
+def test_other_tables_keep_entry(db):
+    compute = Counter()
+    cached(db, compute, tables=("movements",))
+
+    db.add(new_broadcast())
+    db.commit()
+    assert cached(db, compute, tables=("movements",)) == 1
+
+
+def test_rollback_keeps_entry_and_version(db):
+    db.add(new_client())
+    db.commit()
+    compute = Counter()
+    cached(db, compute)
+    before = get_versions(db, TABLES)
+    invalidations = result_cache.stats()["invalidations"]
+
+    db.add(new_movement())
+    db.query(Client).update({"notes": "x"})
+    db.flush()
+    db.rollback()
+
+    assert get_versions(db, TABLES) == before
+    assert result_cache.stats()["invalidations"] == invalidations
+    assert cached(db, compute) == 1
+
+    # Lo anotado antes del rollback no se arrastra al próximo commit
+    db.add(new_broadcast())
+    db.commit()
+    after = get_versions(db, TABLES)
+    assert after["clients"] == before["clients"]
+    assert after["movements"] == before["movements"]
+    assert after["broadcasts"] == before["broadcasts"] + 1
+
+
+def test_stats_endpoint_recomputes_after_commit(client, db):
+    first = client.get("/stats").json()
+    assert client.get("/stats").json() == first
+
+    db.add(new_movement(value=300.0))
+    db.add(new_client())
+    db.commit()
+
+    second = client.get("/stats").json()
+    assert second["clientes_totales"] == first["clientes_totales"] + 1
+    assert second["ingresos_totales"] == first["ingresos_totales"] + 300.0
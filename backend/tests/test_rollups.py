@@ -0,0 +1,107 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, select, text
+
+from database import Base, SessionLocal
+from import_movements import import_csv
+from migrations import ensure_revenue_bucket_keys
+from models import ContactRollup, RevenueBucket
+from routers.movements import _create_movement
+from schemas import MovementCreate
+
+SERIES = {"grain": "day", "desde": "2024-06-01T00:00:00", "hasta": "2024-06-02T00:00:00"}
+
+
+def post_movement(client, contact, value=100.0):
+    r = client.post("/movimientos/", json={
+        "date": "2024-06-01T12:00:00", "type": "Venta", "contact": contact, "value": value,
+    })
+    assert r.status_code == 200
+    return r.json()["id"]
+
+
+def day_point(client):
+    [point] = client.get("/movimientos/series", params=SERIES).json()
+    return point
+
+
+def test_sketch_counts_normalized_contacts(client):
+    post_movement(client, "José Pérez")
+    post_movement(client, "  jose   PEREZ ")
+    post_movement(client, "")
+    assert (day_point(client)["cantidad"], day_point(client)["contactos"]) == (3, 1)
+
+
+def test_sketch_rebuilt_after_delete_uses_contact_key(client):
+    post_movement(client, "José Pérez")
+    post_movement(client, "jose perez")
+    other = post_movement(client, "Ana")
+    assert day_point(client)["contactos"] == 2
+
+    assert client.delete(f"/movimientos/{other}").status_code == 200
+    assert (day_point(client)["cantidad"], day_point(client)["contactos"]) == (2, 1)
+
+
+def test_concurrent_writers_keep_every_increment(db):
+    def write(worker):
+        with SessionLocal() as session:
+            for i in range(50):
+                _create_movement(session, MovementCreate(
+                    date=datetime(2024, 6, 1, 12), type="Venta", contact="Ana", value=worker * 1000 + i,
+                ))
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(write, range(4)))
+
+    rollup = db.get(ContactRollup, "ana")
+    assert (rollup.order_count, rollup.total_value) == (200, sum(w * 1000 + i for w in range(4) for i in range(50)))
+    counts = db.execute(select(RevenueBucket.grain, RevenueBucket.count)).all()
+    assert sorted(counts) == [("day", 200), ("month", 200)]
+
+
+def test_concurrent_writers_merge_every_sketch(client):
+    def write(worker):
+        with SessionLocal() as session:
+            for i in range(25):
+                _create_movement(session, MovementCreate(
+                    date=datetime(2024, 6, 1, 12), type="Venta", contact=f"Cliente {worker}-{i}", value=100,
+                ))
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(write, range(4)))
+
+    merged = day_point(client)
+    assert client.post("/movimientos/series/rebuild").status_code == 200
+    assert day_point(client) == merged
+
+
+def test_import_and_rebuild_agree(client, db):
+    body = (
+        "Fecha,Tipo,Contacto,Valor\n"
+        "01/06/2024,Venta,José Pérez,100\n"
+        "01/06/2024,Venta,JOSE PEREZ,200\n"
+        "01/06/2024,Venta,Ana,300\n"
+    )
+    import_csv(io.StringIO(body), db)
+    assert day_point(client)["contactos"] == 2
+    assert client.post("/movimientos/series/rebuild").status_code == 200
+    assert day_point(client)["contactos"] == 2
+
+
+def test_migration_drops_buckets_hashed_by_raw_contact(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE revenue_buckets"))
+        conn.execute(text("CREATE TABLE revenue_buckets (id INTEGER PRIMARY KEY, contacts_hll BLOB)"))
+        conn.execute(text("INSERT INTO revenue_buckets (contacts_hll) VALUES (x'00')"))
+
+    ensure_revenue_bucket_keys(engine)
+
+    columns = {c["name"] for c in inspect(engine).get_columns(RevenueBucket.__tablename__)}
+    assert "contact_keys_hll" in columns and "contacts_hll" not in columns
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM revenue_buckets")).scalar_one() == 0
+    engine.dispose()
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import scheduler
+from database import SessionLocal
+from models import Broadcast
+from scheduler import claim_due_broadcasts, expire_overdue_broadcasts, finish_broadcast, next_pending
+
+NOW = datetime(2024, 6, 1, 15, 0, 0)
+
+
+def add_broadcast(db, minutes_ago, status="scheduled"):
+    b = Broadcast(message="Hola", status=status, scheduled_time=NOW - timedelta(minutes=minutes_ago))
+    db.add(b)
+    db.commit()
+    return b.id
+
+
+def test_overdue_beyond_grace_expire_instead_of_sending(db):
+    legacy = add_broadcast(db, minutes_ago=60 * 24 * 30)
+    late = add_broadcast(db, minutes_ago=90)
+    recent = add_broadcast(db, minutes_ago=5)
+    future = add_broadcast(db, minutes_ago=-30)
+    draft = add_broadcast(db, minutes_ago=90, status="draft")
+
+    assert sorted(expire_overdue_broadcasts(db, NOW, grace_minutes=60)) == [legacy, late]
+    assert claim_due_broadcasts(db, NOW) == [recent]
+
+    db.expire_all()
+    status = {b.id: b.status for b in db.query(Broadcast)}
+    assert status == {legacy: "expired", late: "expired", recent: "sending", future: "scheduled", draft: "draft"}
+
+
+def test_zero_grace_keeps_everything(db):
+    old = add_broadcast(db, minutes_ago=60 * 24)
+    assert expire_overdue_broadcasts(db, NOW, grace_minutes=0) == []
+    assert claim_due_broadcasts(db, NOW) == [old]
+
+
+def test_tick_claims_one_broadcast_per_dispatch(db, monkeypatch):
+    now = datetime.utcnow()
+    ids = []
+    for minutes in (10, 5):
+        b = Broadcast(message="Hola", status="scheduled", scheduled_time=now - timedelta(minutes=minutes))
+        db.add(b)
+        db.commit()
+        ids.append(b.id)
+    seen = []
+
+    async def fake_dispatch(broadcast_id, lease):
+        with SessionLocal() as session:
+            seen.append({b.id: b.status for b in session.query(Broadcast)})
+            session.get(Broadcast, broadcast_id).status = "sent"
+            session.commit()
+        return "sent"
+
+    monkeypatch.setattr(scheduler, "is_configured", lambda: True)
+    monkeypatch.setattr(scheduler, "dispatch_broadcast", fake_dispatch)
+    assert asyncio.run(scheduler.BroadcastScheduler().tick()) == ids
+    # Mientras se envía la primera, la segunda sigue sin tomar (sin lease que pueda vencer)
+    assert seen == [{ids[0]: "sending", ids[1]: "scheduled"}, {ids[0]: "sent", ids[1]: "sending"}]
+
+
+def test_sending_broadcast_cannot_be_edited(client, db):
+    created = client.post("/difusiones/", json={"message": "Hola", "recipients": ["5491100000000"]}).json()
+    b = db.get(Broadcast, created["id"])
+    b.status, b.claimed_at = "sending", NOW
+    db.commit()
+
+    assert client.post("/difusiones/programar", params={"id": b.id, "when": "2024-06-02T10:00:00"}).status_code == 409
+    assert client.put(f"/difusiones/{b.id}", json={"message": "Otro", "recipients": []}).status_code == 409
+    assert client.delete(f"/difusiones/{b.id}").status_code == 409
+
+
+def test_finish_only_with_own_lease(db):
+    b = Broadcast(message="Hola", status="scheduled", scheduled_time=NOW - timedelta(minutes=5))
+    db.add(b)
+    db.commit()
+    assert claim_due_broadcasts(db, NOW) == [b.id]
+
+    lease, batch = next_pending(db, b.id, NOW)
+    assert batch == []
+    # El lease original ya se renovó: quien lo siga usando no cierra la difusión
+    assert next_pending(db, b.id, NOW) is None
+    assert finish_broadcast(db, b.id, NOW) is None
+    db.expire_all()
+    assert db.get(Broadcast, b.id).status == "sending"
+
+    assert finish_broadcast(db, b.id, lease) == "sent"
+    db.expire_all()
+    assert db.get(Broadcast, b.id).status == "sent"
+
+
+def test_schedule_stores_utc(client):
+    created = client.post("/difusiones/", json={"message": "Hola", "recipients": ["5491100000000"]}).json()
+
+    # 10:00 en Buenos Aires (UTC-3) son las 13:00 UTC
+    r = client.post("/difusiones/programar", params={"id": created["id"], "when": "2024-06-01T10:00:00-03:00"})
+    assert r.status_code == 200
+    assert r.json()["scheduled_time"] == "2024-06-01T13:00:00"
+
+    r = client.post("/difusiones/programar", params={"id": created["id"], "when": "2024-06-01T13:30:00.000Z"})
+    assert r.json()["scheduled_time"] == "2024-06-01T13:30:00"
+
+    # Sin zona se toma como UTC
+    r = client.post("/difusiones/programar", params={"id": created["id"], "when": "2024-06-01T14:00:00"})
+    assert r.json()["scheduled_time"] == "2024-06-01T14:00:00"
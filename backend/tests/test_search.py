@@ -0,0 +1,34 @@
+from sqlalchemy import insert
+
+from models import Client
+
+
+def names(client, **params):
+    r = client.get("/clientes/filtrar", params=params)
+    assert r.status_code == 200
+    return [c["name"] for c in r.json()]
+
+
+def test_best_match_wins_over_newer_matches(client, db):
+    db.add(Client(name="José Pérez", phone="1", status="vip"))
+    db.commit()
+    # Muchos clientes más nuevos que sólo nombran a "jose" en las notas
+    db.execute(insert(Client), [
+        {"name": f"Cliente {i}", "phone": str(1000 + i), "notes": "lo recomendó jose", "status": "nuevo"}
+        for i in range(300)
+    ])
+    db.commit()
+
+    assert names(client, q="jose", limit=5)[0] == "José Pérez"
+    assert names(client, q="jose", limit=1, fast=1) == ["José Pérez"]
+    # Con otros filtros se rankean todos los matches que pasan el filtro
+    assert names(client, q="jose", estado="vip") == ["José Pérez"]
+    assert len(names(client, q="jose", estado="nuevo", limit=500)) == 300
+
+
+def test_ties_keep_newest_first(client, db):
+    db.execute(insert(Client), [{"name": "Ana", "phone": str(i), "notes": ""} for i in range(10)])
+    db.commit()
+    ids = [c["id"] for c in client.get("/clientes/filtrar", params={"q": "ana", "limit": 3}).json()]
+    newest = sorted((c["id"] for c in client.get("/clientes/").json()), reverse=True)[:3]
+    assert ids == newest
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from dashboard import period_start
+from models import Movement
+from stats import movement_kpis
+
+NOW = datetime(2024, 6, 30, 12, 0, 0)
+
+
+def baseline_kpis(db, now, days=30):
+    """Implementación anterior: todas las filas en memoria y un loop en Python
+    (sobre la misma ventana de días UTC completos)."""
+    movimientos = db.query(Movement).all()
+    ingresos_totales = float(sum(m.value or 0 for m in movimientos))
+    cutoff = period_start(now, days)
+    mov_30d = [m for m in movimientos if m.date and m.date >= cutoff]
+    pedidos_30d = len(mov_30d)
+    ingresos_30d = float(sum(m.value or 0 for m in mov_30d))
+    activos = {(m.contact or "").strip() for m in mov_30d if (m.contact or "").strip()}
+    return {
+        "ingresos_totales": ingresos_totales,
+        "ingresos_30d": ingresos_30d,
+        "pedidos_30d": pedidos_30d,
+        "ticket_promedio_30d": ingresos_30d / pedidos_30d if pedidos_30d else 0.0,
+        "clientes_activos_30d": len(activos),
+    }
+
+
+def add_movements(db, rows):
+    db.add_all(
+        Movement(contact=contact, value=value, date=date, type=kind)
+        for contact, value, date, kind in rows
+    )
+    db.commit()
+
+
+def test_empty_table(db):
+    assert movement_kpis(db, now=NOW) == baseline_kpis(db, NOW)
+
+
+def test_matches_python_loop(db):
+    add_movements(db, [
+        ("Ana", 100.0, NOW - timedelta(days=1), "Venta"),
+        ("  Ana  ", 50, NOW - timedelta(days=2), "Venta"),
+        ("Beto", 0.5, NOW - timedelta(days=29, hours=23), "Venta"),
+        ("", 10.0, NOW - timedelta(days=3), "Venta"),
+        ("   ", 20.0, NOW - timedelta(days=4), "Gasto"),
+        ("Proveedor", -30.0, NOW - timedelta(days=5), "Gasto"),
+        ("Carla", 0, NOW - timedelta(days=6), "Venta"),
+        ("Beto", 70.0, NOW - timedelta(days=31), "Venta"),
+        ("Dani", 1e6, NOW - timedelta(days=400), "Gasto"),
+        ("Ana", 5, NOW - timedelta(days=30), "Venta"),
+    ])
+
+    sql = movement_kpis(db, now=NOW)
+    assert sql == pytest.approx(baseline_kpis(db, NOW))
+    # Beto (hace 29 días y 23 horas) y la última Ana caen el 31/5: fuera de los 30 días completos
+    assert sql["pedidos_30d"] == 6
+    assert sql["clientes_activos_30d"] == 3
+
+
+def test_window_starts_at_utc_midnight(db):
+    add_movements(db, [
+        ("Ana", 1.0, datetime(2024, 5, 31, 23, 59), "Venta"),
+        ("Beto", 2.0, datetime(2024, 6, 1, 0, 0), "Venta"),
+    ])
+    # Todo el día de hoy da lo mismo: sólo cambia a la medianoche
+    for now in (datetime(2024, 6, 30, 0, 1), NOW, datetime(2024, 6, 30, 23, 59)):
+        assert movement_kpis(db, now=now)["pedidos_30d"] == 1
+    assert movement_kpis(db, now=datetime(2024, 7, 1, 0, 1))["pedidos_30d"] == 0
+
+
+def test_window_respects_days(db):
+    add_movements(db, [("Ana", 1.0, NOW - timedelta(days=d), "Venta") for d in (1, 6, 8, 20)])
+    assert movement_kpis(db, now=NOW, days=7) == pytest.approx(baseline_kpis(db, NOW, days=7))
+
+
+def test_whitespace_only_contacts_do_not_count(db):
+    # contact_key colapsa cualquier espacio (tabs y saltos de línea incluidos), como str.strip()
+    add_movements(db, [
+        ("Ana", 1.0, NOW - timedelta(days=1), "Venta"),
+        ("\t", 1.0, NOW - timedelta(days=1), "Venta"),
+        ("\n", 1.0, NOW - timedelta(days=1), "Venta"),
+        ("Ana\n", 1.0, NOW - timedelta(days=1), "Venta"),
+    ])
+
+    assert movement_kpis(db, now=NOW) == baseline_kpis(db, NOW)
+    assert movement_kpis(db, now=NOW)["clientes_activos_30d"] == 1
@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import images
+import routers.uploads
+from main import app
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" onload="alert(1)"/>'
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def upload(client, body, content_type="image/png", filename="foto.png"):
+    return client.post("/upload-image", files={"file": (filename, body, content_type)})
+
+
+def test_raster_image_is_stored_by_content(client, upload_dir):
+    r = upload(client, PNG, content_type="image/jpeg", filename="foto.jpg")
+    assert r.status_code == 200
+    assert r.json()["file_url"].endswith(".png")
+    assert len(os.listdir(upload_dir)) == 1
+
+
+@pytest.mark.parametrize("content_type", ["image/svg+xml", "image/png"])
+def test_svg_is_rejected(client, upload_dir, content_type):
+    r = upload(client, SVG, content_type=content_type, filename="logo.svg")
+    assert r.status_code == 400
+    assert os.listdir(upload_dir) == []
+
+
+def test_size_cap_applies_while_streaming(client, upload_dir, monkeypatch):
+    monkeypatch.setattr(routers.uploads, "MAX_UPLOAD_BYTES", 1024)
+    read = []
+    boundary = "limite"
+    head = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"foto.png\"\r\n"
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + PNG
+
+    async def body():
+        # Sin Content-Length (chunked): el tope se aplica a lo que se va leyendo
+        yield head
+        for _ in range(1000):
+            read.append(1)
+            yield b"\x00" * 1024
+
+    async def post():
+        # ASGITransport entrega el cuerpo de a pedazos (TestClient lo lee entero antes)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as ac:
+            return await ac.post("/upload-image", content=body(), headers={
+                "Authorization": client.headers["Authorization"],
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+            })
+
+    r = asyncio.run(post())
+    assert r.status_code == 413
+    assert len(read) < 1000
+    assert os.listdir(upload_dir) == []
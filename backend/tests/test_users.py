@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import delete, update
+
+from models import User
+
+
+@pytest.fixture
+def users(client, db):
+    yield client
+    # El token del fixture es de "pietro": vuelve a ser el único admin activo
+    db.execute(update(User).where(User.username == "pietro").values(role="admin", active=True, token_version=0))
+    db.execute(delete(User).where(User.username != "pietro"))
+    db.commit()
+
+
+def _admin_id(client) -> int:
+    return next(u["id"] for u in client.get("/usuarios").json() if u["username"] == "pietro")
+
+
+def test_last_admin_cannot_be_demoted_or_deactivated(users, db):
+    admin_id = _admin_id(users)
+    for change in ({"role": "seller"}, {"active": False}):
+        r = users.put(f"/usuarios/{admin_id}", json=change)
+        assert r.status_code == 409
+        assert "administrador" in r.json()["detail"]
+
+    db.expire_all()
+    admin = db.get(User, admin_id)
+    assert (admin.role, admin.active, admin.token_version) == ("admin", True, 0)
+    # Sigue pudiendo cambiar el resto de sus datos
+    assert users.put(f"/usuarios/{admin_id}", json={"seller": "Pietro"}).status_code == 200
+
+
+def test_admin_can_be_demoted_while_another_is_active(users, db):
+    db.add(User(username="otra", password_hash="x", role="admin"))
+    db.commit()
+    admin_id = _admin_id(users)
+
+    r = users.put(f"/usuarios/{admin_id}", json={"role": "seller"})
+    assert r.status_code == 200
+    assert r.json()["role"] == "seller"
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import whatsapp_client
+from whatsapp_client import WhatsAppSender, _retry_delay
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(whatsapp_client, "RETRY_BASE_SECONDS", 0.001)
+
+
+def make_sender(handler, **kwargs):
+    options = {"rate_per_sec": 10000, "burst": 10000, "concurrency": 20, "max_retries": 3}
+    options.update(kwargs)
+    return WhatsAppSender("token", "123", graph_base="https://graph.test", transport=httpx.MockTransport(handler), **options)
+
+
+def send_many(sender, recipients, message="Hola"):
+    async def run():
+        try:
+            return await sender.send_many(recipients, message)
+        finally:
+            await sender.aclose()
+    return asyncio.run(run())
+
+
+def recipient(request: httpx.Request) -> str:
+    return json.loads(request.content)["to"]
+
+
+def test_concurrency_cap():
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"messages": [{"id": recipient(request)}]})
+
+    results = send_many(make_sender(handler, concurrency=3), [str(i) for i in range(20)])
+
+    assert all(r["ok"] for r in results)
+    assert peak == 3
+
+
+def test_token_bucket_rate():
+    sent_at = []
+
+    def handler(request):
+        sent_at.append(time.monotonic())
+        return httpx.Response(200, json={})
+
+    start = time.monotonic()
+    send_many(make_sender(handler, rate_per_sec=50, burst=1), [str(i) for i in range(11)])
+
+    # Con burst 1 el primero sale enseguida y los otros 10 a 50/s
+    assert len(sent_at) == 11
+    assert sent_at[-1] - start >= 10 / 50 * 0.9
+
+
+def test_retries_on_429_and_5xx():
+    statuses = iter([429, 503, 200])
+    calls = 0
+
+    def handler(request):
+        nonlocal calls
+        calls += 1
+        status = next(statuses)
+        headers = {"Retry-After": "0"} if status == 429 else {}
+        return httpx.Response(status, json={"ok": status == 200}, headers=headers)
+
+    [result] = send_many(make_sender(handler), ["5491100000000"])
+
+    assert result == {"to": "5491100000000", "ok": True, "response": {"ok": True}}
+    assert calls == 3
+
+
+def test_gives_up_after_max_retries():
+    calls = 0
+
+    def handler(request):
+        nonlocal calls
+        calls += 1
+        return httpx.Response(500, json={"error": {"message": "caído"}})
+
+    [result] = send_many(make_sender(handler, max_retries=2), ["1"])
+
+    assert result == {"to": "1", "ok": False, "error": {"error": {"message": "caído"}}}
+    assert calls == 3
+
+
+def test_per_recipient_failures():
+    def handler(request):
+        to = recipient(request)
+        if to == "2":
+            return httpx.Response(400, json={"error": {"message": "número inválido"}})
+        if to == "3":
+            raise httpx.ConnectError("sin conexión", request=request)
+        return httpx.Response(200, json={"to": to})
+
+    results = send_many(make_sender(handler, max_retries=1), ["+1", " 2", "3", "", "4"])
+
+    assert [r["to"] for r in results] == ["1", "2", "3", "4"]
+    assert [r["ok"] for r in results] == [True, False, False, True]
+    assert results[1]["error"] == {"error": {"message": "número inválido"}}
+    assert results[2]["error"] == "sin conexión"
+
+
+def test_only_connection_errors_are_retried():
+    calls = {"connect": 0, "read": 0}
+
+    def handler(request):
+        to = json.loads(request.content)["to"]
+        if to == "1":
+            calls["connect"] += 1
+            if calls["connect"] == 1:
+                raise httpx.ConnectTimeout("timeout al conectar", request=request)
+            return httpx.Response(200, json={"to": to})
+        calls["read"] += 1
+        raise httpx.ReadTimeout("timeout de lectura", request=request)
+
+    results = send_many(make_sender(handler, max_retries=3), ["1", "2"])
+
+    assert [r["ok"] for r in results] == [True, False]
+    # Un timeout de lectura puede haber entregado el mensaje: no se reenvía
+    assert calls == {"connect": 2, "read": 1}
+    assert results[1]["error"] == "timeout de lectura"
+
+
+def test_non_json_success_is_a_failed_send():
+    results = send_many(make_sender(lambda request: httpx.Response(200, text="<html>ok</html>")), ["1"])
+
+    assert results[0]["ok"] is False
+    assert "no JSON" in results[0]["error"]
+
+
+def test_retry_after_is_clamped(monkeypatch):
+    monkeypatch.setattr(whatsapp_client, "RETRY_AFTER_MAX_SECONDS", 5)
+
+    def response(value):
+        return httpx.Response(429, headers={"Retry-After": value})
+
+    assert _retry_delay(0, response("2")) == 2
+    assert _retry_delay(0, response("3600")) == 5
+    # Fechas HTTP, negativos o NaN: backoff exponencial (base 0.001 s en los tests)
+    for value in ("Wed, 21 Oct 2015 07:28:00 GMT", "-1", "nan"):
+        assert 0.001 <= _retry_delay(0, response(value)) <= 0.0015
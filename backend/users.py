@@ -0,0 +1,158 @@
+"""Usuarios del panel: contraseñas con PBKDF2 y caché de tokens verificados.
+
+Las contraseñas se guardan con PBKDF2-HMAC-SHA256 (sal aleatoria por usuario y
+`PASSWORD_ITERATIONS` iteraciones). Hashear a propósito es lento (~0.2 s), así
+que `routers/auth.py` lo corre en el threadpool y el event loop sigue atendiendo
+al resto mientras alguien inicia sesión.
+
+Cada token lleva el `token_version` del usuario. `TokenCache` recuerda los
+tokens ya verificados (firma, vencimiento y usuario activo con esa versión) y
+así la dependencia de autenticación no decodifica el JWT ni va a la base en
+cada request. La entrada vence con el token o a los `AUTH_CACHE_TTL` segundos,
+lo que ocurra primero. Desactivar un usuario, cambiarle la contraseña o revocar
+sus sesiones incrementa la versión; el commit vacía la caché de este proceso en
+el momento y los demás workers dejan de aceptar el token como tarde al vencer
+el TTL.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import User
+from versions import on_tables_committed
+
+ADMIN_USER = os.getenv("ADMIN_USER", "pietro")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "pietro")
+
+PASSWORD_ITERATIONS = int(os.getenv("PASSWORD_ITERATIONS", "600000"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+
+ROLES = ("admin", "seller")
+_SCHEME = "pbkdf2_sha256"
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def hash_password(password: str, iterations: Optional[int] = None) -> str:
+    iterations = iterations or PASSWORD_ITERATIONS
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{_SCHEME}${iterations}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    try:
+        scheme, iterations, salt, digest = encoded.split("$")
+        if scheme != _SCHEME:
+            return False
+        expected = base64.b64decode(digest)
+        actual = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(encoded: str) -> bool:
+    """True si el hash se hizo con menos iteraciones que las configuradas hoy."""
+    try:
+        scheme, iterations, _, _ = encoded.split("$")
+        return scheme != _SCHEME or int(iterations) < PASSWORD_ITERATIONS
+    except ValueError:
+        return True
+
+
+@lru_cache(maxsize=1)
+def dummy_hash() -> str:
+    """Para usuarios inexistentes se verifica contra este hash: el login tarda lo
+    mismo y no delata qué nombres existen."""
+    return hash_password(secrets.token_urlsafe(16))
+
+
+def find_user(db: Session, username: str) -> Optional[User]:
+    return db.execute(select(User).where(User.username == username)).scalar_one_or_none()
+
+
+def ensure_admin_user(db: Session):
+    """Con la tabla vacía crea el administrador de ADMIN_USER / ADMIN_PASSWORD."""
+    if db.execute(select(User.id).limit(1)).first() is None:
+        db.add(User(username=ADMIN_USER, password_hash=hash_password(ADMIN_PASSWORD), role="admin"))
+        db.commit()
+
+
+class AuthUser(NamedTuple):
+    id: int
+    username: str
+    role: str
+    seller: Optional[str]
+
+
+class TokenCache:
+    """LRU acotado de token -> usuario, con vencimiento por entrada (epoch)."""
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, AuthUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Se incrementa en cada clear(): un put() que verificó contra la base antes
+        # de una revocación no vuelve a meter el token viejo
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[AuthUser]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[token]
+            self.misses += 1
+        return None
+
+    def put(self, token: str, user: AuthUser, token_expires: float, generation: int):
+        if self.maxsize <= 0:
+            return
+        expires = min(token_expires, time.time() + self.ttl)
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[token] = (expires, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
+def _invalidate_tokens(tables: Set[str]):
+    if User.__tablename__ in tables:
+        token_cache.clear()
+
+
+on_tables_committed(_invalidate_tokens)
@@ -0,0 +1,93 @@
+"""Versión de datos por tabla, incrementada en cada commit que la escribe.
+
+Los eventos de `Session` anotan qué tablas tocó la transacción: objetos ORM
+en cada flush y sentencias insert/update/delete ejecutadas con la sesión (el
+importador y los rollups usan core). Antes del commit se incrementa
+`data_versions.version` de esas tablas en la misma transacción, así que la
+versión nunca queda adelantada ni atrasada respecto de los datos, aunque haya
+varios workers. Las escrituras que no pasan por una Session (SQL crudo sobre
+el engine) no se registran.
+"""
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Set
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import Base
+from models import DataVersion
+
+_CHANGED = "changed_tables"
+_COMMITTED = "committed_tables"
+_OWN_TABLE = DataVersion.__tablename__
+
+# Se llaman con las tablas modificadas después de cada commit (p. ej. result_cache)
+_commit_listeners: List[Callable[[Set[str]], None]] = []
+
+
+def on_tables_committed(listener: Callable[[Set[str]], None]):
+    _commit_listeners.append(listener)
+
+
+def _mark(session: Session, table: str):
+    if table and table != _OWN_TABLE:
+        session.info.setdefault(_CHANGED, set()).add(table)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session: Session, flush_context):
+    # En after_flush new/dirty/deleted todavía reflejan lo que se acaba de escribir
+    for obj in chain(session.new, session.dirty, session.deleted):
+        _mark(session, getattr(obj, "__tablename__", None))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_statement(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        _mark(state.session, getattr(table, "name", None))
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_versions(session: Session):
+    # commit() hace el último flush después de este evento: se fuerza antes
+    session.flush()
+    tables = session.info.pop(_CHANGED, None)
+    if tables:
+        session.execute(
+            update(DataVersion)
+            .where(DataVersion.table_name.in_(sorted(tables)))
+            .values(version=DataVersion.version + 1)
+        )
+        session.info[_COMMITTED] = tables
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_commit(session: Session):
+    tables = session.info.pop(_COMMITTED, None)
+    if tables:
+        for listener in _commit_listeners:
+            listener(tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session: Session):
+    session.info.pop(_CHANGED, None)
+    session.info.pop(_COMMITTED, None)
+
+
+def get_versions(db: Session, tables: Iterable[str]) -> Dict[str, int]:
+    tables = list(tables)
+    found = dict(db.execute(
+        select(DataVersion.table_name, DataVersion.version).where(DataVersion.table_name.in_(tables))
+    ).all())
+    return {t: found.get(t, 0) for t in tables}
+
+
+def ensure_data_versions(db: Session):
+    """Una fila por tabla del modelo: el bump es sólo un UPDATE, sin carreras de INSERT."""
+    existing = set(db.execute(select(DataVersion.table_name)).scalars())
+    missing = [t.name for t in Base.metadata.sorted_tables if t.name not in existing and t.name != _OWN_TABLE]
+    if missing:
+        db.execute(insert(DataVersion), [{"table_name": t, "version": 0} for t in missing])
+    db.commit()
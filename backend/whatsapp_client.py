@@ -0,0 +1,179 @@
+"""Cliente de la Graph API de WhatsApp compartido por toda la aplicación.
+
+Un único `httpx.AsyncClient` con pool de conexiones (se cierra en el lifespan
+de FastAPI), envíos concurrentes acotados por un semáforo, un token bucket que
+respeta el límite de mensajes por segundo del tier de la cuenta y reintentos
+con backoff ante 429/5xx o errores de red.
+"""
+import asyncio
+import math
+import os
+import random
+import time
+from typing import List, Optional
+
+import httpx
+
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
+GRAPH_BASE = os.getenv("WHATSAPP_GRAPH_BASE", "https://graph.facebook.com/v17.0")
+# 80 msg/s es el throughput por defecto de la Cloud API
+RATE_PER_SEC = float(os.getenv("WHATSAPP_RATE_PER_SEC", "80"))
+BURST = int(os.getenv("WHATSAPP_BURST", "0")) or None
+CONCURRENCY = int(os.getenv("WHATSAPP_CONCURRENCY", "20"))
+MAX_RETRIES = int(os.getenv("WHATSAPP_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = 0.5
+# Un Retry-After más largo que esto se recorta: no se frena un envío masivo por horas
+RETRY_AFTER_MAX_SECONDS = float(os.getenv("WHATSAPP_RETRY_AFTER_MAX", "30"))
+# Sólo se reintentan errores en los que el pedido seguro no salió
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def normalize_recipient(raw: str) -> str:
+    return raw.strip().lstrip("+")
+
+
+def message_body(to: str, message: str, image_url: Optional[str]) -> dict:
+    if image_url:
+        return {
+            "messaging_product": "whatsapp",
+            "to": to,
+            "type": "image",
+            "image": {"link": image_url, "caption": message or ""}
+        }
+    return {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "text",
+        "text": {"body": message or ""}
+    }
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    # Retry-After en segundos, recortado a RETRY_AFTER_MAX_SECONDS; si falta o no
+    # es un número válido (p. ej. una fecha HTTP) se usa el backoff exponencial
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                seconds = float(retry_after)
+            except ValueError:
+                seconds = None
+            if seconds is not None and math.isfinite(seconds) and seconds >= 0:
+                return min(seconds, RETRY_AFTER_MAX_SECONDS)
+    return RETRY_BASE_SECONDS * (2 ** attempt) * (1 + random.random() / 2)
+
+
+class WhatsAppSender:
+    def __init__(
+        self,
+        token: str,
+        phone_number_id: str,
+        graph_base: str = GRAPH_BASE,
+        rate_per_sec: float = RATE_PER_SEC,
+        burst: Optional[int] = BURST,
+        concurrency: int = CONCURRENCY,
+        max_retries: int = MAX_RETRIES,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = f"{graph_base}/{phone_number_id}/messages"
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            timeout=20,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            transport=transport,
+        )
+
+    async def send_one(self, to: str, message: str, image_url: Optional[str] = None) -> dict:
+        """Envía un mensaje; devuelve {"to", "ok", "response"|"error"}."""
+        body = message_body(to, message, image_url)
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                r = await self.client.post(self.url, headers=self.headers, json=body)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    return {"to": to, "ok": False, "error": str(e) or e.__class__.__name__}
+                await asyncio.sleep(_retry_delay(attempt, None))
+                attempt += 1
+                continue
+            except httpx.TransportError as e:
+                # El pedido pudo haber llegado (timeout de lectura, conexión cortada): no se reintenta
+                return {"to": to, "ok": False, "error": str(e) or e.__class__.__name__}
+
+            if (r.status_code == 429 or r.status_code >= 500) and attempt < self.max_retries:
+                await asyncio.sleep(_retry_delay(attempt, r))
+                attempt += 1
+                continue
+            if r.status_code >= 400:
+                try:
+                    detail = r.json()
+                except ValueError:
+                    detail = r.text
+                return {"to": to, "ok": False, "error": detail}
+            try:
+                return {"to": to, "ok": True, "response": r.json()}
+            except ValueError:
+                return {"to": to, "ok": False, "error": f"Respuesta no JSON ({r.status_code}): {r.text[:200]}"}
+
+    async def send_many(self, recipients: List[str], message: str, image_url: Optional[str] = None) -> List[dict]:
+        """Envía a todos con concurrencia acotada; resultados en el orden recibido."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(to: str):
+            async with semaphore:
+                return await self.send_one(to, message, image_url)
+
+        targets = [to for to in (normalize_recipient(raw) for raw in recipients) if to]
+        return list(await asyncio.gather(*(bounded(to) for to in targets)))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_sender: Optional[WhatsAppSender] = None
+
+
+def is_configured() -> bool:
+    return bool(WHATSAPP_TOKEN and PHONE_NUMBER_ID)
+
+
+def get_sender() -> WhatsAppSender:
+    global _sender
+    if _sender is None:
+        _sender = WhatsAppSender(WHATSAPP_TOKEN, PHONE_NUMBER_ID)
+    return _sender
+
+
+async def close_sender():
+    global _sender
+    if _sender is not None:
+        await _sender.aclose()
+        _sender = None
@@ -1,9 +1,7 @@
 // State management
 let state = {
-    clients: [],
-    movements: [],
-    churn: [],
-    stats: {},
+    // Resumen de /dashboard?days=N (KPIs, series y conteos ya agregados)
+    dashboard: {},
     selectedDays: 30,
 };
 
@@ -31,40 +29,52 @@ function initApp() {
 }
 
 function bootstrapMockData() {
-    state.clients = [
-        { status: 'Activo' },
-        { status: 'Activo' },
-        { status: 'En riesgo' },
-        { status: 'Perdido' },
-        { status: 'Nuevo' },
-        { status: 'Activo' },
-        { status: 'Perdido' },
-        { status: 'En seguimiento' },
-    ];
-
     const today = new Date();
-    const daysAgo = (n) => new Date(today.getTime() - n * 24 * 60 * 60 * 1000).toISOString();
-
-    state.movements = [
-        { type: 'Venta', date: daysAgo(2), value: 15000, contact: 'Cliente A' },
-        { type: 'Venta', date: daysAgo(5), value: 22000, contact: 'Cliente B' },
-        { type: 'Venta', date: daysAgo(10), value: 18000, contact: 'Cliente C' },
-        { type: 'Venta', date: daysAgo(15), value: 35000, contact: 'Cliente A' },
-        { type: 'Venta', date: daysAgo(20), value: 9000, contact: 'Cliente D' },
-        { type: 'Venta', date: daysAgo(25), value: 12000, contact: 'Cliente E' },
-        { type: 'Venta', date: daysAgo(28), value: 8000, contact: 'Cliente F' },
-    ];
-
-    state.churn = [
-        { clasificacion: '1.1', facturacion_total: 120000 },
-        { clasificacion: '1.2', facturacion_total: 80000 },
-        { clasificacion: '2.1', facturacion_total: 60000 },
-        { clasificacion: '2.2', facturacion_total: 30000 },
-        { clasificacion: '4.1', facturacion_total: 15000 },
-    ];
-
-    state.stats = {
-        clientes_sin_contacto_30d: 5,
+    const dayKey = (n) => new Date(today.getTime() - n * 24 * 60 * 60 * 1000).toISOString().slice(0, 10);
+
+    state.dashboard = {
+        dias: 30,
+        kpis: {
+            clientes: 6,
+            ventas: 119000,
+            pedidos: 7,
+            ticket_promedio: 17000,
+            clientes_activos: 3,
+            clientes_perdidos: 2,
+        },
+        ventas_diarias: [
+            { fecha: dayKey(28), total: 8000 },
+            { fecha: dayKey(25), total: 12000 },
+            { fecha: dayKey(20), total: 9000 },
+            { fecha: dayKey(15), total: 35000 },
+            { fecha: dayKey(10), total: 18000 },
+            { fecha: dayKey(5), total: 22000 },
+            { fecha: dayKey(2), total: 15000 },
+        ],
+        top_clientes: [
+            { contacto: 'Cliente A', facturacion: 50000 },
+            { contacto: 'Cliente B', facturacion: 22000 },
+            { contacto: 'Cliente C', facturacion: 18000 },
+        ],
+        top_ventas: [
+            { contacto: 'Cliente A', facturacion: 50000 },
+            { contacto: 'Cliente B', facturacion: 22000 },
+            { contacto: 'Cliente C', facturacion: 18000 },
+        ],
+        clientes_por_estado: {
+            'Activo': 3,
+            'En riesgo': 1,
+            'Perdido': 2,
+            'Nuevo': 1,
+            'En seguimiento': 1,
+        },
+        churn_clases: [
+            { clasificacion: '1.1', clientes: 1, facturacion_total: 120000, clientes_periodo: 1 },
+            { clasificacion: '1.2', clientes: 1, facturacion_total: 80000, clientes_periodo: 1 },
+            { clasificacion: '2.1', clientes: 1, facturacion_total: 60000, clientes_periodo: 1 },
+            { clasificacion: '2.2', clientes: 1, facturacion_total: 30000, clientes_periodo: 1 },
+            { clasificacion: '4.1', clientes: 1, facturacion_total: 15000, clientes_periodo: 1 },
+        ],
     };
 }
 
@@ -137,25 +147,18 @@ async function safeFetch(path) {
     }
 }
 
-// Fetch all data
-async function fetchAllData() {
+// Fetch all data: el servidor devuelve sólo los agregados del período
+async function fetchAllData(days = state.selectedDays) {
     if (isLoading) return;
     isLoading = true;
     
     try {
-        const [stats, clients, movements, churn] = await Promise.all([
-            safeFetch('/stats'),
-            safeFetch('/clientes/'),
-            safeFetch('/movimientos/'),
-            safeFetch('/churn/')
-        ]);
-
-        state.stats = stats || {};
-        state.clients = clients || [];
-        state.movements = movements || [];
-        state.churn = churn || [];
-
-        renderDashboard();
+        const periodDays = typeof days === 'number' && days > 0 ? days : 30;
+        const dashboard = await safeFetch(`/dashboard?days=${periodDays}`);
+
+        state.dashboard = dashboard || {};
+
+        renderDashboard(periodDays);
     } catch (error) {
         console.error('Error crítico:', error);
         renderError('Error al cargar los datos. Por favor, recarga la página.');
@@ -203,79 +206,33 @@ function fmtNumber(v) {
     return n.toLocaleString('es-AR');
 }
 
-// Calculate KPIs usando churn (último pedido y facturación_total) y movements para totales
-function calculateKPIs(days) {
-    const movements = state.movements || [];
-    const churn = state.churn || [];
-    const s = state.stats || {};
-
-    const periodDays = typeof days === 'number' && days > 0 ? days : 30;
-    const now = new Date();
-    const cutoff = new Date(now.getTime() - periodDays * 24 * 60 * 60 * 1000);
-
-    // Filtrar churn por último pedido dentro del período
-    const churnPeriodo = churn.filter(c => {
-        if (!c.ultimo_pedido) return false;
-        const d = new Date(c.ultimo_pedido);
-        return d >= cutoff;
-    });
-
-    // Clientes = cantidad de contactos con churn en el período
-    const totalClientes = churnPeriodo.length;
-    const clientesActivos = churnPeriodo.filter(c => (c.clasificacion || '').startsWith('1.')).length;
-    const clientesPerdidos = churnPeriodo.filter(c => (c.clasificacion || '').startsWith('2.')).length;
-    const sinContacto30d = s.clientes_sin_contacto_30d || 0;
-
-    // Financieros
-    const ventas = movements.filter(m => m.type === 'Venta');
-    const ingresosTotales = ventas.reduce((sum, m) => sum + Number(m.value || 0), 0);
-
-    // Ventas período = suma de facturación_total de churn en ese período
-    const ingresosPeriodo = churnPeriodo.reduce((sum, c) => sum + Number(c.facturacion_total || 0), 0);
-    const pedidosPeriodo = churnPeriodo.reduce((sum, c) => sum + Number(c.cantidad_pedidos || 0), 0);
-    const ticketPromedio = pedidosPeriodo > 0 ? ingresosPeriodo / pedidosPeriodo : 0;
-
-    // Churn KPIs globales
-    const churnFacturacionTotal = churn.reduce((sum, c) => sum + Number(c.facturacion_total || 0), 0);
-    const churnClientesNuevos = churn.filter(c => (c.clasificacion || '').startsWith('4.')).length;
+// KPIs del período tal como los calcula /dashboard
+function calculateKPIs() {
+    const k = (state.dashboard || {}).kpis || {};
+    const clases = (state.dashboard || {}).churn_clases || [];
 
     return {
-        totalClientes,
-        clientesActivos,
-        clientesPerdidos,
-        sinContacto30d,
-        ingresosTotales,
-        ingresosPeriodo,
-        pedidosPeriodo,
-        ticketPromedio,
-        churnFacturacionTotal,
-        churnClientesNuevos
+        totalClientes: k.clientes || 0,
+        clientesActivos: k.clientes_activos || 0,
+        clientesPerdidos: k.clientes_perdidos || 0,
+        ingresosPeriodo: k.ventas || 0,
+        pedidosPeriodo: k.pedidos || 0,
+        ticketPromedio: k.ticket_promedio || 0,
+        churnFacturacionTotal: clases.reduce((sum, c) => sum + Number(c.facturacion_total || 0), 0),
+        churnClientesNuevos: clases.filter(c => (c.clasificacion || '').startsWith('4.')).reduce((sum, c) => sum + c.clientes, 0)
     };
 }
 
 // Render dashboard estilo Tartalo (sin productos en stock)
 function renderDashboard(days = 30) {
     state.selectedDays = typeof days === 'number' && days > 0 ? days : 30;
-    const kpis = calculateKPIs(state.selectedDays);
-    const churn = state.churn || [];
-
-    // Top clientes por facturación usando churn filtrado por período (ultimo_pedido)
-    const now = new Date();
-    const cutoff = new Date(now.getTime() - state.selectedDays * 24 * 60 * 60 * 1000);
-
-    const churnPeriodo = churn.filter(c => {
-        if (!c.ultimo_pedido) return false;
-        const d = new Date(c.ultimo_pedido);
-        return d >= cutoff;
-    });
+    const kpis = calculateKPIs();
 
-    const topClientes = churnPeriodo
-        .map(c => ({
-            nombre: c.contacto || '(sin contacto)',
-            facturacion: Number(c.facturacion_total || 0),
-        }))
-        .sort((a, b) => b.facturacion - a.facturacion)
-        .slice(0, 30);
+    // Top clientes por facturación con último pedido en el período (ya ordenado)
+    const topClientes = ((state.dashboard || {}).top_clientes || []).map(c => ({
+        nombre: c.contacto || '(sin contacto)',
+        facturacion: Number(c.facturacion || 0),
+    }));
 
     app.innerHTML = `
         <main class="flex-grow bg-gray-100 pb-8">
@@ -386,7 +343,7 @@ function renderDashboard(days = 30) {
         if (sel) {
             sel.addEventListener('change', () => {
                 const newDays = parseInt(sel.value || '30', 10) || 30;
-                renderDashboard(newDays);
+                fetchAllData(newDays);
             });
         }
 
@@ -426,9 +383,7 @@ function renderCharts(days) {
         return;
     }
 
-    const clients = state.clients || [];
-    const movements = state.movements || [];
-    const churn = state.churn || [];
+    const dashboard = state.dashboard || {};
 
     // Destruir gráficos anteriores
     Object.values(charts).forEach(chart => {
@@ -439,11 +394,7 @@ function renderCharts(days) {
     charts = {};
 
     // 1. Clientes por Estado
-    const clientesPorEstado = {};
-    clients.forEach(c => {
-        const estado = c.status || 'Sin estado';
-        clientesPorEstado[estado] = (clientesPorEstado[estado] || 0) + 1;
-    });
+    const clientesPorEstado = dashboard.clientes_por_estado || {};
 
     const ctxClientes = document.getElementById('chartClientesEstado');
     if (ctxClientes && Object.keys(clientesPorEstado).length > 0) {
@@ -507,9 +458,8 @@ function renderCharts(days) {
 
     // 2. Churn por Clasificación
     const churnPorClasificacion = {};
-    churn.forEach(c => {
-        const clasif = c.clasificacion || 'Sin clasificación';
-        churnPorClasificacion[clasif] = (churnPorClasificacion[clasif] || 0) + 1;
+    (dashboard.churn_clases || []).forEach(c => {
+        churnPorClasificacion[c.clasificacion || 'Sin clasificación'] = c.clientes;
     });
 
     const ctxChurn = document.getElementById('chartChurn');
@@ -566,30 +516,13 @@ function renderCharts(days) {
         });
     }
 
-    // 3. Ingresos últimos N días (según período)
-    const ahora = new Date();
-    const periodDays = typeof days === 'number' && days > 0 ? days : (state.selectedDays || 30);
-    const cutoff = new Date(ahora.getTime() - periodDays * 24 * 60 * 60 * 1000);
-    const ingresosPorDia = {};
-    
-    movements
-        .filter(m => {
-            if (!m.date || m.type !== 'Venta') return false;
-            const fecha = new Date(m.date);
-            return fecha >= cutoff;
-        })
-        .forEach(m => {
-            const fecha = new Date(m.date);
-            const key = fecha.toISOString().slice(0, 10);
-            ingresosPorDia[key] = (ingresosPorDia[key] || 0) + Number(m.value || 0);
-        });
-
-    const diasOrdenados = Object.keys(ingresosPorDia).sort();
-    const labelsIngresos = diasOrdenados.map(d => {
-        const fecha = new Date(d + 'T00:00:00');
+    // 3. Ingresos últimos N días (según período), agrupados por día en el servidor
+    const ventasDiarias = dashboard.ventas_diarias || [];
+    const labelsIngresos = ventasDiarias.map(d => {
+        const fecha = new Date(d.fecha + 'T00:00:00');
         return fecha.toLocaleDateString('es-AR', { day: '2-digit', month: '2-digit' });
     });
-    const valoresIngresos = diasOrdenados.map(d => ingresosPorDia[d]);
+    const valoresIngresos = ventasDiarias.map(d => Number(d.total || 0));
 
     const ctxIngresos = document.getElementById('chartIngresos');
     if (ctxIngresos && valoresIngresos.length > 0) {
@@ -675,21 +608,10 @@ function renderCharts(days) {
         });
     }
 
-    // 4. Top 10 Clientes
-    const facturacionPorCliente = {};
-    movements
-        .filter(m => m.type === 'Venta' && m.contact)
-        .forEach(m => {
-            const contacto = (m.contact || '').trim();
-            if (!facturacionPorCliente[contacto]) {
-                facturacionPorCliente[contacto] = 0;
-            }
-            facturacionPorCliente[contacto] += Number(m.value || 0);
-        });
-
-    const topClientes = Object.entries(facturacionPorCliente)
-        .sort((a, b) => b[1] - a[1])
-        .slice(0, 10);
+    // 4. Top 10 Clientes (ventas de toda la historia; top_clientes es del período e incluye gastos)
+    const topClientes = (dashboard.top_ventas || [])
+        .slice(0, 10)
+        .map(c => [c.contacto || '(sin contacto)', Number(c.facturacion || 0)]);
 
     const ctxTopClientes = document.getElementById('chartTopClientes');
     if (ctxTopClientes && topClientes.length > 0) {
@@ -751,17 +673,12 @@ function renderCharts(days) {
 
 // Render tables
 function renderTables() {
-    const clients = state.clients || [];
-    const churn = state.churn || [];
+    const dashboard = state.dashboard || {};
 
     // Tabla: Clientes por Estado
-    const clientesPorEstado = {};
-    clients.forEach(c => {
-        const estado = c.status || 'Sin estado';
-        clientesPorEstado[estado] = (clientesPorEstado[estado] || 0) + 1;
-    });
+    const clientesPorEstado = dashboard.clientes_por_estado || {};
 
-    const totalClientes = clients.length;
+    const totalClientes = Object.values(clientesPorEstado).reduce((a, b) => a + b, 0);
     const tableClientes = document.getElementById('tableClientesEstado');
     if (tableClientes) {
         const rows = Object.entries(clientesPorEstado)
@@ -788,16 +705,11 @@ function renderTables() {
 
     // Tabla: Análisis de Churn
     const churnPorClasificacion = {};
-    churn.forEach(c => {
-        const clasif = c.clasificacion || 'Sin clasificación';
-        if (!churnPorClasificacion[clasif]) {
-            churnPorClasificacion[clasif] = {
-                count: 0,
-                factTotal: 0
-            };
-        }
-        churnPorClasificacion[clasif].count++;
-        churnPorClasificacion[clasif].factTotal += Number(c.facturacion_total || 0);
+    (dashboard.churn_clases || []).forEach(c => {
+        churnPorClasificacion[c.clasificacion || 'Sin clasificación'] = {
+            count: c.clientes,
+            factTotal: Number(c.facturacion_total || 0)
+        };
     });
 
     const tableChurn = document.getElementById('tableChurn');